@@ -0,0 +1,77 @@
+import os
+import asyncio
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+from database import counters_collection
+
+load_dotenv()
+
+ACCOUNT_NUMBER_BLOCK_SIZE = int(os.getenv("ACCOUNT_NUMBER_BLOCK_SIZE", 100))
+# Multiplier/offset of the affine permutation; the multiplier must be coprime to 10
+ACCOUNT_NUMBER_MULTIPLIER = int(os.getenv("ACCOUNT_NUMBER_MULTIPLIER", 738219451))
+ACCOUNT_NUMBER_OFFSET = int(os.getenv("ACCOUNT_NUMBER_OFFSET", 104729))
+
+BODY_SPACE = 10 ** 9  # 9 digits of body plus one check digit
+
+
+def luhn_check_digit(body: str) -> str:
+    """Check digit that makes body + digit pass the Luhn test"""
+    total = 0
+    for i, ch in enumerate(reversed(body)):
+        digit = int(ch)
+        if i % 2 == 0:
+            digit *= 2
+            if digit > 9:
+                digit -= 9
+        total += digit
+    return str((10 - total % 10) % 10)
+
+
+def format_account_number(sequence: int, obfuscate: bool = True) -> str:
+    """Map a counter value to a 10-digit account number.
+
+    The affine map is a bijection on [0, 10^9), so distinct sequence
+    values always give distinct numbers while consecutive ones look random.
+    """
+    value = sequence % BODY_SPACE
+    if obfuscate:
+        value = (value * ACCOUNT_NUMBER_MULTIPLIER + ACCOUNT_NUMBER_OFFSET) % BODY_SPACE
+    body = f"{value:09d}"
+    return body + luhn_check_digit(body)
+
+
+class AccountNumberAllocator:
+    """Hands out account numbers from blocks reserved on a shared counter"""
+
+    def __init__(self, block_size: int, obfuscate: bool = True):
+        self.block_size = block_size
+        self.obfuscate = obfuscate
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    async def _reserve_block(self):
+        counter = await counters_collection.find_one_and_update(
+            {"_id": "account_number"},
+            {"$inc": {"value": self.block_size}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        self._end = counter["value"]
+        self._next = self._end - self.block_size
+
+    async def allocate(self) -> str:
+        """Next unused account number; only touches the DB once per block"""
+        async with self._lock:
+            if self._next >= self._end:
+                await self._reserve_block()
+            sequence = self._next
+            self._next += 1
+        return format_account_number(sequence, self.obfuscate)
+
+
+account_number_allocator = AccountNumberAllocator(
+    block_size=ACCOUNT_NUMBER_BLOCK_SIZE,
+    obfuscate=os.getenv("ACCOUNT_NUMBER_OBFUSCATE", "true").lower() == "true",
+)
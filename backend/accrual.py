@@ -0,0 +1,248 @@
+"""Daily interest and monthly maintenance fees, applied to every account.
+
+A run is one kind for one period: interest for a UTC day or fees for a
+month. Its accounts are split into _id ranges when the run is first
+started and the ranges are processed concurrently, at most `workers` at a
+time. Each chunk of an account range is applied in one session
+transaction: a read of the chunk's balances, one bulk_write of $inc
+updates, one insert_many of the matching transactions and an update of
+the range's progress document. Money and progress commit together, so
+rerunning a run that crashed resumes after the last committed chunk and
+never applies an account twice, and rerunning a finished run does nothing.
+
+Interest is ACCRUAL_INTEREST_RATE (annual) / 365 of a positive balance,
+rounded to cents. The fee is ACCRUAL_MONTHLY_FEE, waived for accounts
+that can't cover it. Either is off while its setting is 0. The background
+task applies both for the current period; to run one by hand, from the
+backend directory:
+
+    python -m accrual interest --period 2026-10-17 --workers 8
+    python -m accrual fee --period 2026-10
+"""
+import os
+import argparse
+import asyncio
+import math
+import time
+from datetime import datetime
+from typing import Optional
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from dotenv import load_dotenv
+
+from database import (
+    accounts_collection, transactions_collection, accrual_runs_collection, accrual_progress_collection
+)
+from models import TransactionType
+import ledger
+import rollups
+
+load_dotenv()
+
+ACCRUAL_INTEREST_RATE = float(os.getenv("ACCRUAL_INTEREST_RATE", 0))
+ACCRUAL_MONTHLY_FEE = float(os.getenv("ACCRUAL_MONTHLY_FEE", 0))
+ACCRUAL_INTERVAL_SECONDS = float(os.getenv("ACCRUAL_INTERVAL_SECONDS", 3600))
+
+INTEREST = TransactionType.INTEREST.value
+FEE = TransactionType.FEE.value
+
+
+def current_period(kind: str, now: Optional[datetime] = None) -> str:
+    return (now or datetime.utcnow()).strftime("%Y-%m-%d" if kind == INTEREST else "%Y-%m")
+
+
+def _charge(run: dict, balance: float) -> float:
+    """Signed amount for one account: positive credits, negative debits, 0 skips"""
+    if run["kind"] == INTEREST:
+        return round(balance * run["rate"] / 365, 2) if balance > 0 else 0.0
+    return -run["fee"] if balance >= run["fee"] else 0.0
+
+
+def _description(run: dict) -> str:
+    if run["kind"] == INTEREST:
+        return f"Interest {run['period']}"
+    return f"Monthly maintenance fee {run['period']}"
+
+
+async def _partition_bounds(partitions: int) -> list:
+    """_id values splitting the accounts into about equal ranges"""
+    total = await accounts_collection.count_documents({})
+    step = math.ceil(total / partitions) if total else 0
+    bounds = []
+    for k in range(1, partitions):
+        if not step or k * step >= total:
+            break
+        # A walk of the _id index, no documents fetched
+        found = await accounts_collection.find({}, {"_id": 1}).sort("_id", 1).skip(k * step).limit(1).to_list(1)
+        bounds.append(found[0]["_id"])
+    return bounds
+
+
+async def _start_run(kind: str, period: str, partitions: int) -> dict:
+    """The run's document, creating it and its ranges the first time"""
+    run_id = f"{kind}:{period}"
+    run = await accrual_runs_collection.find_one({"_id": run_id})
+    if run is not None:
+        return run
+
+    run = {
+        "_id": run_id,
+        "kind": kind,
+        "period": period,
+        # Frozen with the run so a resumed run applies the same amounts
+        "rate": ACCRUAL_INTEREST_RATE,
+        "fee": ACCRUAL_MONTHLY_FEE,
+        "started_at": datetime.utcnow(),
+    }
+    bounds = await _partition_bounds(partitions)
+    edges = [None] + bounds + [None]
+    ranges = [
+        {
+            "_id": f"{run_id}:{i}",
+            "run_id": run_id,
+            "lower": edges[i],
+            "upper": edges[i + 1],
+            "after": None,
+            "done": False,
+            "accounts": 0,
+            "applied": 0,
+            "total": 0.0,
+        }
+        for i in range(len(edges) - 1)
+    ]
+
+    # A run never exists without its ranges
+    async def callback(session):
+        await accrual_runs_collection.insert_one(run, session=session)
+        await accrual_progress_collection.insert_many(ranges, session=session)
+
+    try:
+        await ledger.run_in_transaction(callback)
+    except DuplicateKeyError:
+        # Another worker started it first
+        return await accrual_runs_collection.find_one({"_id": run_id})
+    return run
+
+
+async def _apply_chunk(run: dict, range_id: str, chunk_size: int) -> int:
+    """Apply the next chunk of a range; returns how many accounts it covered, 0 when done"""
+    async def callback(session):
+        progress = await accrual_progress_collection.find_one({"_id": range_id}, session=session)
+        if progress["done"]:
+            return 0
+
+        id_range = {}
+        if progress["after"] is not None:
+            id_range["$gt"] = progress["after"]
+        elif progress["lower"] is not None:
+            id_range["$gte"] = progress["lower"]
+        if progress["upper"] is not None:
+            id_range["$lt"] = progress["upper"]
+        accounts = await accounts_collection.find(
+            {"_id": id_range} if id_range else {}, {"balance": 1}, session=session
+        ).sort("_id", 1).limit(chunk_size).to_list(length=None)
+
+        if not accounts:
+            await accrual_progress_collection.update_one(
+                {"_id": range_id}, {"$set": {"done": True, "finished_at": datetime.utcnow()}}, session=session
+            )
+            return 0
+
+        now = datetime.utcnow()
+        transaction_type = TransactionType(run["kind"])
+        description = _description(run)
+        updates, docs = [], []
+        for account in accounts:
+            amount = _charge(run, account["balance"])
+            if not amount:
+                continue
+            # Fees keep their guard in case the balance moved since the read
+            guard = {"balance": {"$gte": -amount}} if amount < 0 else {}
+            updates.append(UpdateOne({"_id": account["_id"], **guard}, {"$inc": {"balance": amount}}))
+            docs.append(ledger.transaction_doc(
+                str(account["_id"]), abs(amount), transaction_type, description,
+                account["balance"] + amount, created_at=now
+            ))
+
+        if updates:
+            result = await accounts_collection.bulk_write(updates, ordered=False, session=session)
+            if result.matched_count != len(updates):
+                raise RuntimeError("Account balances changed during accrual")
+            await transactions_collection.insert_many(docs, session=session)
+            await rollups.record(docs, session)
+
+        await accrual_progress_collection.update_one(
+            {"_id": range_id},
+            {
+                "$set": {"after": accounts[-1]["_id"]},
+                "$inc": {"accounts": len(accounts), "applied": len(docs),
+                         "total": sum(doc["amount"] for doc in docs)},
+            },
+            session=session
+        )
+        return len(accounts)
+
+    return await ledger.run_in_transaction(callback)
+
+
+async def run_accrual(
+    kind: str,
+    period: Optional[str] = None,
+    workers: int = 4,
+    partitions: Optional[int] = None,
+    chunk_size: int = 500,
+) -> dict:
+    """Apply one kind of accrual for a period to every account, resuming if already started"""
+    period = period or current_period(kind)
+    run = await _start_run(kind, period, partitions or workers * 4)
+
+    started = time.perf_counter()
+    semaphore = asyncio.Semaphore(workers)
+
+    async def process(range_id: str) -> int:
+        async with semaphore:
+            processed = 0
+            while count := await _apply_chunk(run, range_id, chunk_size):
+                processed += count
+            return processed
+
+    pending = [p["_id"] async for p in accrual_progress_collection.find({"run_id": run["_id"], "done": False}, {"_id": 1})]
+    processed = sum(await asyncio.gather(*(process(range_id) for range_id in pending)))
+    seconds = time.perf_counter() - started
+
+    totals = {"accounts": 0, "applied": 0, "total": 0.0}
+    async for progress in accrual_progress_collection.find({"run_id": run["_id"]}):
+        for key in totals:
+            totals[key] += progress[key]
+    if pending:
+        await accrual_runs_collection.update_one(
+            {"_id": run["_id"]}, {"$set": {"finished_at": datetime.utcnow(), **totals}}
+        )
+
+    return {
+        "run": run["_id"],
+        "ranges_resumed": len(pending),
+        "accounts_processed": processed,
+        "seconds": seconds,
+        "accounts_per_second": processed / seconds if seconds else 0.0,
+        **totals,
+    }
+
+
+async def run_accruals():
+    """Background task entry point: apply whatever is configured for the current period"""
+    if ACCRUAL_INTEREST_RATE:
+        await run_accrual(INTEREST)
+    if ACCRUAL_MONTHLY_FEE:
+        await run_accrual(FEE)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply interest or maintenance fees to every account")
+    parser.add_argument("kind", choices=[INTEREST, FEE])
+    parser.add_argument("--period", default=None, help="YYYY-MM-DD for interest, YYYY-MM for fees; default current")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--partitions", type=int, default=None, help="_id ranges; default 4 per worker")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    print(asyncio.run(run_accrual(args.kind, args.period, args.workers, args.partitions, args.chunk_size)))
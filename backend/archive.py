@@ -0,0 +1,227 @@
+"""Hot/cold tiering for transaction history.
+
+Transactions older than ARCHIVE_AFTER_DAYS (rounded down to a month
+boundary) move out of the transactions collection into bucket documents in
+transaction_buckets, each holding up to ARCHIVE_BUCKET_SIZE transactions
+of one account and month, oldest first. Each bucket is inserted and its
+transactions deleted from the hot tier in one session transaction, and
+the job always takes an account's oldest hot transactions first, so:
+
+- every archived transaction of an account is older than all of its hot
+  ones, and reads in (created_at, _id) order simply continue from one
+  tier into the other;
+- the job needs no progress state: whatever is still hot and past the
+  cutoff is what's left, and an interrupted run picks up from there.
+
+Run by the background tasks, or by hand from the backend directory:
+
+    python -m archive --after-days 365
+"""
+import os
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Optional
+from bson import ObjectId
+from dotenv import load_dotenv
+
+from database import transactions_collection, transaction_buckets_collection
+from pagination import keyset_condition
+import ledger
+
+load_dotenv()
+
+ARCHIVE_AFTER_DAYS = int(os.getenv("ARCHIVE_AFTER_DAYS", 365))
+ARCHIVE_BUCKET_SIZE = int(os.getenv("ARCHIVE_BUCKET_SIZE", 500))
+ARCHIVE_INTERVAL_SECONDS = float(os.getenv("ARCHIVE_INTERVAL_SECONDS", 86400))
+# Buckets read per round trip when paging through the cold tier
+COLD_BATCH_SIZE = 4
+
+Position = tuple[datetime, ObjectId]
+
+
+def archive_cutoff(after_days: int = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None) -> datetime:
+    """Start of the month after_days ago; everything before it is archived"""
+    moment = (now or datetime.utcnow()) - timedelta(days=after_days)
+    return datetime(moment.year, moment.month, 1)
+
+
+def _month(transaction: dict) -> str:
+    return transaction["created_at"].strftime("%Y-%m")
+
+
+def bucket_doc(account_id: str, transactions: list[dict]) -> dict:
+    """A cold-tier bucket for one account's transactions, oldest first"""
+    first, last = transactions[0], transactions[-1]
+    return {
+        "account_id": account_id,
+        "month": _month(first),
+        "first_at": first["created_at"],
+        "first_id": first["_id"],
+        "last_at": last["created_at"],
+        "last_id": last["_id"],
+        "count": len(transactions),
+        "transactions": [
+            {key: value for key, value in t.items() if key != "account_id"} for t in transactions
+        ],
+    }
+
+
+async def _archive_bucket(account_id: str, cutoff: datetime) -> int:
+    """Move the account's oldest archivable transactions (one month at most) into a bucket"""
+    async def callback(session):
+        docs = await transactions_collection.find(
+            {"account_id": account_id, "created_at": {"$lt": cutoff}}, session=session
+        ).sort([("created_at", 1), ("_id", 1)]).limit(ARCHIVE_BUCKET_SIZE).to_list(length=None)
+        if not docs:
+            return 0
+
+        month = _month(docs[0])
+        docs = [doc for doc in docs if _month(doc) == month]
+        await transaction_buckets_collection.insert_one(bucket_doc(account_id, docs), session=session)
+        await transactions_collection.delete_many(
+            {"_id": {"$in": [doc["_id"] for doc in docs]}}, session=session
+        )
+        return len(docs)
+
+    return await ledger.run_in_transaction(callback)
+
+
+async def archive(after_days: int = ARCHIVE_AFTER_DAYS, max_accounts: Optional[int] = None) -> dict:
+    """Archive everything past the cutoff, one account at a time, oldest first"""
+    cutoff = archive_cutoff(after_days)
+    started = time.perf_counter()
+    accounts = moved = buckets = 0
+
+    while max_accounts is None or accounts < max_accounts:
+        # Served by the created_at index; shrinks as the job progresses
+        oldest = await transactions_collection.find_one(
+            {"created_at": {"$lt": cutoff}}, {"account_id": 1}, sort=[("created_at", 1)]
+        )
+        if not oldest:
+            break
+        accounts += 1
+        while count := await _archive_bucket(oldest["account_id"], cutoff):
+            moved += count
+            buckets += 1
+
+    return {"cutoff": cutoff.isoformat(), "accounts": accounts, "transactions": moved,
+            "buckets": buckets, "seconds": time.perf_counter() - started}
+
+
+async def run_archive():
+    """Background task entry point"""
+    await archive()
+
+
+def _naive_utc(moment: datetime) -> datetime:
+    # Stored times are naive UTC; Python won't compare them with aware ones
+    if moment.tzinfo is None:
+        return moment
+    return moment.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _in_range(created_at: datetime, bounds: Optional[dict]) -> bool:
+    if not bounds:
+        return True
+    return (
+        ("$gte" not in bounds or created_at >= bounds["$gte"])
+        and ("$gt" not in bounds or created_at > bounds["$gt"])
+        and ("$lt" not in bounds or created_at < bounds["$lt"])
+        and ("$lte" not in bounds or created_at <= bounds["$lte"])
+    )
+
+
+async def _hot(account_id: str, older: bool, position: Optional[Position], created_at: Optional[dict],
+               projection: Optional[dict], limit: Optional[int], batch_size: Optional[int]):
+    query = {"account_id": account_id}
+    if created_at:
+        query["created_at"] = created_at
+    if position:
+        query.update(keyset_condition(*position, older))
+
+    direction = -1 if older else 1
+    cursor = transactions_collection.find(query, projection).sort(
+        [("created_at", direction), ("_id", direction)]
+    )
+    if limit:
+        cursor = cursor.limit(limit)
+    if batch_size:
+        cursor = cursor.batch_size(batch_size)
+    async for transaction in cursor:
+        yield transaction
+
+
+async def _cold(account_id: str, older: bool, position: Optional[Position], created_at: Optional[dict],
+                projection: Optional[dict], limit: Optional[int], batch_size: Optional[int]):
+    # Buckets of an account never overlap in time, so ordering by first_at
+    # orders their contents too
+    conditions = [{"account_id": account_id}]
+    if position:
+        if older:
+            conditions.append({"first_at": {"$lte": position[0]}})
+        else:
+            conditions.append({"last_at": {"$gte": position[0]}})
+    if created_at:
+        # Buckets overlapping the range; items are filtered exactly below
+        lower = created_at.get("$gte", created_at.get("$gt"))
+        upper = created_at.get("$lt", created_at.get("$lte"))
+        if lower is not None:
+            conditions.append({"last_at": {"$gte": lower}})
+        if upper is not None:
+            conditions.append({"first_at": {"$lte": upper}})
+    query = conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+    direction = -1 if older else 1
+    cursor = transaction_buckets_collection.find(query).sort("first_at", direction).batch_size(COLD_BATCH_SIZE)
+    async for bucket in cursor:
+        items = bucket["transactions"] if not older else reversed(bucket["transactions"])
+        for item in items:
+            key = (item["created_at"], item["_id"])
+            if position and (key >= position if older else key <= position):
+                continue
+            if not _in_range(item["created_at"], created_at):
+                continue
+            transaction = {**item, "account_id": account_id}
+            if projection:
+                transaction = {k: v for k, v in transaction.items() if k == "_id" or k in projection}
+            yield transaction
+
+
+async def iter_history(
+    account_id: str,
+    older: bool = True,
+    position: Optional[Position] = None,
+    created_at: Optional[dict] = None,
+    projection: Optional[dict] = None,
+    limit: Optional[int] = None,
+    batch_size: Optional[int] = None,
+) -> AsyncIterator[dict]:
+    """An account's transactions across both tiers in (created_at, _id) order.
+
+    Newest first when older is true, oldest first otherwise, starting
+    strictly past position and within the created_at bounds if given.
+    """
+    if created_at:
+        created_at = {op: _naive_utc(bound) for op, bound in created_at.items()}
+    if position:
+        position = (_naive_utc(position[0]), position[1])
+
+    tiers = (_hot, _cold) if older else (_cold, _hot)
+    remaining = limit
+    for tier in tiers:
+        async for transaction in tier(account_id, older, position, created_at, projection, remaining, batch_size):
+            yield transaction
+            if remaining is not None:
+                remaining -= 1
+                if remaining == 0:
+                    return
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move old transactions into the cold tier")
+    parser.add_argument("--after-days", type=int, default=ARCHIVE_AFTER_DAYS)
+    parser.add_argument("--max-accounts", type=int, default=None)
+    args = parser.parse_args()
+    print(asyncio.run(archive(args.after_days, args.max_accounts)))
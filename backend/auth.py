@@ -1,31 +1,59 @@
 import os
+import time
 from datetime import datetime, timedelta
 from typing import Optional
 from jose import JWTError, jwt
-import bcrypt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
 from dotenv import load_dotenv
 from database import users_collection
 from models import TokenData
+from hashing import password_hasher, HasherBusy
+from cache import TTLCache
 
 load_dotenv()
 
 SECRET_KEY = os.getenv("SECRET_KEY")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", 30))
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", 60))
+USER_CACHE_MAX_SIZE = int(os.getenv("USER_CACHE_MAX_SIZE", 10000))
+TOKEN_CACHE_MAX_SIZE = int(os.getenv("TOKEN_CACHE_MAX_SIZE", 10000))
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login")
+# For endpoints that also accept the token some other way
+optional_oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/auth/login", auto_error=False)
 
+# Resolved user records keyed by user id
+user_cache = TTLCache(max_size=USER_CACHE_MAX_SIZE, ttl=USER_CACHE_TTL_SECONDS)
+# Decoded token payloads keyed by the raw token, never kept past "exp"
+token_cache = TTLCache(max_size=TOKEN_CACHE_MAX_SIZE, ttl=ACCESS_TOKEN_EXPIRE_MINUTES * 60)
+# Revoked session id -> unix time its last access token expires; kept in sync by sessions.py
+revoked_sessions: dict[str, float] = {}
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
+
+def _hasher_busy() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Server busy, please retry",
+        headers={"Retry-After": "1"},
+    )
+
+
+async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """Verify a password against its hash"""
-    return bcrypt.checkpw(plain_password.encode('utf-8'), hashed_password.encode('utf-8'))
+    try:
+        return await password_hasher.verify(plain_password, hashed_password)
+    except HasherBusy:
+        raise _hasher_busy()
 
 
-def get_password_hash(password: str) -> str:
+async def get_password_hash(password: str) -> str:
     """Generate password hash"""
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+    try:
+        return await password_hasher.hash(password)
+    except HasherBusy:
+        raise _hasher_busy()
 
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
@@ -40,6 +68,42 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     return encoded_jwt
 
 
+def invalidate_user(user_id: str):
+    """Drop a cached user record; call after any write that changes or deletes a user"""
+    user_cache.pop(user_id)
+
+
+def invalidate_token(token: str):
+    """Drop a memoized token, e.g. after it has been revoked"""
+    token_cache.pop(token)
+
+
+def is_revoked(session_id: Optional[str]) -> bool:
+    """Whether access tokens of this session must be refused"""
+    if session_id is None:
+        return False
+    expires = revoked_sessions.get(session_id)
+    return expires is not None and expires > time.time()
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for the auth caches"""
+    return {"users": user_cache.stats(), "tokens": token_cache.stats()}
+
+
+def decode_token(token: str) -> dict:
+    """Decode a JWT, memoizing the payload until it expires"""
+    payload = token_cache.get(token)
+    if payload is not None:
+        return payload
+
+    payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    exp = payload.get("exp")
+    if exp is not None:
+        token_cache.set(token, payload, ttl=exp - time.time())
+    return payload
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """Get current user from JWT token"""
     credentials_exception = HTTPException(
@@ -48,22 +112,28 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+        payload = decode_token(token)
         user_id: str = payload.get("sub")
-        if user_id is None:
+        if user_id is None or is_revoked(payload.get("sid")):
             raise credentials_exception
         token_data = TokenData(user_id=user_id)
     except JWTError:
         raise credentials_exception
-    
+
+    cached = user_cache.get(token_data.user_id)
+    if cached is not None:
+        return cached
+
     from bson import ObjectId
     user = await users_collection.find_one({"_id": ObjectId(token_data.user_id)})
     if user is None:
         raise credentials_exception
     
-    return {
+    current_user = {
         "id": str(user["_id"]),
         "email": user["email"],
         "full_name": user["full_name"],
         "created_at": user["created_at"]
     }
+    user_cache.set(current_user["id"], current_user)
+    return current_user
@@ -0,0 +1,85 @@
+"""In-memory Motor stand-in for running the API without a mongod.
+
+Backed by mongomock-motor. Mongo features mongomock lacks are bridged just
+enough for the benchmark workloads: ledger operations run without a
+session, and bulk_write replays its operations one by one. Latencies
+measured here show Python-side cost only; use a real mongod for anything
+involving database time.
+
+install(transactions=True), used by the tests, stands in for session
+transactions too: ledger operations run one at a time, and one that
+raises has every write it made undone, as an aborted transaction would.
+That snapshots the whole database per operation, so it is for small test
+data only.
+"""
+import asyncio
+import copy
+
+import mongomock.collection
+from mongomock_motor import AsyncMongoMockClient
+from pymongo import InsertOne, UpdateMany
+
+# Workload operations mongomock can't serve ($lookup with a sub-pipeline)
+UNSUPPORTED_OPERATIONS = {"dashboard"}
+
+
+class _BulkWriteResult:
+    def __init__(self):
+        self.inserted_count = 0
+        self.matched_count = 0
+        self.modified_count = 0
+        self.upserted_count = 0
+
+
+def _bulk_write(self, requests, ordered=True, session=None, **kwargs):
+    result = _BulkWriteResult()
+    for request in requests:
+        if isinstance(request, InsertOne):
+            self.insert_one(request._doc)
+            result.inserted_count += 1
+            continue
+        update = self.update_many if isinstance(request, UpdateMany) else self.update_one
+        outcome = update(request._filter, request._doc, upsert=request._upsert)
+        result.matched_count += outcome.matched_count
+        result.modified_count += outcome.modified_count
+        if outcome.upserted_id is not None:
+            result.upserted_count += 1
+    return result
+
+
+def install(database_name: str = "banking_bench", transactions: bool = False):
+    """Point the app's database module at an in-memory client.
+
+    Must run before the app's lifespan, which would otherwise connect to
+    MONGODB_URI.
+    """
+    import database
+
+    mongomock.collection.Collection.bulk_write = _bulk_write
+
+    # The lazy collections resolve against whatever client is installed
+    client = AsyncMongoMockClient()
+    database._client = client
+    database._database = client[database_name]
+
+    import ledger
+
+    async def run_without_session(callback):
+        return await ledger.transaction_body(callback, None)
+
+    # mongomock's own document store behind the async wrapper
+    store = client._AsyncMongoMockClient__client[database_name]._store
+    lock = asyncio.Lock()
+
+    async def run_with_rollback(callback):
+        async with lock:
+            snapshot = {name: copy.deepcopy(c._documents) for name, c in store._collections.items()}
+            try:
+                return await run_without_session(callback)
+            except BaseException:
+                for name, collection in store._collections.items():
+                    collection._documents = snapshot.get(name, type(collection._documents)())
+                raise
+
+    ledger.run_in_transaction = run_with_rollback if transactions else run_without_session
+    return client
@@ -0,0 +1,398 @@
+"""End-to-end load benchmark for the banking API.
+
+Seeds synthetic users, accounts, bills and transactions, then drives a
+weighted mix of requests at a fixed concurrency and prints throughput and
+p50/p95/p99 latency per endpoint as JSON. Run from the backend directory:
+
+    # In-process through httpx's ASGI transport against a local mongod
+    python -m benchmarks.load --mongo-uri mongodb://localhost:27017/banking_bench
+
+    # Over a real socket: the harness starts uvicorn in a subprocess
+    python -m benchmarks.load --mode uvicorn --mongo-uri mongodb://localhost:27017/banking_bench
+
+    # No mongod at all (Python-side cost only, see benchmarks/inmemory.py)
+    python -m benchmarks.load --in-memory
+
+    # Compare with an earlier run
+    python -m benchmarks.load --output after.json --baseline before.json
+
+Ledger endpoints need a replica set because they use session transactions;
+`mongod --replSet rs0` followed by `rs.initiate()` is enough locally.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+import httpx
+
+DEFAULT_MIX = "login=1,accounts=4,transactions=4,dashboard=2,transfer=2,pay_bill=1"
+PASSWORD = "benchmark-password"
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        weights[name.strip()] = float(weight or 1)
+    unknown = set(weights) - set(OPERATIONS)
+    if unknown:
+        raise SystemExit(f"Unknown operations in --mix: {', '.join(sorted(unknown))}")
+    return weights
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+class Fixture:
+    """Synthetic data seeded straight into the collections"""
+
+    def __init__(self):
+        self.users = []  # {"id", "email", "token", "accounts": [ids], "numbers": [...], "bills": [ids]}
+
+    @classmethod
+    async def seed(cls, users: int, accounts_per_user: int, transactions_per_account: int,
+                   bills_per_user: int, rng: random.Random) -> "Fixture":
+        from database import users_collection, accounts_collection, transactions_collection, bills_collection
+        from account_numbers import account_number_allocator
+        from auth import create_access_token, get_password_hash
+        from models import BillStatus, BillType, TransactionType
+
+        fixture = cls()
+        hashed = await get_password_hash(PASSWORD)
+        now = datetime.utcnow()
+
+        user_docs = [
+            {"email": f"bench{i}@example.com", "full_name": f"Bench User {i}",
+             "hashed_password": hashed, "created_at": now}
+            for i in range(users)
+        ]
+        user_ids = (await users_collection.insert_many(user_docs)).inserted_ids
+
+        for user_id, user_doc in zip(user_ids, user_docs):
+            user_id = str(user_id)
+            account_docs = []
+            for j in range(accounts_per_user):
+                account_docs.append({
+                    "user_id": user_id,
+                    "account_number": await account_number_allocator.allocate(),
+                    "account_name": f"Account {j}",
+                    "balance": 1_000_000.0,
+                    "created_at": now
+                })
+            account_ids = [str(a) for a in (await accounts_collection.insert_many(account_docs)).inserted_ids]
+
+            transaction_docs = []
+            for account_id in account_ids:
+                balance = 1_000_000.0 - transactions_per_account
+                for k in range(transactions_per_account):
+                    balance += 1.0
+                    transaction_docs.append({
+                        "account_id": account_id,
+                        "amount": 1.0,
+                        "transaction_type": TransactionType.DEPOSIT.value,
+                        "description": "Seed deposit",
+                        "balance_after": balance,
+                        "recipient_account": None,
+                        "created_at": now - timedelta(minutes=transactions_per_account - k)
+                    })
+            if transaction_docs:
+                await transactions_collection.insert_many(transaction_docs)
+
+            bill_ids = []
+            if bills_per_user:
+                bill_docs = [
+                    {"user_id": user_id, "bill_type": rng.choice(list(BillType)).value,
+                     "provider_name": f"Provider {b}", "amount": 1.0,
+                     "due_date": now + timedelta(days=rng.randint(-10, 30)),
+                     "account_number": "9999999999", "status": BillStatus.PENDING.value,
+                     "paid_at": None, "created_at": now}
+                    for b in range(bills_per_user)
+                ]
+                bill_ids = [str(b) for b in (await bills_collection.insert_many(bill_docs)).inserted_ids]
+
+            fixture.users.append({
+                "id": user_id,
+                "email": user_doc["email"],
+                "token": create_access_token({"sub": user_id}, timedelta(hours=12)),
+                "accounts": account_ids,
+                "numbers": [a["account_number"] for a in account_docs],
+                "bills": bill_ids,
+            })
+        return fixture
+
+
+# Each operation returns the endpoint label it hit and the response
+async def op_login(client, fixture, user, rng):
+    response = await client.post(
+        "/api/auth/login/json", json={"email": user["email"], "password": PASSWORD}
+    )
+    return "POST /api/auth/login/json", response
+
+
+async def op_accounts(client, fixture, user, rng):
+    response = await client.get("/api/accounts/", headers=_auth(user))
+    return "GET /api/accounts/", response
+
+
+async def op_transactions(client, fixture, user, rng):
+    account_id = rng.choice(user["accounts"])
+    response = await client.get(f"/api/transactions/{account_id}", headers=_auth(user))
+    return "GET /api/transactions/{account_id}", response
+
+
+async def op_dashboard(client, fixture, user, rng):
+    response = await client.get("/api/dashboard", headers=_auth(user))
+    return "GET /api/dashboard", response
+
+
+async def op_transfer(client, fixture, user, rng):
+    index = rng.randrange(len(user["accounts"]))
+    other = rng.choice(fixture.users)
+    choices = [n for n in other["numbers"] if n != user["numbers"][index]]
+    if not choices:
+        return await op_accounts(client, fixture, user, rng)
+    response = await client.post(
+        f"/api/transactions/{user['accounts'][index]}",
+        json={"amount": 1.0, "transaction_type": "transfer", "recipient_account": rng.choice(choices)},
+        headers=_auth(user)
+    )
+    return "POST /api/transactions/{account_id}", response
+
+
+async def op_pay_bill(client, fixture, user, rng):
+    if not user["bills"]:
+        created = await client.post("/api/bills/", json={
+            "bill_type": "other", "provider_name": "Bench", "amount": 1.0,
+            "due_date": (datetime.utcnow() + timedelta(days=7)).isoformat(),
+            "account_number": "9999999999"
+        }, headers=_auth(user))
+        user["bills"].append(created.json()["id"])
+    response = await client.post(
+        "/api/bills/pay",
+        json={"bill_id": user["bills"].pop(), "from_account_id": rng.choice(user["accounts"])},
+        headers=_auth(user)
+    )
+    return "POST /api/bills/pay", response
+
+
+OPERATIONS = {
+    "login": op_login,
+    "accounts": op_accounts,
+    "transactions": op_transactions,
+    "dashboard": op_dashboard,
+    "transfer": op_transfer,
+    "pay_bill": op_pay_bill,
+}
+
+
+def _auth(user: dict) -> dict:
+    return {"Authorization": f"Bearer {user['token']}"}
+
+
+async def run_workload(client: httpx.AsyncClient, fixture: Fixture, mix: dict[str, float],
+                       concurrency: int, duration: float, warmup: float, seed: int) -> dict:
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    latencies = defaultdict(list)
+    statuses = defaultdict(lambda: defaultdict(int))
+    measuring = False
+
+    async def worker(worker_id: int, deadline: float):
+        rng = random.Random(seed + worker_id)
+        while time.perf_counter() < deadline:
+            user = rng.choice(fixture.users)
+            operation = OPERATIONS[rng.choices(names, weights)[0]]
+            started = time.perf_counter()
+            try:
+                label, response = await operation(client, fixture, user, rng)
+                code = str(response.status_code)
+            except httpx.HTTPError as exc:
+                label, code = operation.__name__, type(exc).__name__
+            if measuring:
+                latencies[label].append(time.perf_counter() - started)
+                statuses[label][code] += 1
+
+    if warmup > 0:
+        await asyncio.gather(*(worker(i, time.perf_counter() + warmup) for i in range(concurrency)))
+
+    measuring = True
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i, started + duration) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    endpoints = {}
+    for label, values in sorted(latencies.items()):
+        values.sort()
+        endpoints[label] = {
+            "requests": len(values),
+            "throughput_rps": round(len(values) / elapsed, 2),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+            "status_codes": dict(statuses[label]),
+        }
+    total = sum(e["requests"] for e in endpoints.values())
+    return {
+        "elapsed_seconds": round(elapsed, 3),
+        "total_requests": total,
+        "throughput_rps": round(total / elapsed, 2),
+        "endpoints": endpoints,
+    }
+
+
+@asynccontextmanager
+async def asgi_client():
+    from main import app, lifespan
+
+    async with lifespan(app):
+        # Unhandled errors become 500s in the report instead of crashing a worker
+        transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            yield client
+
+
+@asynccontextmanager
+async def uvicorn_client(port: int, concurrency: int):
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        env=os.environ.copy()
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    try:
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            for _ in range(100):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            else:
+                raise SystemExit("uvicorn did not start")
+            yield client
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    """Percent change per endpoint for throughput and latency percentiles"""
+    deltas = {}
+    for label, now in current["endpoints"].items():
+        before = baseline.get("endpoints", {}).get(label)
+        if not before:
+            continue
+        deltas[label] = {
+            key: round((now[key] - before[key]) / before[key] * 100, 1) if before[key] else None
+            for key in ("throughput_rps", "p50_ms", "p95_ms", "p99_ms")
+        }
+    return deltas
+
+
+async def main(args):
+    mix = parse_mix(args.mix)
+    # Every simulated user logs in from the same address; set it to "true"
+    # explicitly to measure with the auth rate limits on
+    os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+    if args.in_memory:
+        if args.mode == "uvicorn":
+            raise SystemExit("--in-memory only works with --mode asgi")
+        from benchmarks import inmemory
+        inmemory.install()
+        skipped = set(mix) & inmemory.UNSUPPORTED_OPERATIONS
+        if skipped:
+            print(f"In-memory backend: skipping {', '.join(sorted(skipped))}", file=sys.stderr)
+            mix = {name: weight for name, weight in mix.items() if name not in skipped}
+    else:
+        os.environ["MONGODB_URI"] = args.mongo_uri
+
+    import database
+    import indexes
+
+    if not args.in_memory and not args.keep_data:
+        name = database.get_database().name
+        if "bench" not in name:
+            raise SystemExit(f"Refusing to drop database {name!r}; use a *bench* database or --keep-data")
+        await database.get_client().drop_database(name)
+        await indexes.ensure_indexes()
+
+    rng = random.Random(args.seed)
+    fixture = await Fixture.seed(
+        args.users, args.accounts_per_user, args.transactions_per_account, args.bills_per_user, rng
+    )
+
+    client_factory = asgi_client() if args.mode == "asgi" else uvicorn_client(args.port, args.concurrency)
+    async with client_factory as client:
+        results = await run_workload(
+            client, fixture, mix, args.concurrency, args.duration, args.warmup, args.seed
+        )
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "config": {
+            "mode": args.mode,
+            "backend": "in-memory" if args.in_memory else "mongod",
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "mix": mix,
+            "users": args.users,
+            "accounts_per_user": args.accounts_per_user,
+            "transactions_per_account": args.transactions_per_account,
+            "bills_per_user": args.bills_per_user,
+            "seed": args.seed,
+        },
+        **results,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["change_vs_baseline_pct"] = compare(report, json.load(f))
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    print(output)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load benchmark for the banking API")
+    parser.add_argument("--mode", choices=["asgi", "uvicorn"], default="asgi")
+    parser.add_argument("--mongo-uri", default="mongodb://localhost:27017/banking_bench")
+    parser.add_argument("--in-memory", action="store_true", help="use the mongomock stand-in")
+    parser.add_argument("--keep-data", action="store_true", help="don't drop the database first")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=3.0, help="unmeasured seconds first")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="weighted operations, e.g. " + DEFAULT_MIX)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--accounts-per-user", type=int, default=2)
+    parser.add_argument("--transactions-per-account", type=int, default=200)
+    parser.add_argument("--bills-per-user", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    asyncio.run(main(parser.parse_args()))
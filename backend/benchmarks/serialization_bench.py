@@ -0,0 +1,102 @@
+"""Microbenchmark: model-per-row list responses vs the fast serialization path.
+
+Run from the backend directory:
+
+    python -m benchmarks.serialization_bench --rows 500 --requests 200
+
+Both routes return the same documents through a real FastAPI app (driven
+in-process with httpx), so the numbers include response_model validation
+and JSON rendering but no database time.
+"""
+import argparse
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta
+
+import httpx
+from bson import ObjectId
+from fastapi import FastAPI
+
+from models import TransactionResponse, TransactionType
+from serializers import FastJSONResponse, transaction_to_dict
+
+
+def make_documents(rows: int) -> list[dict]:
+    start = datetime(2024, 1, 1)
+    types = list(TransactionType)
+    return [
+        {
+            "_id": ObjectId(),
+            "account_id": "65a1b2c3d4e5f60718293a4b",
+            "amount": 10.5 + i,
+            "transaction_type": types[i % len(types)].value,
+            "description": f"Transaction {i}",
+            "balance_after": 1000.25 + i,
+            "recipient_account": "1234567890" if i % 4 == 2 else None,
+            "created_at": start + timedelta(minutes=i),
+        }
+        for i in range(rows)
+    ]
+
+
+def build_app(docs: list[dict]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/models", response_model=list[TransactionResponse])
+    async def model_path():
+        return [TransactionResponse(**transaction_to_dict(doc)) for doc in docs]
+
+    @app.get("/fast", response_model=list[TransactionResponse])
+    async def fast_path():
+        return FastJSONResponse([transaction_to_dict(doc) for doc in docs])
+
+    return app
+
+
+async def measure(client: httpx.AsyncClient, path: str, requests: int) -> dict:
+    # Warm up once so first-call costs don't skew the numbers
+    await client.get(path)
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        t0 = time.perf_counter()
+        response = await client.get(path)
+        latencies.append(time.perf_counter() - t0)
+        response.raise_for_status()
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests_per_second": round(requests / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1] * 1000, 3),
+    }
+
+
+async def main(rows: int, requests: int):
+    docs = make_documents(rows)
+    app = build_app(docs)
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        # Same JSON either way, so the fast path is a drop-in replacement
+        slow_body = (await client.get("/models")).json()
+        fast_body = (await client.get("/fast")).json()
+        assert slow_body == fast_body, "fast path changed the response body"
+
+        results = {
+            "rows": rows,
+            "models": await measure(client, "/models", requests),
+            "fast": await measure(client, "/fast", requests),
+        }
+    results["speedup"] = round(
+        results["fast"]["requests_per_second"] / results["models"]["requests_per_second"], 2
+    )
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=500)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(main(args.rows, args.requests))
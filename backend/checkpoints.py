@@ -0,0 +1,274 @@
+"""Daily closing balances per account, for point-in-time balance queries.
+
+A checkpoint records an account's balance at the end of a UTC day
+(closing_at, exclusive) and is only written for days with activity, so
+the balance at any instant is the latest checkpoint before it plus the
+transactions since, which never span more than the current day and
+whatever the job hasn't reached yet.
+
+Balances are replayed from signed transaction amounts, starting from
+zero when the account was opened. The background task keeps checkpoints
+current; to backfill or cross-check them, run from the backend directory:
+
+    python -m checkpoints --workers 8 --chunk-size 500
+    python -m checkpoints --verify --workers 8
+"""
+import os
+import argparse
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import UpdateOne
+from dotenv import load_dotenv
+
+from database import (
+    accounts_collection, transactions_collection, transaction_buckets_collection,
+    balance_checkpoints_collection
+)
+from models import TransactionType
+import archive
+
+load_dotenv()
+
+CHECKPOINT_INTERVAL_SECONDS = float(os.getenv("CHECKPOINT_INTERVAL_SECONDS", 3600))
+# Transactions stamped just before midnight may commit a little after it
+CHECKPOINT_SETTLE_SECONDS = float(os.getenv("CHECKPOINT_SETTLE_SECONDS", 300))
+
+CREDIT_TYPES = [TransactionType.DEPOSIT.value, TransactionType.INTEREST.value]
+EPOCH = datetime(1970, 1, 1)
+TOLERANCE = 0.005
+
+
+def signed_amount(transaction: dict) -> float:
+    amount = transaction["amount"]
+    return amount if transaction["transaction_type"] in CREDIT_TYPES else -amount
+
+
+SIGNED_AMOUNT = {"$cond": [
+    {"$in": ["$transaction_type", CREDIT_TYPES]}, "$amount", {"$multiply": ["$amount", -1]}
+]}
+
+
+def _day_start(moment: datetime) -> datetime:
+    return datetime(moment.year, moment.month, moment.day)
+
+
+def _windows(since: dict[str, datetime], until: datetime) -> dict:
+    # One (account_id, created_at) index range per account
+    return {"$or": [
+        {"account_id": account_id, "created_at": {"$gte": start, "$lt": until}}
+        for account_id, start in since.items()
+    ]}
+
+
+DAILY_GROUP = {"$group": {
+    "_id": {
+        "account_id": "$account_id",
+        "day": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}
+    },
+    "net": {"$sum": SIGNED_AMOUNT},
+    "count": {"$sum": 1}
+}}
+
+
+def _daily_pipeline(since: dict[str, datetime], until: datetime) -> list[dict]:
+    return [{"$match": _windows(since, until)}, DAILY_GROUP]
+
+
+def _daily_bucket_pipeline(since: dict[str, datetime], until: datetime) -> list[dict]:
+    # The same over archived buckets, unwound back into transactions
+    return [
+        {"$match": {"$or": [
+            {"account_id": account_id, "last_at": {"$gte": start}, "first_at": {"$lt": until}}
+            for account_id, start in since.items()
+        ]}},
+        {"$unwind": "$transactions"},
+        {"$project": {
+            "account_id": 1,
+            "created_at": "$transactions.created_at",
+            "amount": "$transactions.amount",
+            "transaction_type": "$transactions.transaction_type",
+        }},
+        {"$match": _windows(since, until)},
+        DAILY_GROUP,
+    ]
+
+
+async def _daily_totals(since: dict[str, datetime], until: datetime) -> dict:
+    """{account_id: [(closing_at, net, count), ...]} for each account's days in [since, until)"""
+    totals = {}
+    # A day is split across tiers only while the archive job is mid-month
+    for rows in (
+        transaction_buckets_collection.aggregate(_daily_bucket_pipeline(since, until)),
+        transactions_collection.aggregate(_daily_pipeline(since, until)),
+    ):
+        async for row in rows:
+            key = (row["_id"]["account_id"], row["_id"]["day"])
+            net, count = totals.get(key, (0.0, 0))
+            totals[key] = (net + row["net"], count + row["count"])
+
+    days = {}
+    for (account_id, day), (net, count) in sorted(totals.items()):
+        closing_at = datetime.strptime(day, "%Y-%m-%d") + timedelta(days=1)
+        days.setdefault(account_id, []).append((closing_at, net, count))
+    return days
+
+
+async def _latest(account_ids: list[str]) -> dict:
+    """Newest checkpoint per account"""
+    pipeline = [
+        {"$match": {"account_id": {"$in": account_ids}}},
+        {"$sort": {"account_id": 1, "closing_at": -1}},
+        {"$group": {"_id": "$account_id", "closing_at": {"$first": "$closing_at"}, "balance": {"$first": "$balance"}}},
+    ]
+    return {row["_id"]: row async for row in balance_checkpoints_collection.aggregate(pipeline)}
+
+
+async def _checkpoint_chunk(account_ids: list[str], until: datetime) -> int:
+    latest = await _latest(account_ids)
+    since = {
+        account_id: latest[account_id]["closing_at"] if account_id in latest else EPOCH
+        for account_id in account_ids
+    }
+
+    updates = []
+    now = datetime.utcnow()
+    for account_id, days in (await _daily_totals(since, until)).items():
+        previous = latest.get(account_id)
+        balance = previous["balance"] if previous else 0.0
+        for closing_at, net, count in days:
+            balance += net
+            updates.append(UpdateOne(
+                {"account_id": account_id, "closing_at": closing_at},
+                {"$set": {"balance": balance, "transaction_count": count, "computed_at": now}},
+                upsert=True
+            ))
+
+    if updates:
+        await balance_checkpoints_collection.bulk_write(updates, ordered=False)
+    return len(updates)
+
+
+def _chunks(items: list, size: int) -> list[list]:
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+async def _run_chunks(job, account_ids: list[str], workers: int, chunk_size: int) -> list:
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(chunk):
+        async with semaphore:
+            return await job(chunk)
+
+    return await asyncio.gather(*(run(chunk) for chunk in _chunks(account_ids, chunk_size)))
+
+
+async def _all_account_ids() -> list[str]:
+    return [str(a["_id"]) async for a in accounts_collection.find({}, {"_id": 1})]
+
+
+async def write_checkpoints(workers: int = 4, chunk_size: int = 500, account_ids: Optional[list[str]] = None) -> dict:
+    """Checkpoint every closed day not yet checkpointed, chunks of accounts in parallel"""
+    if account_ids is None:
+        account_ids = await _all_account_ids()
+    until = _day_start(datetime.utcnow() - timedelta(seconds=CHECKPOINT_SETTLE_SECONDS))
+
+    started = time.perf_counter()
+    written = await _run_chunks(
+        lambda chunk: _checkpoint_chunk(chunk, until), account_ids, workers, chunk_size
+    )
+    return {"accounts": len(account_ids), "checkpoints": sum(written), "until": until.isoformat(),
+            "seconds": time.perf_counter() - started}
+
+
+async def run_checkpoints():
+    """Background task entry point"""
+    await write_checkpoints()
+
+
+async def balance_as_of(account_id: str, as_of: datetime) -> dict:
+    """Balance after every transaction at or before as_of"""
+    checkpoint = await balance_checkpoints_collection.find_one(
+        {"account_id": account_id, "closing_at": {"$lte": as_of}},
+        {"closing_at": 1, "balance": 1},
+        sort=[("closing_at", -1)]
+    )
+    since = checkpoint["closing_at"] if checkpoint else EPOCH
+    balance = checkpoint["balance"] if checkpoint else 0.0
+
+    # At most a day's transactions once the job has caught up
+    replayed = 0
+    async for transaction in archive.iter_history(
+        account_id,
+        older=False,
+        created_at={"$gte": since, "$lte": as_of},
+        projection={"amount": 1, "transaction_type": 1}
+    ):
+        balance += signed_amount(transaction)
+        replayed += 1
+
+    return {
+        "balance": balance,
+        "checkpoint_at": checkpoint["closing_at"] if checkpoint else None,
+        "transactions_replayed": replayed,
+    }
+
+
+async def _verify_chunk(account_ids: list[str]) -> list[dict]:
+    expected = {}
+    since = {account_id: EPOCH for account_id in account_ids}
+    for account_id, days in (await _daily_totals(since, datetime.max)).items():
+        balance = 0.0
+        for closing_at, net, _ in days:
+            balance += net
+            expected[(account_id, closing_at)] = balance
+
+    mismatches = []
+    seen = set()
+    newest = {}
+    async for checkpoint in balance_checkpoints_collection.find({"account_id": {"$in": account_ids}}):
+        key = (checkpoint["account_id"], checkpoint["closing_at"])
+        seen.add(key)
+        newest[key[0]] = max(newest.get(key[0], EPOCH), key[1])
+        replayed = expected.get(key)
+        if replayed is None or abs(replayed - checkpoint["balance"]) > TOLERANCE:
+            mismatches.append({
+                "account_id": key[0],
+                "closing_at": key[1].isoformat(),
+                "checkpoint": checkpoint["balance"],
+                "replayed": replayed,
+            })
+
+    # Days with activity the job already passed but has no checkpoint for
+    for (account_id, closing_at), replayed in expected.items():
+        if (account_id, closing_at) not in seen and closing_at <= newest.get(account_id, EPOCH):
+            mismatches.append({
+                "account_id": account_id,
+                "closing_at": closing_at.isoformat(),
+                "checkpoint": None,
+                "replayed": replayed,
+            })
+    return mismatches
+
+
+async def verify(workers: int = 4, chunk_size: int = 500, account_ids: Optional[list[str]] = None) -> dict:
+    """Replay every account's history and report checkpoints that disagree"""
+    if account_ids is None:
+        account_ids = await _all_account_ids()
+
+    started = time.perf_counter()
+    results = await _run_chunks(_verify_chunk, account_ids, workers, chunk_size)
+    mismatches = [mismatch for chunk in results for mismatch in chunk]
+    return {"accounts": len(account_ids), "mismatches": mismatches,
+            "seconds": time.perf_counter() - started}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write or verify daily balance checkpoints")
+    parser.add_argument("--verify", action="store_true", help="Cross-check checkpoints against history")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    job = verify if args.verify else write_checkpoints
+    print(asyncio.run(job(args.workers, args.chunk_size)))
@@ -1,26 +1,155 @@
 import os
-from motor.motor_asyncio import AsyncIOMotorClient
+import asyncio
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import ReadPreference
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
 from dotenv import load_dotenv
 
+from metrics import CommandListener, PoolListener
+
 load_dotenv()
 
 MONGODB_URI = os.getenv("MONGODB_URI")
 
-client = AsyncIOMotorClient(MONGODB_URI)
-database = client.get_database()
+# Pool and timeout tuning (all optional)
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 0))
+MONGO_MAX_IDLE_TIME_MS = int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 300000))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 5000))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 5000))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000))
+# e.g. "zstd,snappy,zlib"; zstd needs `zstandard`, snappy needs `python-snappy`
+MONGO_COMPRESSORS = os.getenv("MONGO_COMPRESSORS", "")
+# How long Idempotency-Key records (and their stored responses) are kept
+IDEMPOTENCY_TTL_SECONDS = int(os.getenv("IDEMPOTENCY_TTL_SECONDS", 86400))
+# primary, primaryPreferred, secondaryPreferred or nearest
+DASHBOARD_READ_PREFERENCE = os.getenv("DASHBOARD_READ_PREFERENCE", "primaryPreferred")
+
+# Money-moving collections only acknowledge durable, majority-committed writes
+LEDGER_OPTIONS = {
+    "write_concern": WriteConcern(w="majority", j=True),
+    "read_concern": ReadConcern("majority"),
+}
+# Summary reads tolerate slightly stale data in exchange for spreading load
+DASHBOARD_OPTIONS = {
+    "read_preference": {
+        "primary": ReadPreference.PRIMARY,
+        "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+        "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+        "nearest": ReadPreference.NEAREST,
+    }[DASHBOARD_READ_PREFERENCE],
+    "read_concern": ReadConcern("local"),
+}
+
+_client: Optional[AsyncIOMotorClient] = None
+_database: Optional[AsyncIOMotorDatabase] = None
+
+
+def client_options() -> dict:
+    """Keyword arguments for AsyncIOMotorClient built from the environment"""
+    options = {
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+        "waitQueueTimeoutMS": MONGO_WAIT_QUEUE_TIMEOUT_MS,
+        "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_TIMEOUT_MS,
+        "connectTimeoutMS": MONGO_CONNECT_TIMEOUT_MS,
+        "socketTimeoutMS": MONGO_SOCKET_TIMEOUT_MS,
+        "event_listeners": [CommandListener(), PoolListener()],
+    }
+    if MONGO_COMPRESSORS:
+        options["compressors"] = MONGO_COMPRESSORS
+    return options
+
+
+def get_client() -> AsyncIOMotorClient:
+    """The process's client, created on first use.
+
+    Creating it lazily (normally from the app lifespan) means each gunicorn
+    worker builds its own client after the fork instead of inheriting one.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(MONGODB_URI, **client_options())
+    return _client
+
+
+def get_database() -> AsyncIOMotorDatabase:
+    """The database named in MONGODB_URI"""
+    global _database
+    if _database is None:
+        _database = get_client().get_database()
+    return _database
+
+
+async def connect():
+    """Create the client and open minPoolSize connections up front"""
+    client = get_client()
+    # Concurrent pings each need their own connection, filling the pool
+    await asyncio.gather(*(
+        client.admin.command("ping") for _ in range(max(1, MONGO_MIN_POOL_SIZE))
+    ))
+
+
+def close():
+    """Close the client; the next get_client() call starts a fresh one"""
+    global _client, _database
+    if _client is not None:
+        _client.close()
+    _client = None
+    _database = None
+
+
+class LazyCollection:
+    """Stands in for a collection until the client exists.
+
+    Modules bind these at import time; the Motor collection behind one is
+    resolved on first use and again if the client is replaced.
+    """
+
+    def __init__(self, name: str, **options):
+        self.name = name
+        self._options = options
+        self._database = None
+        self._collection = None
+
+    def resolve(self):
+        database = get_database()
+        if self._database is not database:
+            self._collection = database.get_collection(self.name, **self._options)
+            self._database = database
+        return self._collection
+
+    def __getattr__(self, attr):
+        return getattr(self.resolve(), attr)
+
 
 # Collections
-users_collection = database.get_collection("users")
-accounts_collection = database.get_collection("accounts")
-transactions_collection = database.get_collection("transactions")
-bills_collection = database.get_collection("bills")
-
-
-async def init_db():
-    """Initialize database indexes"""
-    await users_collection.create_index("email", unique=True)
-    await accounts_collection.create_index("account_number", unique=True)
-    await accounts_collection.create_index("user_id")
-    await transactions_collection.create_index("account_id")
-    await transactions_collection.create_index("created_at")
-    await bills_collection.create_index("user_id")
+users_collection = LazyCollection("users")
+accounts_collection = LazyCollection("accounts", **LEDGER_OPTIONS)
+transactions_collection = LazyCollection("transactions", **LEDGER_OPTIONS)
+bills_collection = LazyCollection("bills", **LEDGER_OPTIONS)
+counters_collection = LazyCollection("counters", **LEDGER_OPTIONS)
+spending_rollups_collection = LazyCollection("spending_rollups", **LEDGER_OPTIONS)
+idempotency_keys_collection = LazyCollection("idempotency_keys", **LEDGER_OPTIONS)
+balance_checkpoints_collection = LazyCollection("balance_checkpoints", **LEDGER_OPTIONS)
+# Cold tier: archived transactions bucketed per account and month
+transaction_buckets_collection = LazyCollection("transaction_buckets", **LEDGER_OPTIONS)
+recurring_bills_collection = LazyCollection("recurring_bills", **LEDGER_OPTIONS)
+schedule_leases_collection = LazyCollection("schedule_leases")
+# Interest/fee accrual runs and the progress of each of their _id ranges
+accrual_runs_collection = LazyCollection("accrual_runs", **LEDGER_OPTIONS)
+accrual_progress_collection = LazyCollection("accrual_progress", **LEDGER_OPTIONS)
+# Refresh-token sessions, and revoked session ids until their access tokens expire
+sessions_collection = LazyCollection("sessions")
+revoked_sessions_collection = LazyCollection("revoked_sessions")
+# Single-use tickets that open /api/stream, stored as SHA-256 hashes
+stream_tickets_collection = LazyCollection("stream_tickets")
+
+# Read-side views for the dashboard
+dashboard_users_collection = LazyCollection("users", **DASHBOARD_OPTIONS)
+dashboard_transactions_collection = LazyCollection("transactions", **DASHBOARD_OPTIONS)
+
@@ -0,0 +1,199 @@
+"""Idempotency-Key support for money-moving endpoints.
+
+A key is claimed by inserting a record keyed on (user, endpoint, key). The
+ledger marks that record "committed" inside the same session transaction
+as the balance change, so a request either moved money and says so, or
+didn't and can safely be run again. Once the response is built it is
+stored on the record and replayed for retries until the TTL index expires
+it. Retries handled by this worker usually hit a small LRU first, and
+concurrent duplicates in this worker wait on the first execution instead
+of racing it.
+"""
+import os
+import json
+import uuid
+import asyncio
+import hashlib
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Optional
+from fastapi import HTTPException, status
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from dotenv import load_dotenv
+
+from cache import TTLCache
+from database import idempotency_keys_collection, IDEMPOTENCY_TTL_SECONDS
+
+load_dotenv()
+
+IDEMPOTENCY_LEASE_SECONDS = int(os.getenv("IDEMPOTENCY_LEASE_SECONDS", 30))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", 10000))
+
+IN_PROGRESS = "in_progress"
+COMMITTED = "committed"
+COMPLETED = "completed"
+
+_recent = TTLCache(max_size=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_TTL_SECONDS)
+_inflight: dict[str, asyncio.Future] = {}
+# (record id, owner token) of the key the current request holds
+_active: ContextVar[Optional[tuple[str, str]]] = ContextVar("idempotency_active", default=None)
+
+
+def request_hash(payload: dict) -> str:
+    raw = json.dumps(jsonable_encoder(payload), sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def _key_reused() -> HTTPException:
+    return HTTPException(
+        status_code=422,
+        detail="Idempotency-Key was already used for a different request"
+    )
+
+
+def _replay(record: dict, digest: str) -> JSONResponse:
+    if record["request_hash"] != digest:
+        raise _key_reused()
+    return JSONResponse(
+        content=record["response"],
+        status_code=record["status_code"],
+        headers={"Idempotent-Replayed": "true"}
+    )
+
+
+def _in_progress() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_409_CONFLICT,
+        detail="A request with this Idempotency-Key is still being processed",
+        headers={"Retry-After": "1"}
+    )
+
+
+async def mark_committed(session):
+    """Called by the ledger inside its transaction; aborts it if the key was lost"""
+    active = _active.get()
+    if active is None:
+        return
+    record_id, owner = active
+    result = await idempotency_keys_collection.update_one(
+        {"_id": record_id, "owner": owner, "status": IN_PROGRESS},
+        {"$set": {"status": COMMITTED}},
+        session=session
+    )
+    if result.matched_count == 0:
+        raise _in_progress()
+
+
+async def _claim(record_id: str, digest: str, owner: str):
+    """Take the key, or return the stored record if another request owns it"""
+    now = datetime.utcnow()
+    try:
+        await idempotency_keys_collection.insert_one({
+            "_id": record_id,
+            "request_hash": digest,
+            "status": IN_PROGRESS,
+            "owner": owner,
+            "locked_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS),
+            "created_at": now
+        })
+        return None
+    except DuplicateKeyError:
+        pass
+
+    # A stale in-progress claim never committed anything, so it can be taken over
+    record = await idempotency_keys_collection.find_one_and_update(
+        {"_id": record_id, "request_hash": digest, "status": IN_PROGRESS, "locked_until": {"$lt": now}},
+        {"$set": {"owner": owner, "locked_until": now + timedelta(seconds=IDEMPOTENCY_LEASE_SECONDS)}},
+        return_document=ReturnDocument.AFTER
+    )
+    if record:
+        return None
+    return await idempotency_keys_collection.find_one({"_id": record_id}) or {}
+
+
+async def _execute(record_id: str, digest: str, execute: Callable[[], Awaitable], status_code: int):
+    owner = uuid.uuid4().hex
+    existing = await _claim(record_id, digest, owner)
+    if existing is not None:
+        if existing.get("request_hash", digest) != digest:
+            raise _key_reused()
+        if existing.get("status") == COMPLETED:
+            _recent.set(record_id, existing)
+            return _replay(existing, digest)
+        # Still running elsewhere, or committed by a worker that died before
+        # storing the response; either way it must not run again
+        raise _in_progress()
+
+    token = _active.set((record_id, owner))
+    try:
+        result = await execute()
+    except Exception:
+        # The ledger rolled back, so nothing happened; free the key for a retry
+        await idempotency_keys_collection.delete_one(
+            {"_id": record_id, "owner": owner, "status": IN_PROGRESS}
+        )
+        raise
+    finally:
+        _active.reset(token)
+
+    record = {
+        "request_hash": digest,
+        "status": COMPLETED,
+        "status_code": status_code,
+        "response": jsonable_encoder(result)
+    }
+    await idempotency_keys_collection.update_one(
+        {"_id": record_id, "owner": owner}, {"$set": record}
+    )
+    _recent.set(record_id, record)
+    return result
+
+
+async def run_idempotent(
+    key: Optional[str],
+    user_id: str,
+    endpoint: str,
+    payload: dict,
+    execute: Callable[[], Awaitable],
+    status_code: int = status.HTTP_200_OK
+):
+    """Run execute() at most once per Idempotency-Key.
+
+    Returns execute()'s result the first time, and a JSONResponse replaying
+    the stored body (with an Idempotent-Replayed header) on retries.
+    """
+    if not key:
+        return await execute()
+
+    record_id = f"{user_id}:{endpoint}:{key}"
+    digest = request_hash(payload)
+
+    cached = _recent.get(record_id)
+    if cached is not None:
+        return _replay(cached, digest)
+
+    # Collapse concurrent duplicates in this worker onto one execution
+    pending = _inflight.get(record_id)
+    if pending is not None:
+        result = await asyncio.shield(pending)
+        cached = _recent.get(record_id)
+        return _replay(cached, digest) if cached is not None else result
+
+    future = asyncio.get_running_loop().create_future()
+    _inflight[record_id] = future
+    try:
+        result = await _execute(record_id, digest, execute, status_code)
+        future.set_result(result)
+        return result
+    except asyncio.CancelledError:
+        future.cancel()
+        raise
+    except Exception as exc:
+        future.set_exception(exc)
+        future.exception()  # Nobody may be waiting; don't log it as unretrieved
+        raise
+    finally:
+        del _inflight[record_id]
@@ -0,0 +1,202 @@
+"""Declared indexes and the code that brings a database in line with them.
+
+Each collection's indexes are read with one list_indexes call and compared
+by name with the specs below; only missing ones are created, every
+collection concurrently. Workers do this in the background after startup
+(INDEX_SYNC_ON_STARTUP=background), block on it (wait) or skip it (off),
+in which case apply them ahead of a deploy from the backend directory:
+
+    python -m indexes            # create missing indexes
+    python -m indexes --check    # report only; exits 1 if anything is missing
+    python -m indexes --drop-extra
+
+Indexes whose options differ from their spec are reported, not rebuilt;
+drop them by hand and rerun to apply the new definition.
+"""
+import os
+import sys
+import argparse
+import asyncio
+import logging
+import time
+from pymongo import IndexModel, ASCENDING, DESCENDING, TEXT
+from dotenv import load_dotenv
+
+from database import (
+    LazyCollection,
+    users_collection, accounts_collection, transactions_collection, bills_collection,
+    spending_rollups_collection, idempotency_keys_collection, balance_checkpoints_collection,
+    transaction_buckets_collection, sessions_collection, revoked_sessions_collection,
+    recurring_bills_collection, schedule_leases_collection, accrual_progress_collection,
+    stream_tickets_collection, IDEMPOTENCY_TTL_SECONDS
+)
+
+load_dotenv()
+
+# background, wait or off
+INDEX_SYNC_ON_STARTUP = os.getenv("INDEX_SYNC_ON_STARTUP", "background")
+
+logger = logging.getLogger(__name__)
+
+INDEXES: list[tuple[LazyCollection, list[IndexModel]]] = [
+    (users_collection, [
+        IndexModel("email", unique=True),
+    ]),
+    (accounts_collection, [
+        IndexModel("account_number", unique=True),
+        # Covers the dashboard's accounts lookup; balance is in it, so each
+        # balance change also updates this index entry
+        IndexModel([
+            ("user_id", ASCENDING), ("_id", ASCENDING), ("account_number", ASCENDING),
+            ("account_name", ASCENDING), ("balance", ASCENDING)
+        ]),
+    ]),
+    (transactions_collection, [
+        # Also serves account_id-only queries
+        IndexModel([("account_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)]),
+        # Finds the oldest transactions for the archive job
+        IndexModel("created_at"),
+        # Transaction search: type filters, and word search on descriptions
+        IndexModel([
+            ("account_id", ASCENDING), ("transaction_type", ASCENDING),
+            ("created_at", DESCENDING), ("_id", DESCENDING)
+        ]),
+        IndexModel([("account_id", ASCENDING), ("description", TEXT)]),
+    ]),
+    (bills_collection, [
+        # Covers the dashboard's bill stats; also finds a user's upcoming bills
+        IndexModel([
+            ("user_id", ASCENDING), ("status", ASCENDING), ("due_date", ASCENDING), ("amount", ASCENDING)
+        ]),
+        IndexModel([("status", ASCENDING), ("due_date", ASCENDING)]),
+        # One bill per recurring bill occurrence, however often the scheduler retries
+        IndexModel(
+            [("recurring_bill_id", ASCENDING), ("due_date", ASCENDING)],
+            unique=True, partialFilterExpression={"recurring_bill_id": {"$exists": True}}
+        ),
+    ]),
+    (recurring_bills_collection, [
+        IndexModel("user_id"),
+        IndexModel("next_run_at"),
+    ]),
+    (schedule_leases_collection, [
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ]),
+    (accrual_progress_collection, [
+        IndexModel([("run_id", ASCENDING), ("done", ASCENDING)]),
+    ]),
+    (spending_rollups_collection, [
+        IndexModel(
+            [("account_id", ASCENDING), ("month", ASCENDING),
+             ("transaction_type", ASCENDING), ("category", ASCENDING)],
+            unique=True
+        ),
+    ]),
+    (idempotency_keys_collection, [
+        IndexModel("created_at", expireAfterSeconds=IDEMPOTENCY_TTL_SECONDS),
+    ]),
+    (balance_checkpoints_collection, [
+        IndexModel([("account_id", ASCENDING), ("closing_at", DESCENDING)], unique=True),
+    ]),
+    (transaction_buckets_collection, [
+        IndexModel([("account_id", ASCENDING), ("first_at", ASCENDING)]),
+        IndexModel([("account_id", ASCENDING), ("last_at", ASCENDING)]),
+    ]),
+    (sessions_collection, [
+        IndexModel("token_hash", unique=True),
+        # Detects a rotated-away refresh token being replayed
+        IndexModel("previous_hash", sparse=True),
+        IndexModel([("user_id", ASCENDING), ("last_used_at", DESCENDING)]),
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ]),
+    (revoked_sessions_collection, [
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ]),
+    (stream_tickets_collection, [
+        IndexModel("expires_at", expireAfterSeconds=0),
+    ]),
+]
+
+# Options that change an index's behaviour; anything else is cosmetic
+COMPARED_OPTIONS = ("unique", "sparse", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _options(spec: dict) -> dict:
+    options = {key: spec[key] for key in COMPARED_OPTIONS if key in spec}
+    if not options.get("unique"):
+        options.pop("unique", None)
+    return options
+
+
+async def plan(collection: LazyCollection, models: list[IndexModel]) -> dict:
+    """Compare a collection's indexes with its declared specs"""
+    existing = {index["name"]: index async for index in collection.list_indexes()}
+    declared = {model.document["name"]: model for model in models}
+    return {
+        "collection": collection.name,
+        "missing": [model for name, model in declared.items() if name not in existing],
+        "changed": [
+            name for name, model in declared.items()
+            if name in existing and _options(existing[name]) != _options(model.document)
+        ],
+        "extra": [name for name in existing if name != "_id_" and name not in declared],
+    }
+
+
+async def _apply(collection: LazyCollection, collection_plan: dict, drop_extra: bool):
+    if collection_plan["missing"]:
+        await collection.create_indexes(collection_plan["missing"])
+    if drop_extra:
+        for name in collection_plan["extra"]:
+            await collection.drop_index(name)
+
+
+async def ensure_indexes(drop_extra: bool = False, dry_run: bool = False) -> dict:
+    """Create every missing index (and optionally drop undeclared ones)"""
+    started = time.perf_counter()
+    plans = await asyncio.gather(*(plan(collection, models) for collection, models in INDEXES))
+    if not dry_run:
+        await asyncio.gather(*(
+            _apply(collection, collection_plan, drop_extra)
+            for (collection, _), collection_plan in zip(INDEXES, plans)
+        ))
+
+    # With dry_run nothing was created, so report the same list as missing
+    done = "missing" if dry_run else "created"
+    summary = {done: {}, "changed": {}, "extra": {}}
+    for collection_plan in plans:
+        name = collection_plan["collection"]
+        if collection_plan["missing"]:
+            summary[done][name] = [m.document["name"] for m in collection_plan["missing"]]
+        if collection_plan["changed"]:
+            summary["changed"][name] = collection_plan["changed"]
+        if collection_plan["extra"]:
+            summary["extra"][name] = collection_plan["extra"]
+    summary["seconds"] = time.perf_counter() - started
+    return summary
+
+
+async def sync_in_background():
+    """Startup task: ensure indexes, logging instead of failing the worker"""
+    try:
+        summary = await ensure_indexes()
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.exception("Index sync failed")
+        return
+    if summary["created"]:
+        logger.info("Created indexes %s", summary["created"])
+    if summary["changed"]:
+        logger.warning("Indexes differ from their specs: %s", summary["changed"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the declared MongoDB indexes")
+    parser.add_argument("--check", action="store_true", help="Report differences without changing anything")
+    parser.add_argument("--drop-extra", action="store_true", help="Drop indexes that aren't declared")
+    args = parser.parse_args()
+    result = asyncio.run(ensure_indexes(drop_extra=args.drop_extra, dry_run=args.check))
+    print(result)
+    if args.check and (result["missing"] or result["changed"]):
+        sys.exit(1)
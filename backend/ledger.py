@@ -0,0 +1,485 @@
+from datetime import datetime
+from typing import Optional
+from bson import ObjectId
+from fastapi import HTTPException, status
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.read_concern import ReadConcern
+from pymongo.write_concern import WriteConcern
+
+from database import get_client, accounts_collection, transactions_collection, bills_collection
+from models import BillStatus, TransactionType, TransactionBatchItem
+import rollups
+import idempotency
+
+
+async def transaction_body(callback, session):
+    """Everything a ledger transaction writes: callback's changes and the key's commit mark"""
+    result = await callback(session)
+    # Commits atomically with the ledger writes when an Idempotency-Key is held
+    await idempotency.mark_committed(session)
+    return result
+
+
+async def run_in_transaction(callback):
+    """Run callback(session) inside a Mongo transaction, retrying transient errors"""
+    async def run(session):
+        return await transaction_body(callback, session)
+
+    async with await get_client().start_session() as session:
+        return await session.with_transaction(
+            run,
+            read_concern=ReadConcern("snapshot"),
+            write_concern=WriteConcern(w="majority", j=True)
+        )
+
+
+def transaction_doc(
+    account_id: str,
+    amount: float,
+    transaction_type: TransactionType,
+    description: str,
+    balance_after: float,
+    recipient_account: Optional[str] = None,
+    created_at: Optional[datetime] = None,
+    bill_type: Optional[str] = None,
+) -> dict:
+    """Build a transactions collection document"""
+    doc = {
+        "account_id": account_id,
+        "amount": amount,
+        "transaction_type": transaction_type.value,
+        "description": description,
+        "balance_after": balance_after,
+        "recipient_account": recipient_account,
+        "created_at": created_at or datetime.utcnow()
+    }
+    if bill_type:
+        # Lets spending rollups break bill payments down by category
+        doc["bill_type"] = bill_type
+    return doc
+
+
+async def _credit(query: dict, amount: float, session) -> Optional[dict]:
+    return await accounts_collection.find_one_and_update(
+        query,
+        {"$inc": {"balance": amount}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+
+
+async def _debit(account_id: str, user_id: str, amount: float, session) -> dict:
+    """Guarded debit: only applies when the balance covers the amount"""
+    query = {"_id": ObjectId(account_id), "user_id": user_id}
+    account = await accounts_collection.find_one_and_update(
+        {**query, "balance": {"$gte": amount}},
+        {"$inc": {"balance": -amount}},
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    if account:
+        return account
+
+    # Only the failure path pays for telling the two cases apart
+    if not await accounts_collection.find_one(query, {"_id": 1}, session=session):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found"
+        )
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Insufficient funds"
+    )
+
+
+async def deposit(account_id: str, user_id: str, amount: float, description: str) -> dict:
+    """Credit an account and record the deposit"""
+    async def callback(session):
+        account = await _credit(
+            {"_id": ObjectId(account_id), "user_id": user_id}, amount, session
+        )
+        if not account:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Account not found"
+            )
+        doc = transaction_doc(
+            account_id, amount, TransactionType.DEPOSIT, description, account["balance"]
+        )
+        await transactions_collection.insert_one(doc, session=session)
+        await rollups.record([doc], session)
+        return doc
+
+    return await run_in_transaction(callback)
+
+
+async def withdraw(account_id: str, user_id: str, amount: float, description: str) -> dict:
+    """Debit an account if funds allow and record the withdrawal"""
+    async def callback(session):
+        account = await _debit(account_id, user_id, amount, session)
+        doc = transaction_doc(
+            account_id, amount, TransactionType.WITHDRAWAL, description, account["balance"]
+        )
+        await transactions_collection.insert_one(doc, session=session)
+        await rollups.record([doc], session)
+        return doc
+
+    return await run_in_transaction(callback)
+
+
+async def transfer(
+    account_id: str,
+    user_id: str,
+    amount: float,
+    recipient_account: str,
+    description: str
+) -> dict:
+    """Move money to another account; both legs commit or neither does"""
+    async def callback(session):
+        account = await _debit(account_id, user_id, amount, session)
+
+        if account["account_number"] == recipient_account:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Cannot transfer to the same account"
+            )
+
+        recipient = await _credit({"account_number": recipient_account}, amount, session)
+        if not recipient:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Recipient account not found"
+            )
+
+        now = datetime.utcnow()
+        recipient_doc = transaction_doc(
+            str(recipient["_id"]),
+            amount,
+            TransactionType.DEPOSIT,
+            f"Transfer from {account['account_number']}",
+            recipient["balance"],
+            created_at=now
+        )
+        doc = transaction_doc(
+            account_id,
+            amount,
+            TransactionType.TRANSFER,
+            description,
+            account["balance"],
+            recipient_account=recipient_account,
+            created_at=now
+        )
+        await transactions_collection.insert_many([recipient_doc, doc], session=session)
+        await rollups.record([recipient_doc, doc], session)
+        return doc
+
+    return await run_in_transaction(callback)
+
+
+def _bill_payment_doc(account_id: str, bill: dict, balance_after: float, paid_at: datetime) -> dict:
+    return transaction_doc(
+        account_id,
+        bill["amount"],
+        TransactionType.BILL_PAYMENT,
+        f"Bill payment - {bill['provider_name']} ({bill['bill_type']})",
+        balance_after,
+        recipient_account=bill["account_number"],
+        created_at=paid_at,
+        bill_type=bill["bill_type"]
+    )
+
+
+async def pay_bill(bill_id: str, account_id: str, user_id: str) -> dict:
+    """Mark a bill paid and debit the account for it; returns the updated bill"""
+    async def callback(session):
+        paid_at = datetime.utcnow()
+        bill = await bills_collection.find_one_and_update(
+            {
+                "_id": ObjectId(bill_id),
+                "user_id": user_id,
+                "status": {"$ne": BillStatus.PAID.value}
+            },
+            {"$set": {"status": BillStatus.PAID.value, "paid_at": paid_at}},
+            return_document=ReturnDocument.AFTER,
+            session=session
+        )
+        if not bill:
+            existing = await bills_collection.find_one(
+                {"_id": ObjectId(bill_id), "user_id": user_id}, {"_id": 1}, session=session
+            )
+            if not existing:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Bill not found"
+                )
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Bill already paid"
+            )
+
+        account = await _debit(account_id, user_id, bill["amount"], session)
+
+        doc = _bill_payment_doc(account_id, bill, account["balance"], paid_at)
+        await transactions_collection.insert_one(doc, session=session)
+        await rollups.record([doc], session)
+        return bill
+
+    return await run_in_transaction(callback)
+
+
+async def pay_bills(bill_ids: list[str], account_id: str, user_id: str) -> tuple[list[dict], dict]:
+    """Pay several bills from one account with a single debit; all or nothing.
+
+    Returns the paid bills (in due date order) and the debited account.
+    """
+    ids = [ObjectId(b) for b in dict.fromkeys(bill_ids) if ObjectId.is_valid(b)]
+    if len(ids) != len(set(bill_ids)):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Bill not found"
+        )
+
+    async def callback(session):
+        query = {"_id": {"$in": ids}, "user_id": user_id}
+        bills = await bills_collection.find(query, session=session).sort("due_date", 1).to_list(length=None)
+        if len(bills) != len(ids):
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Bill not found"
+            )
+        if any(bill["status"] == BillStatus.PAID.value for bill in bills):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Bill already paid"
+            )
+
+        # One guarded debit covers the combined total
+        total = sum(bill["amount"] for bill in bills)
+        account = await _debit(account_id, user_id, total, session)
+
+        paid_at = datetime.utcnow()
+        balance = account["balance"] + total
+        docs = []
+        for bill in bills:
+            balance -= bill["amount"]
+            docs.append(_bill_payment_doc(account_id, bill, balance, paid_at))
+            bill["status"] = BillStatus.PAID.value
+            bill["paid_at"] = paid_at
+
+        result = await bills_collection.update_many(
+            {**query, "status": {"$ne": BillStatus.PAID.value}},
+            {"$set": {"status": BillStatus.PAID.value, "paid_at": paid_at}},
+            session=session
+        )
+        if result.modified_count != len(ids):
+            # Another payment claimed one of the bills after it was read
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Bills changed during payment, please retry"
+            )
+        await transactions_collection.insert_many(docs, session=session)
+        await rollups.record(docs, session)
+        return bills, account
+
+    return await run_in_transaction(callback)
+
+
+async def autopay(bills: list[dict]) -> tuple[list[ObjectId], dict[ObjectId, str]]:
+    """Pay pending bills from their autopay accounts, across many accounts at once.
+
+    One transaction: a read of every account, one bulk_write of guarded
+    debits, one bills update and one transactions insert. Bills an account
+    can't cover are skipped, paying the oldest due first. Returns the paid
+    bill ids and {bill id: reason} for the rest.
+    """
+    async def callback(session):
+        by_account = {}
+        for bill in sorted(bills, key=lambda b: b["due_date"]):
+            by_account.setdefault(bill["autopay_account_id"], []).append(bill)
+
+        accounts = {}
+        async for account in accounts_collection.find(
+            {"_id": {"$in": [ObjectId(a) for a in by_account if ObjectId.is_valid(a)]}},
+            {"balance": 1, "user_id": 1},
+            session=session
+        ):
+            accounts[str(account["_id"])] = account
+
+        paid_at = datetime.utcnow()
+        paid, unpaid, updates, docs = [], {}, [], []
+        for account_id, group in by_account.items():
+            account = accounts.get(account_id)
+            balance = account["balance"] if account else 0.0
+            total = 0.0
+            for bill in group:
+                if account is None or account["user_id"] != bill["user_id"]:
+                    unpaid[bill["_id"]] = "Account not found"
+                    continue
+                if bill["amount"] > balance:
+                    unpaid[bill["_id"]] = "Insufficient funds"
+                    continue
+                balance -= bill["amount"]
+                total += bill["amount"]
+                paid.append(bill["_id"])
+                docs.append(_bill_payment_doc(account_id, bill, balance, paid_at))
+            if total:
+                updates.append(UpdateOne(
+                    {"_id": account["_id"], "balance": {"$gte": total}},
+                    {"$inc": {"balance": -total}}
+                ))
+
+        if not updates:
+            return paid, unpaid
+        result = await accounts_collection.bulk_write(updates, ordered=False, session=session)
+        if result.matched_count != len(updates):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Account balances changed during autopay, please retry"
+            )
+        result = await bills_collection.update_many(
+            {"_id": {"$in": paid}, "status": {"$ne": BillStatus.PAID.value}},
+            {"$set": {"status": BillStatus.PAID.value, "paid_at": paid_at}, "$unset": {"autopay_error": ""}},
+            session=session
+        )
+        if result.modified_count != len(paid):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Bills changed during autopay, please retry"
+            )
+        await transactions_collection.insert_many(docs, session=session)
+        await rollups.record(docs, session)
+        return paid, unpaid
+
+    return await run_in_transaction(callback)
+
+
+async def apply_batch(user_id: str, items: list[TransactionBatchItem], ordered: bool = True) -> list[dict]:
+    """Apply many deposits, withdrawals and transfers in a fixed number of round trips.
+
+    Returns one result per item: {"status": "applied", "transaction": doc},
+    {"status": "failed", "error": ...} or {"status": "skipped"} for items
+    after the first failure of an ordered batch.
+    """
+    async def callback(session):
+        # Two reads load every account the batch can touch
+        account_ids = {item.account_id for item in items if ObjectId.is_valid(item.account_id)}
+        owned = {}
+        async for account in accounts_collection.find(
+            {"_id": {"$in": [ObjectId(a) for a in account_ids]}, "user_id": user_id},
+            {"balance": 1, "account_number": 1},
+            session=session
+        ):
+            owned[str(account["_id"])] = account
+
+        recipient_numbers = {
+            item.recipient_account for item in items
+            if item.transaction_type == TransactionType.TRANSFER and item.recipient_account
+        }
+        by_number = {a["account_number"]: a for a in owned.values()}
+        missing = list(recipient_numbers - by_number.keys())
+        if missing:
+            async for account in accounts_collection.find(
+                {"account_number": {"$in": missing}},
+                {"balance": 1, "account_number": 1},
+                session=session
+            ):
+                by_number[account["account_number"]] = account
+
+        balances = {}
+        for account in list(owned.values()) + list(by_number.values()):
+            balances[str(account["_id"])] = account["balance"]
+        delta = {}
+        low_water = {}  # Lowest running delta per account, i.e. the largest drawdown
+        docs = []
+        results = []
+
+        def move(key: str, amount: float):
+            balances[key] += amount
+            delta[key] = delta.get(key, 0) + amount
+            low_water[key] = min(low_water.get(key, 0), delta[key])
+
+        # Validate and price every item against the in-memory balances
+        now = datetime.utcnow()
+        failed = False
+        for item in items:
+            if failed and ordered:
+                results.append({"status": "skipped"})
+                continue
+
+            account = owned.get(item.account_id)
+            recipient = by_number.get(item.recipient_account) if item.recipient_account else None
+            error = None
+            if not account:
+                error = "Account not found"
+            elif item.transaction_type == TransactionType.DEPOSIT:
+                pass
+            elif item.transaction_type not in (TransactionType.WITHDRAWAL, TransactionType.TRANSFER):
+                error = "Unsupported transaction type"
+            elif balances[item.account_id] < item.amount:
+                error = "Insufficient funds"
+            elif item.transaction_type == TransactionType.TRANSFER:
+                if not item.recipient_account:
+                    error = "Recipient account number required for transfers"
+                elif not recipient:
+                    error = "Recipient account not found"
+                elif recipient["account_number"] == account["account_number"]:
+                    error = "Cannot transfer to the same account"
+
+            if error:
+                failed = True
+                results.append({"status": "failed", "error": error})
+                continue
+
+            description = item.description or f"{item.transaction_type.value.title()}"
+            if item.transaction_type == TransactionType.DEPOSIT:
+                move(item.account_id, item.amount)
+            else:
+                move(item.account_id, -item.amount)
+
+            if item.transaction_type == TransactionType.TRANSFER:
+                recipient_id = str(recipient["_id"])
+                move(recipient_id, item.amount)
+                docs.append(transaction_doc(
+                    recipient_id,
+                    item.amount,
+                    TransactionType.DEPOSIT,
+                    f"Transfer from {account['account_number']}",
+                    balances[recipient_id],
+                    created_at=now
+                ))
+
+            doc = transaction_doc(
+                item.account_id,
+                item.amount,
+                item.transaction_type,
+                description,
+                balances[item.account_id],
+                recipient_account=item.recipient_account if recipient else None,
+                created_at=now
+            )
+            docs.append(doc)
+            results.append({"status": "applied", "transaction": doc})
+
+        if not docs:
+            return results
+
+        # One guarded $inc per account; the guard re-checks the worst drawdown
+        updates = [
+            UpdateOne(
+                {"_id": ObjectId(key), "balance": {"$gte": -low_water[key]}},
+                {"$inc": {"balance": amount}}
+            )
+            for key, amount in delta.items()
+        ]
+        result = await accounts_collection.bulk_write(updates, ordered=False, session=session)
+        if result.matched_count != len(updates):
+            raise HTTPException(
+                status_code=status.HTTP_409_CONFLICT,
+                detail="Account balances changed during the batch, please retry"
+            )
+
+        await transactions_collection.insert_many(docs, ordered=True, session=session)
+        await rollups.record(docs, session)
+        return results
+
+    return await run_in_transaction(callback)
@@ -1,17 +1,36 @@
 from fastapi import FastAPI, Depends
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
-from database import init_db
-from auth import get_current_user
-from routes import auth, accounts, transactions, bills
+from database import connect, close
+from indexes import ensure_indexes, INDEX_SYNC_ON_STARTUP
+from hashing import password_hasher
+import metrics
+from metrics import counter, gauge
+import rate_limit
+import sessions
+from stream import change_feed
+from scheduler import scheduler
+from tasks import start_background_tasks, stop_background_tasks
+from auth import get_current_user, cache_stats
+from routes import auth, accounts, transactions, bills, dashboard, stream
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Initialize database on startup"""
-    await init_db()
+    """Connect on startup (indexes are usually synced in the background), disconnect on shutdown"""
+    await connect()
+    if INDEX_SYNC_ON_STARTUP == "wait":
+        await ensure_indexes()
+    tasks = start_background_tasks()
+    scheduler.start()
     yield
+    await scheduler.stop()
+    await stop_background_tasks(tasks)
+    await change_feed.stop()
+    password_hasher.shutdown()
+    close()
 
 
 app = FastAPI(
@@ -21,6 +40,48 @@ app = FastAPI(
     lifespan=lifespan
 )
 
+# Per-route latency, status codes and in-flight requests for /metrics
+app.add_middleware(metrics.MetricsMiddleware)
+
+
+def _auth_metrics() -> dict:
+    hasher = password_hasher.stats()
+    caches = cache_stats()
+    limits = rate_limit.stats()
+    values = {
+        "password_hash_queue_depth": gauge("Password hashes waiting for a worker", hasher["queue_depth"]),
+        "password_hash_completed_total": counter("Password hashes and checks completed", hasher["completed"]),
+        "password_hash_rejected_total": counter("Password hashes turned away when the queue was full", hasher["rejected"]),
+        "password_hash_queue_wait_seconds_total": counter(
+            "Time password hashes spent queued", hasher["queue_wait_seconds_total"]
+        ),
+        "password_hash_queue_wait_seconds_max": gauge(
+            "Longest time a password hash spent queued", hasher["queue_wait_seconds_max"]
+        ),
+        "user_cache_hits_total": counter("User cache hits", caches["users"]["hits"]),
+        "user_cache_misses_total": counter("User cache misses", caches["users"]["misses"]),
+        "token_cache_hits_total": counter("Decoded token cache hits", caches["tokens"]["hits"]),
+        "token_cache_misses_total": counter("Decoded token cache misses", caches["tokens"]["misses"]),
+        "password_checks_in_flight": gauge("Password checks admitted and running", limits["in_flight"]),
+    }
+    for route, counts in limits["routes"].items():
+        values[f"auth_{route}_rate_limited_total"] = counter(
+            f"Requests to {route} rejected by rate limits", counts["rate_limited"]
+        )
+        values[f"auth_{route}_shed_total"] = counter(
+            f"Requests to {route} turned away for capacity", counts["shed"]
+        )
+        values[f"auth_{route}_rate_limit_keys"] = gauge(
+            f"IP and email buckets tracked for {route}", counts["tracked_keys"]
+        )
+    return values
+
+
+metrics.register_collector(_auth_metrics)
+metrics.register_collector(change_feed.stats)
+metrics.register_collector(sessions.stats)
+metrics.register_collector(scheduler.stats)
+
 # CORS middleware for frontend
 app.add_middleware(
     CORSMiddleware,
@@ -28,6 +89,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Prev-Cursor", "Idempotent-Replayed"],
 )
 
 # Include routers
@@ -35,6 +97,8 @@ app.include_router(auth.router)
 app.include_router(accounts.router)
 app.include_router(transactions.router)
 app.include_router(bills.router)
+app.include_router(dashboard.router)
+app.include_router(stream.router)
 
 
 @app.get("/")
@@ -43,6 +107,12 @@ async def root():
     return {"message": "Banking App API is running", "status": "healthy"}
 
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """Prometheus metrics"""
+    return metrics.render()
+
+
 @app.get("/api/me")
 async def get_current_user_info(current_user: dict = Depends(get_current_user)):
     """Get current logged in user info"""
@@ -0,0 +1,248 @@
+"""In-process metrics rendered in the Prometheus text format at /metrics.
+
+Recording is kept cheap for the hot path: a metric series is created the
+first time a label set is seen, after which an observation is a bisect and
+two in-place increments with no locking. Increments can race between the
+driver's threads, which at worst loses a count; that's an accepted
+trade-off for monitoring data.
+"""
+import time
+from bisect import bisect_left
+from typing import Callable
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(text: str, quotes: bool = True) -> str:
+    """Escape backslashes, newlines and (in label values) double quotes per the text format"""
+    text = str(text).replace("\\", "\\\\").replace("\n", "\\n")
+    return text.replace('"', '\\"') if quotes else text
+
+
+def _label_text(names: tuple, values: tuple) -> str:
+    return ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+
+
+def _header(name: str, metric_type: str, help_text: str) -> list[str]:
+    return [f"# HELP {name} {_escape(help_text, quotes=False)}", f"# TYPE {name} {metric_type}"]
+
+
+def _series_name(name: str, names: tuple, values: tuple) -> str:
+    labels = _label_text(names, values)
+    return f"{name}{{{labels}}}" if labels else name
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple = ()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = _header(self.name, "counter", self.help_text)
+        for values, value in self._values.items():
+            lines.append(f"{_series_name(self.name, self.labels, values)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    def dec(self, *label_values, amount: float = 1):
+        self._values[label_values] = self._values.get(label_values, 0) - amount
+
+    def set(self, *label_values, value: float):
+        self._values[label_values] = value
+
+    def render(self) -> list[str]:
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [per-bucket counts..., +Inf count, sum]
+
+    def observe(self, value: float, *label_values):
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = _header(self.name, "histogram", self.help_text)
+        for values, series in self._series.items():
+            labels = _label_text(self.labels, values)
+            prefix = f"{labels}," if labels else ""
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{prefix}le="{bound}"}} {cumulative}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{prefix}le="+Inf"}} {cumulative}')
+            lines.append(f"{_series_name(self.name + '_sum', self.labels, values)} {series[-1]}")
+            lines.append(f"{_series_name(self.name + '_count', self.labels, values)} {cumulative}")
+        return lines
+
+
+http_request_duration = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route", ("method", "route")
+)
+http_responses = Counter(
+    "http_responses_total", "HTTP responses by route and status code", ("method", "route", "status")
+)
+http_in_flight = Gauge("http_requests_in_flight", "Requests currently being handled")
+mongo_command_duration = Histogram(
+    "mongo_command_duration_seconds", "MongoDB command latency", ("collection", "command")
+)
+mongo_command_failures = Counter(
+    "mongo_command_failures_total", "Failed MongoDB commands", ("collection", "command")
+)
+mongo_pool_checkout_wait = Histogram(
+    "mongo_pool_checkout_wait_seconds", "Time spent waiting for a pooled connection"
+)
+mongo_pool_checkout_failures = Counter(
+    "mongo_pool_checkout_failures_total", "Failed connection checkouts", ("reason",)
+)
+
+REGISTRY = [
+    http_request_duration, http_responses, http_in_flight,
+    mongo_command_duration, mongo_command_failures,
+    mongo_pool_checkout_wait, mongo_pool_checkout_failures,
+]
+
+# Callables returning {metric_name: (type, help, value)}, sampled at scrape time
+_collectors: list[Callable[[], dict]] = []
+
+
+def counter(help_text: str, value: float) -> tuple:
+    """A collector value that only ever increases"""
+    return "counter", help_text, value
+
+
+def gauge(help_text: str, value: float) -> tuple:
+    """A collector value that can go up and down"""
+    return "gauge", help_text, value
+
+
+def register_collector(collector: Callable[[], dict]):
+    """Add a callable returning {name: counter(...) or gauge(...)}, exported on scrape"""
+    _collectors.append(collector)
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        for name, (metric_type, help_text, value) in collector().items():
+            lines.extend(_header(name, metric_type, help_text))
+            lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class MetricsMiddleware:
+    """ASGI middleware recording latency, status codes and in-flight requests"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_wrapper(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        http_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_in_flight.dec()
+            # Label by route template, not raw path, to keep cardinality bounded
+            route = scope.get("route")
+            path = getattr(route, "path", None) or "unmatched"
+            http_request_duration.observe(elapsed, scope["method"], path)
+            http_responses.inc(scope["method"], path, status_code)
+
+
+class CommandListener(monitoring.CommandListener):
+    """Times every MongoDB command by collection and command name"""
+
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        target = event.command.get(event.command_name)
+        if not isinstance(target, str):
+            # e.g. getMore carries the collection separately
+            target = event.command.get("collection", event.database_name)
+        self._pending[event.request_id] = (target, event.command_name)
+
+    def succeeded(self, event):
+        labels = self._pending.pop(event.request_id, None)
+        if labels:
+            mongo_command_duration.observe(event.duration_micros / 1_000_000, *labels)
+
+    def failed(self, event):
+        labels = self._pending.pop(event.request_id, None)
+        if labels:
+            mongo_command_duration.observe(event.duration_micros / 1_000_000, *labels)
+            mongo_command_failures.inc(*labels)
+
+
+class PoolListener(monitoring.ConnectionPoolListener):
+    """Records how long operations wait to check out a pooled connection"""
+
+    def connection_checked_out(self, event):
+        # duration is reported by pymongo 4.7+
+        duration = getattr(event, "duration", None)
+        if duration is not None:
+            mongo_pool_checkout_wait.observe(duration)
+
+    def connection_check_out_failed(self, event):
+        mongo_pool_checkout_failures.inc(event.reason)
+
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        pass
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        pass
+
+    def connection_check_out_started(self, event):
+        pass
+
+    def connection_checked_in(self, event):
+        pass
@@ -10,6 +10,8 @@ class TransactionType(str, Enum):
     WITHDRAWAL = "withdrawal"
     TRANSFER = "transfer"
     BILL_PAYMENT = "bill_payment"
+    INTEREST = "interest"
+    FEE = "fee"
 
 
 class BillStatus(str, Enum):
@@ -18,6 +20,11 @@ class BillStatus(str, Enum):
     OVERDUE = "overdue"
 
 
+class RecurrenceFrequency(str, Enum):
+    WEEKLY = "weekly"
+    MONTHLY = "monthly"
+
+
 class BillType(str, Enum):
     ELECTRICITY = "electricity"
     WATER = "water"
@@ -67,6 +74,31 @@ class AccountResponse(BaseModel):
     created_at: datetime
 
 
+class AccountBalance(BaseModel):
+    account_id: str
+    as_of: datetime
+    balance: float
+    checkpoint_at: Optional[datetime] = None  # Closing time of the checkpoint used
+    transactions_replayed: int
+
+
+class SpendingEntry(BaseModel):
+    transaction_type: TransactionType
+    category: Optional[BillType] = None  # Set for bill payments
+    count: int
+    total: float
+
+
+class MonthlyInsights(BaseModel):
+    month: str  # YYYY-MM
+    entries: list[SpendingEntry]
+
+
+class AccountInsights(BaseModel):
+    account_id: str
+    months: list[MonthlyInsights]
+
+
 # Transaction Models
 class TransactionCreate(BaseModel):
     amount: float = Field(..., gt=0)
@@ -86,6 +118,29 @@ class TransactionResponse(BaseModel):
     created_at: datetime
 
 
+class TransactionBatchItem(TransactionCreate):
+    account_id: str
+
+
+class TransactionBatch(BaseModel):
+    transactions: list[TransactionBatchItem] = Field(..., min_length=1, max_length=10000)
+    ordered: bool = True  # Stop at the first failing item, like insert_many(ordered=True)
+
+
+class TransactionBatchResult(BaseModel):
+    index: int
+    status: str  # applied, failed or skipped
+    transaction: Optional[TransactionResponse] = None
+    error: Optional[str] = None
+
+
+class TransactionBatchResponse(BaseModel):
+    applied: int
+    failed: int
+    skipped: int
+    results: list[TransactionBatchResult]
+
+
 # Bill Models
 class BillCreate(BaseModel):
     bill_type: BillType
@@ -106,6 +161,8 @@ class BillResponse(BaseModel):
     status: BillStatus
     paid_at: Optional[datetime] = None
     created_at: datetime
+    recurring_bill_id: Optional[str] = None
+    autopay_error: Optional[str] = None
 
 
 class BillPayment(BaseModel):
@@ -113,11 +170,91 @@ class BillPayment(BaseModel):
     from_account_id: str
 
 
+class BillBatchPayment(BaseModel):
+    bill_ids: list[str] = Field(..., min_length=1, max_length=500)
+    from_account_id: str
+
+
+class BillBatchPaymentResponse(BaseModel):
+    total_paid: float
+    balance_after: float
+    bills: list[BillResponse]
+
+
+class RecurringBillCreate(BaseModel):
+    bill_type: BillType
+    provider_name: str
+    amount: float = Field(..., gt=0)
+    account_number: str  # Provider account number
+    frequency: RecurrenceFrequency
+    # Monthly bills only; defaults to start_date's day, clamped to short months
+    day_of_month: Optional[int] = Field(None, ge=1, le=31)
+    start_date: datetime  # First due date
+    autopay_account_id: Optional[str] = None
+
+
+class RecurringBillResponse(BaseModel):
+    id: str
+    user_id: str
+    bill_type: BillType
+    provider_name: str
+    amount: float
+    account_number: str
+    frequency: RecurrenceFrequency
+    day_of_month: Optional[int] = None
+    autopay_account_id: Optional[str] = None
+    next_due_date: datetime
+    next_run_at: datetime  # When the next bill is created
+    last_run_at: Optional[datetime] = None
+    created_at: datetime
+
+
+# Dashboard Models
+class DashboardAccount(BaseModel):
+    id: str
+    account_number: str
+    account_name: str
+    balance: float
+
+
+class BillStatusSummary(BaseModel):
+    count: int = 0
+    total: float = 0.0
+
+
+class DashboardResponse(BaseModel):
+    total_balance: float
+    accounts: list[DashboardAccount]
+    bills_by_status: dict[BillStatus, BillStatusSummary]
+    upcoming_bills: list[BillResponse]
+    recent_transactions: list[TransactionResponse]
+
+
 # Token Models
 class Token(BaseModel):
     access_token: str
+    refresh_token: Optional[str] = None
     token_type: str
 
 
+class RefreshRequest(BaseModel):
+    refresh_token: str = Field(..., min_length=1, max_length=256)
+
+
+class SessionResponse(BaseModel):
+    id: str
+    created_at: datetime
+    last_used_at: datetime
+    expires_at: datetime
+    user_agent: str
+    ip: str
+    current: bool
+
+
+class StreamTicket(BaseModel):
+    ticket: str
+    expires_in: int  # Seconds
+
+
 class TokenData(BaseModel):
     user_id: Optional[str] = None
@@ -0,0 +1,39 @@
+import base64
+import json
+from datetime import datetime
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, status
+
+
+def encode_cursor(created_at: datetime, doc_id: ObjectId) -> str:
+    """Build an opaque cursor from a transaction's sort key"""
+    raw = json.dumps({"t": created_at.isoformat(), "id": str(doc_id)}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, ObjectId]:
+    """Parse a cursor produced by encode_cursor"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        data = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+        return datetime.fromisoformat(data["t"]), ObjectId(data["id"])
+    except (ValueError, KeyError, TypeError, InvalidId):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+
+
+def keyset_filter(cursor: str, older: bool) -> dict:
+    """Range condition on (created_at, _id) strictly past the cursor"""
+    return keyset_condition(*decode_cursor(cursor), older)
+
+
+def keyset_condition(created_at: datetime, doc_id: ObjectId, older: bool) -> dict:
+    """Range condition on (created_at, _id) strictly past the given position"""
+    op = "$lt" if older else "$gt"
+    return {"$or": [
+        {"created_at": {op: created_at}},
+        {"created_at": created_at, "_id": {op: doc_id}},
+    ]}
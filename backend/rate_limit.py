@@ -0,0 +1,193 @@
+"""Per-client rate limiting and admission control for the auth endpoints.
+
+Each route has a policy: token buckets keyed by client IP and by email,
+and a ceiling on how many password checks may be in flight process-wide
+when the route's request is admitted. Rate-limited requests get 429 and
+requests turned away for capacity get 503, both with Retry-After, before
+any bcrypt work is queued.
+
+Limits are "<requests>/<seconds>" strings, e.g. "10/60" allows a burst of
+10 and refills one token every 6 seconds; "0" or an empty value disables
+that bucket.
+"""
+import os
+import math
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import HTTPException, Request, status
+from dotenv import load_dotenv
+
+load_dotenv()
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes")
+# Only honour X-Forwarded-For behind a proxy that sets it
+RATE_LIMIT_TRUST_FORWARDED = os.getenv("RATE_LIMIT_TRUST_FORWARDED", "false").lower() in ("1", "true", "yes")
+RATE_LIMIT_SWEEP_SECONDS = float(os.getenv("RATE_LIMIT_SWEEP_SECONDS", 60))
+PASSWORD_CHECK_MAX_IN_FLIGHT = int(os.getenv("PASSWORD_CHECK_MAX_IN_FLIGHT", 32))
+
+
+def parse_limit(value: str) -> Optional[tuple[float, float]]:
+    """Turn "10/60" into (burst 10, 10/60 tokens per second); None when disabled"""
+    if not value or value.strip() == "0":
+        return None
+    count, _, seconds = value.partition("/")
+    burst = float(count)
+    return burst, burst / float(seconds or 1)
+
+
+class TokenBucket:
+    """Token buckets for many keys, each stored as [tokens, last refill time].
+
+    A bucket left alone long enough to refill completely is the same as no
+    bucket, so those are evicted every sweep_seconds.
+    """
+
+    def __init__(self, burst: float, rate: float, sweep_seconds: float = RATE_LIMIT_SWEEP_SECONDS):
+        self.burst = burst
+        self.rate = rate
+        self.sweep_seconds = sweep_seconds
+        self._buckets: dict[str, list[float]] = {}
+        self._last_sweep = time.monotonic()
+
+    def take(self, key: str) -> float:
+        """Spend a token; returns 0 if allowed, else seconds until one is available"""
+        now = time.monotonic()
+        if now - self._last_sweep >= self.sweep_seconds:
+            self._sweep(now)
+
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = [self.burst, now]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            return 0.0
+        return (1 - bucket[0]) / self.rate
+
+    def refund(self, key: str):
+        """Give back a token spent on a request that was turned away anyway"""
+        bucket = self._buckets.get(key)
+        if bucket is not None:
+            bucket[0] = min(self.burst, bucket[0] + 1)
+
+    def _sweep(self, now: float):
+        full_after = self.burst / self.rate
+        self._buckets = {
+            key: bucket for key, bucket in self._buckets.items()
+            if now - bucket[1] < full_after
+        }
+        self._last_sweep = now
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionGate:
+    """Counts password checks in flight across every route in this process"""
+
+    def __init__(self):
+        self.in_flight = 0
+
+    @asynccontextmanager
+    async def admit(self, limit: int):
+        if self.in_flight >= limit:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Server busy, please retry",
+                headers={"Retry-After": "1"},
+            )
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+
+password_checks = AdmissionGate()
+
+
+def client_ip(request: Request) -> str:
+    if RATE_LIMIT_TRUST_FORWARDED:
+        forwarded = request.headers.get("x-forwarded-for")
+        if forwarded:
+            return forwarded.split(",")[0].strip()
+    return request.client.host if request.client else "unknown"
+
+
+class RoutePolicy:
+    """Rate limits and in-flight ceiling for one auth route"""
+
+    def __init__(self, name: str, per_ip: str, per_email: str, max_in_flight: int):
+        self.name = name
+        ip_limit = parse_limit(per_ip)
+        email_limit = parse_limit(per_email)
+        self.by_ip = TokenBucket(*ip_limit) if ip_limit else None
+        self.by_email = TokenBucket(*email_limit) if email_limit else None
+        self.max_in_flight = max_in_flight
+        self.rate_limited = 0
+        self.shed = 0
+
+    def check(self, request: Request, email: Optional[str] = None):
+        """Raise 429 if the client IP or the email is over its limit"""
+        if not RATE_LIMIT_ENABLED:
+            return
+        ip = client_ip(request)
+        wait = 0.0
+        if self.by_ip is not None:
+            wait = self.by_ip.take(ip)
+        if self.by_email is not None and email and not wait:
+            wait = self.by_email.take(email.strip().lower())
+            # Attempts against a throttled email mustn't drain the IP's budget
+            if wait and self.by_ip is not None:
+                self.by_ip.refund(ip)
+        if wait:
+            self.rate_limited += 1
+            raise HTTPException(
+                status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                detail="Too many attempts, please retry later",
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+
+    @asynccontextmanager
+    async def password_check(self):
+        """Hold a slot in the process-wide password check budget"""
+        if not RATE_LIMIT_ENABLED:
+            yield
+            return
+        if password_checks.in_flight >= self.max_in_flight:
+            self.shed += 1
+        async with password_checks.admit(self.max_in_flight):
+            yield
+
+    def stats(self) -> dict:
+        return {
+            "rate_limited": self.rate_limited,
+            "shed": self.shed,
+            "tracked_keys": len(self.by_ip or ()) + len(self.by_email or ()),
+        }
+
+
+def _policy(name: str, per_ip: str, per_email: str, share: float) -> RoutePolicy:
+    prefix = f"RATE_LIMIT_{name.upper()}"
+    return RoutePolicy(
+        name,
+        os.getenv(f"{prefix}_PER_IP", per_ip),
+        os.getenv(f"{prefix}_PER_EMAIL", per_email),
+        int(os.getenv(f"{prefix}_MAX_IN_FLIGHT", max(1, int(PASSWORD_CHECK_MAX_IN_FLIGHT * share)))),
+    )
+
+
+# Registration gives up capacity first so logins keep working under load
+login_policy = _policy("login", "20/60", "5/60", 1.0)
+register_policy = _policy("register", "5/3600", "3/3600", 0.5)
+
+
+def stats() -> dict:
+    return {
+        "in_flight": password_checks.in_flight,
+        "routes": {policy.name: policy.stats() for policy in (login_policy, register_policy)},
+    }
@@ -0,0 +1,159 @@
+"""Monthly spending rollups per account, transaction type and bill category.
+
+Rollups are kept current by the ledger, which applies record() in the same
+session transaction as the balance change. To backfill from existing
+history (e.g. after first deploying this), run from the backend directory:
+
+    python -m rollups --workers 8 --chunk-size 500
+
+Run the rebuild while writes are quiet: it replaces the rollup documents of
+every account it processes. Rows written before categories were keyed as
+NO_CATEGORY (null) are replaced the same way.
+"""
+import argparse
+import asyncio
+import time
+from typing import Optional
+from pymongo import UpdateOne
+
+from database import (
+    accounts_collection, transactions_collection, transaction_buckets_collection,
+    spending_rollups_collection
+)
+from models import TransactionType
+
+# Rollup key category for everything but bill payments; $merge can't match on null
+NO_CATEGORY = ""
+
+
+def month_key(transaction: dict) -> str:
+    return transaction["created_at"].strftime("%Y-%m")
+
+
+def rollup_updates(transactions: list[dict]) -> list[UpdateOne]:
+    """$inc upserts for a set of transaction documents, one per rollup key"""
+    totals = {}
+    for transaction in transactions:
+        key = (
+            transaction["account_id"],
+            month_key(transaction),
+            transaction["transaction_type"],
+            transaction.get("bill_type") or NO_CATEGORY,
+        )
+        count, total = totals.get(key, (0, 0.0))
+        totals[key] = (count + 1, total + transaction["amount"])
+
+    return [
+        UpdateOne(
+            {"account_id": account_id, "month": month, "transaction_type": transaction_type, "category": category},
+            {"$inc": {"count": count, "total": total}},
+            upsert=True
+        )
+        for (account_id, month, transaction_type, category), (count, total) in totals.items()
+    ]
+
+
+async def record(transactions: list[dict], session=None):
+    """Fold new transactions into the rollups"""
+    updates = rollup_updates(transactions)
+    if updates:
+        await spending_rollups_collection.bulk_write(updates, ordered=False, session=session)
+
+
+async def get_rollups(account_id: str, since_month: str) -> list[dict]:
+    """Rollup rows for an account from since_month (YYYY-MM) on, newest first"""
+    cursor = spending_rollups_collection.find(
+        {"account_id": account_id, "month": {"$gte": since_month}},
+        {"_id": 0, "month": 1, "transaction_type": 1, "category": 1, "count": 1, "total": 1}
+    ).sort([("month", -1), ("transaction_type", 1)])
+    return await cursor.to_list(length=None)
+
+
+def _rebuild_pipeline(account_ids: list[str], archived: bool = False) -> list[dict]:
+    # Older bill payments carry their category only in the description,
+    # "Bill payment - <provider> (<bill_type>)"
+    parsed_category = {"$let": {
+        "vars": {"match": {"$regexFind": {"input": "$description", "regex": r"\(([a-z_]+)\)$"}}},
+        "in": {"$arrayElemAt": ["$$match.captures", 0]}
+    }}
+    category = {"$cond": [
+        {"$eq": ["$transaction_type", TransactionType.BILL_PAYMENT.value]},
+        {"$ifNull": ["$bill_type", {"$ifNull": [parsed_category, NO_CATEGORY]}]},
+        NO_CATEGORY
+    ]}
+    source = [{"$match": {"account_id": {"$in": account_ids}}}]
+    if archived:
+        # Unwind cold-tier buckets back into transaction documents
+        source += [
+            {"$unwind": "$transactions"},
+            {"$project": {
+                "account_id": 1,
+                **{field: f"$transactions.{field}" for field in (
+                    "created_at", "amount", "transaction_type", "description", "bill_type"
+                )}
+            }},
+        ]
+    return source + [
+        {"$group": {
+            "_id": {
+                "account_id": "$account_id",
+                "month": {"$dateToString": {"format": "%Y-%m", "date": "$created_at"}},
+                "transaction_type": "$transaction_type",
+                "category": category
+            },
+            "count": {"$sum": 1},
+            "total": {"$sum": "$amount"}
+        }},
+        {"$project": {
+            "_id": 0,
+            "account_id": "$_id.account_id",
+            "month": "$_id.month",
+            "transaction_type": "$_id.transaction_type",
+            "category": "$_id.category",
+            "count": 1,
+            "total": 1
+        }},
+        {"$merge": {
+            "into": spending_rollups_collection.name,
+            "on": ["account_id", "month", "transaction_type", "category"],
+            # Adds up when a month spans both tiers
+            "whenMatched": [{"$set": {
+                "count": {"$add": ["$count", "$$new.count"]},
+                "total": {"$add": ["$total", "$$new.total"]}
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+
+async def _rebuild_chunk(account_ids: list[str]):
+    await spending_rollups_collection.delete_many({"account_id": {"$in": account_ids}})
+    async for _ in transaction_buckets_collection.aggregate(_rebuild_pipeline(account_ids, archived=True)):
+        pass
+    async for _ in transactions_collection.aggregate(_rebuild_pipeline(account_ids)):
+        pass
+
+
+async def rebuild(workers: int = 4, chunk_size: int = 500, account_ids: Optional[list[str]] = None):
+    """Recompute rollups from transaction history, chunks of accounts in parallel"""
+    if account_ids is None:
+        account_ids = [str(a["_id"]) async for a in accounts_collection.find({}, {"_id": 1})]
+
+    chunks = [account_ids[i:i + chunk_size] for i in range(0, len(account_ids), chunk_size)]
+    semaphore = asyncio.Semaphore(workers)
+
+    async def run(chunk):
+        async with semaphore:
+            await _rebuild_chunk(chunk)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(run(chunk) for chunk in chunks))
+    return {"accounts": len(account_ids), "chunks": len(chunks), "seconds": time.perf_counter() - started}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild monthly spending rollups")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args()
+    print(asyncio.run(rebuild(args.workers, args.chunk_size)))
@@ -1,40 +1,40 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Query
+from datetime import datetime, timezone
+from typing import Optional
 from bson import ObjectId
-import random
-import string
+from pymongo.errors import DuplicateKeyError
 
 from database import accounts_collection
-from models import AccountCreate, AccountResponse
+from models import (
+    AccountCreate, AccountResponse, AccountBalance, AccountInsights, MonthlyInsights, SpendingEntry
+)
 from auth import get_current_user
+from account_numbers import account_number_allocator
+import rollups
+import checkpoints
+from serializers import FAST_LIST_RESPONSES, ACCOUNT_PROJECTION, FastJSONResponse, account_to_dict
 
 router = APIRouter(prefix="/api/accounts", tags=["Accounts"])
 
 
-def generate_account_number() -> str:
-    """Generate a unique 10-digit account number"""
-    return ''.join(random.choices(string.digits, k=10))
-
-
 @router.post("/", response_model=AccountResponse, status_code=status.HTTP_201_CREATED)
 async def create_account(account: AccountCreate, current_user: dict = Depends(get_current_user)):
     """Create a new bank account"""
-    # Generate unique account number
     while True:
-        account_number = generate_account_number()
-        existing = await accounts_collection.find_one({"account_number": account_number})
-        if not existing:
+        account_number = await account_number_allocator.allocate()
+        account_doc = {
+            "user_id": current_user["id"],
+            "account_number": account_number,
+            "account_name": account.account_name,
+            "balance": 0.0,
+            "created_at": datetime.utcnow()
+        }
+        try:
+            result = await accounts_collection.insert_one(account_doc)
             break
-    
-    account_doc = {
-        "user_id": current_user["id"],
-        "account_number": account_number,
-        "account_name": account.account_name,
-        "balance": 0.0,
-        "created_at": datetime.utcnow()
-    }
-    
-    result = await accounts_collection.insert_one(account_doc)
+        except DuplicateKeyError:
+            # Only possible against numbers issued by the old random generator
+            continue
     
     return AccountResponse(
         id=str(result.inserted_id),
@@ -49,20 +49,12 @@ async def create_account(account: AccountCreate, current_user: dict = Depends(ge
 @router.get("/", response_model=list[AccountResponse])
 async def get_accounts(current_user: dict = Depends(get_current_user)):
     """Get all accounts for current user"""
-    accounts = []
-    cursor = accounts_collection.find({"user_id": current_user["id"]})
-    
-    async for account in cursor:
-        accounts.append(AccountResponse(
-            id=str(account["_id"]),
-            user_id=account["user_id"],
-            account_number=account["account_number"],
-            account_name=account["account_name"],
-            balance=account["balance"],
-            created_at=account["created_at"]
-        ))
-    
-    return accounts
+    cursor = accounts_collection.find({"user_id": current_user["id"]}, ACCOUNT_PROJECTION)
+    accounts = [account_to_dict(account) async for account in cursor]
+
+    if FAST_LIST_RESPONSES:
+        return FastJSONResponse(accounts)
+    return [AccountResponse(**account) for account in accounts]
 
 
 @router.get("/{account_id}", response_model=AccountResponse)
@@ -87,3 +79,70 @@ async def get_account(account_id: str, current_user: dict = Depends(get_current_
         balance=account["balance"],
         created_at=account["created_at"]
     )
+
+
+@router.get("/{account_id}/insights", response_model=AccountInsights)
+async def get_account_insights(
+    account_id: str,
+    months: int = Query(12, ge=1, le=120),
+    current_user: dict = Depends(get_current_user)
+):
+    """Monthly totals by transaction type and bill category, newest month first"""
+    account = await accounts_collection.find_one({
+        "_id": ObjectId(account_id),
+        "user_id": current_user["id"]
+    }, {"_id": 1})
+
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found"
+        )
+
+    now = datetime.utcnow()
+    first = now.year * 12 + now.month - 1 - (months - 1)
+    since_month = f"{first // 12:04d}-{first % 12 + 1:02d}"
+
+    # Served from the precomputed rollups, no scan of the transactions collection
+    by_month = {}
+    for row in await rollups.get_rollups(account_id, since_month):
+        by_month.setdefault(row["month"], []).append(SpendingEntry(
+            transaction_type=row["transaction_type"],
+            category=row.get("category") or None,
+            count=row["count"],
+            total=row["total"]
+        ))
+
+    return AccountInsights(
+        account_id=account_id,
+        months=[MonthlyInsights(month=month, entries=entries) for month, entries in by_month.items()]
+    )
+
+
+@router.get("/{account_id}/balance", response_model=AccountBalance)
+async def get_account_balance(
+    account_id: str,
+    as_of: Optional[datetime] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Balance after every transaction up to and including as_of (default now)"""
+    account = await accounts_collection.find_one({
+        "_id": ObjectId(account_id),
+        "user_id": current_user["id"]
+    }, {"_id": 1})
+
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found"
+        )
+
+    if as_of is None:
+        as_of = datetime.utcnow()
+    elif as_of.tzinfo is not None:
+        # Stored times are naive UTC
+        as_of = as_of.astimezone(timezone.utc).replace(tzinfo=None)
+
+    # One checkpoint lookup, then a replay of at most about a day of transactions
+    result = await checkpoints.balance_as_of(account_id, as_of)
+    return AccountBalance(account_id=account_id, as_of=as_of, **result)
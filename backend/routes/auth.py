@@ -1,18 +1,25 @@
-from fastapi import APIRouter, HTTPException, status, Depends
+from fastapi import APIRouter, HTTPException, status, Depends, Request
 from fastapi.security import OAuth2PasswordRequestForm
-from datetime import datetime, timedelta
-from bson import ObjectId
+from datetime import datetime
+from typing import Optional
+from jose import JWTError
 
 from database import users_collection
-from models import UserCreate, UserLogin, UserResponse, Token
-from auth import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from models import UserCreate, UserLogin, UserResponse, Token, RefreshRequest, SessionResponse
+from auth import (
+    get_password_hash, verify_password, get_current_user, decode_token, invalidate_token,
+    oauth2_scheme, optional_oauth2_scheme
+)
+from rate_limit import login_policy, register_policy
+import sessions
 
 router = APIRouter(prefix="/api/auth", tags=["Authentication"])
 
 
 @router.post("/register", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
-async def register(user: UserCreate):
+async def register(request: Request, user: UserCreate):
     """Register a new user"""
+    register_policy.check(request, user.email)
     # Check if user exists
     existing_user = await users_collection.find_one({"email": user.email})
     if existing_user:
@@ -25,9 +32,10 @@ async def register(user: UserCreate):
     user_doc = {
         "email": user.email,
         "full_name": user.full_name,
-        "hashed_password": get_password_hash(user.password),
         "created_at": datetime.utcnow()
     }
+    async with register_policy.password_check():
+        user_doc["hashed_password"] = await get_password_hash(user.password)
     
     result = await users_collection.insert_one(user_doc)
     
@@ -39,44 +47,85 @@ async def register(user: UserCreate):
     )
 
 
-@router.post("/login", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    """Login with form data and get access token"""
-    email = form_data.username
-    password = form_data.password
-    
+async def _authenticate(request: Request, email: str, password: str) -> dict:
+    """Check credentials behind the login rate limits; raises 401 on mismatch"""
+    login_policy.check(request, email)
+
     user = await users_collection.find_one({"email": email})
-    if not user or not verify_password(password, user["hashed_password"]):
+    async with login_policy.password_check():
+        valid = user is not None and await verify_password(password, user["hashed_password"])
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user["_id"])},
-        expires_delta=access_token_expires
-    )
-    
-    return Token(access_token=access_token, token_type="bearer")
+    return user
+
+
+@router.post("/login", response_model=Token)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    """Login with form data and get access token"""
+    user = await _authenticate(request, form_data.username, form_data.password)
+    return await sessions.start_session(str(user["_id"]), request)
 
 
 @router.post("/login/json", response_model=Token)
-async def login_json(user_data: UserLogin):
+async def login_json(request: Request, user_data: UserLogin):
     """Login with JSON body"""
-    user = await users_collection.find_one({"email": user_data.email})
-    if not user or not verify_password(user_data.password, user["hashed_password"]):
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Incorrect email or password",
-            headers={"WWW-Authenticate": "Bearer"},
+    user = await _authenticate(request, user_data.email, user_data.password)
+    return await sessions.start_session(str(user["_id"]), request)
+
+
+@router.post("/refresh", response_model=Token)
+async def refresh(request: Request, body: RefreshRequest):
+    """Exchange a refresh token for a new access token; the refresh token is rotated"""
+    return await sessions.refresh(body.refresh_token, request)
+
+
+@router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(body: RefreshRequest, token: Optional[str] = Depends(optional_oauth2_scheme)):
+    """End the session behind a refresh token"""
+    await sessions.end_session(body.refresh_token)
+    if token:
+        invalidate_token(token)
+
+
+def _token_session_id(token: str = Depends(oauth2_scheme)) -> Optional[str]:
+    try:
+        return decode_token(token).get("sid")
+    except JWTError:
+        return None
+
+
+@router.get("/sessions", response_model=list[SessionResponse])
+async def get_sessions(
+    current_user: dict = Depends(get_current_user),
+    session_id: Optional[str] = Depends(_token_session_id)
+):
+    """List the current user's signed-in sessions"""
+    return [
+        SessionResponse(
+            id=str(session["_id"]),
+            created_at=session["created_at"],
+            last_used_at=session["last_used_at"],
+            expires_at=session["expires_at"],
+            user_agent=session.get("user_agent", ""),
+            ip=session.get("ip", ""),
+            current=str(session["_id"]) == session_id
         )
-    
-    access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-    access_token = create_access_token(
-        data={"sub": str(user["_id"])},
-        expires_delta=access_token_expires
-    )
-    
-    return Token(access_token=access_token, token_type="bearer")
+        for session in await sessions.list_sessions(current_user["id"])
+    ]
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def revoke_session(
+    session_id: str,
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(get_current_user)
+):
+    """Sign out one of the current user's sessions, including its access tokens"""
+    session = await sessions.find_session(session_id, current_user["id"])
+    await sessions.revoke(session)
+    if _token_session_id(token) == session_id:
+        invalidate_token(token)
@@ -1,14 +1,56 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Header
+from datetime import datetime, timezone
+from typing import Optional
 from bson import ObjectId
 
-from database import accounts_collection, transactions_collection, bills_collection
-from models import BillCreate, BillResponse, BillPayment, BillStatus, TransactionType
+from database import bills_collection, accounts_collection, recurring_bills_collection
+from models import (
+    BillCreate, BillResponse, BillPayment, BillBatchPayment, BillBatchPaymentResponse, BillStatus,
+    RecurringBillCreate, RecurringBillResponse, RecurrenceFrequency
+)
 from auth import get_current_user
+import ledger
+import scheduler
+from idempotency import run_idempotent
+from serializers import FAST_LIST_RESPONSES, BILL_PROJECTION, FastJSONResponse, bill_to_dict
 
 router = APIRouter(prefix="/api/bills", tags=["Bills"])
 
 
+def _paid_bill_response(bill: dict) -> BillResponse:
+    return BillResponse(
+        id=str(bill["_id"]),
+        user_id=bill["user_id"],
+        bill_type=bill["bill_type"],
+        provider_name=bill["provider_name"],
+        amount=bill["amount"],
+        due_date=bill["due_date"],
+        account_number=bill["account_number"],
+        status=BillStatus.PAID,
+        paid_at=bill["paid_at"],
+        created_at=bill["created_at"],
+        recurring_bill_id=bill.get("recurring_bill_id")
+    )
+
+
+def _recurring_bill_response(definition: dict) -> RecurringBillResponse:
+    return RecurringBillResponse(
+        id=str(definition["_id"]),
+        user_id=definition["user_id"],
+        bill_type=definition["bill_type"],
+        provider_name=definition["provider_name"],
+        amount=definition["amount"],
+        account_number=definition["account_number"],
+        frequency=definition["frequency"],
+        day_of_month=definition.get("day_of_month"),
+        autopay_account_id=definition.get("autopay_account_id"),
+        next_due_date=definition.get("due_at", definition["next_run_at"]),
+        next_run_at=definition["next_run_at"],
+        last_run_at=definition.get("last_run_at"),
+        created_at=definition["created_at"]
+    )
+
+
 @router.post("/", response_model=BillResponse, status_code=status.HTTP_201_CREATED)
 async def create_bill(bill: BillCreate, current_user: dict = Depends(get_current_user)):
     """Create a new bill"""
@@ -43,112 +85,119 @@ async def create_bill(bill: BillCreate, current_user: dict = Depends(get_current
 @router.get("/", response_model=list[BillResponse])
 async def get_bills(current_user: dict = Depends(get_current_user)):
     """Get all bills for current user"""
-    bills = []
-    cursor = bills_collection.find({"user_id": current_user["id"]}).sort("due_date", 1)
-    
-    async for bill in cursor:
-        # Check if bill is overdue
-        status = bill["status"]
-        if status == BillStatus.PENDING.value and bill["due_date"] < datetime.utcnow():
-            status = BillStatus.OVERDUE.value
-            await bills_collection.update_one(
-                {"_id": bill["_id"]},
-                {"$set": {"status": status}}
-            )
-        
-        bills.append(BillResponse(
-            id=str(bill["_id"]),
-            user_id=bill["user_id"],
-            bill_type=bill["bill_type"],
-            provider_name=bill["provider_name"],
-            amount=bill["amount"],
-            due_date=bill["due_date"],
-            account_number=bill["account_number"],
-            status=status,
-            paid_at=bill.get("paid_at"),
-            created_at=bill["created_at"]
-        ))
-    
-    return bills
+    now = datetime.utcnow()
+    cursor = bills_collection.find(
+        {"user_id": current_user["id"]}, BILL_PROJECTION
+    ).sort("due_date", 1)
+    # bill_to_dict reports overdue bills the background sweep hasn't persisted yet
+    bills = [bill_to_dict(bill, now) async for bill in cursor]
+
+    if FAST_LIST_RESPONSES:
+        return FastJSONResponse(bills)
+    return [BillResponse(**bill) for bill in bills]
 
 
 @router.post("/pay", response_model=BillResponse)
-async def pay_bill(payment: BillPayment, current_user: dict = Depends(get_current_user)):
-    """Pay a bill from an account"""
-    # Get the bill
-    bill = await bills_collection.find_one({
-        "_id": ObjectId(payment.bill_id),
-        "user_id": current_user["id"]
-    })
-    
-    if not bill:
-        raise HTTPException(
-            status_code=status.HTTP_404_NOT_FOUND,
-            detail="Bill not found"
+async def pay_bill(
+    payment: BillPayment,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: dict = Depends(get_current_user)
+):
+    """Pay a bill from an account; an Idempotency-Key header makes retries safe"""
+    async def execute():
+        # Bill claim, balance check/debit and transaction record commit together
+        bill = await ledger.pay_bill(payment.bill_id, payment.from_account_id, current_user["id"])
+        return _paid_bill_response(bill)
+
+    return await run_idempotent(
+        idempotency_key, current_user["id"], "pay_bill", payment.model_dump(), execute
+    )
+
+
+@router.post("/pay/batch", response_model=BillBatchPaymentResponse)
+async def pay_bills(
+    payment: BillBatchPayment,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: dict = Depends(get_current_user)
+):
+    """Pay several bills from one account; either all are paid or none are"""
+    async def execute():
+        bills, account = await ledger.pay_bills(
+            payment.bill_ids, payment.from_account_id, current_user["id"]
         )
-    
-    if bill["status"] == BillStatus.PAID.value:
+        return BillBatchPaymentResponse(
+            total_paid=sum(bill["amount"] for bill in bills),
+            balance_after=account["balance"],
+            bills=[_paid_bill_response(bill) for bill in bills]
+        )
+
+    return await run_idempotent(
+        idempotency_key, current_user["id"], "pay_bills", payment.model_dump(), execute
+    )
+
+
+@router.post("/recurring", response_model=RecurringBillResponse, status_code=status.HTTP_201_CREATED)
+async def create_recurring_bill(bill: RecurringBillCreate, current_user: dict = Depends(get_current_user)):
+    """Bill a provider every week or month, optionally paying it automatically"""
+    if bill.frequency == RecurrenceFrequency.WEEKLY and bill.day_of_month is not None:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Bill already paid"
+            detail="day_of_month only applies to monthly bills"
         )
-    
-    # Get the account
-    account = await accounts_collection.find_one({
-        "_id": ObjectId(payment.from_account_id),
+    if bill.autopay_account_id is not None:
+        account = None
+        if ObjectId.is_valid(bill.autopay_account_id):
+            account = await accounts_collection.find_one(
+                {"_id": ObjectId(bill.autopay_account_id), "user_id": current_user["id"]}, {"_id": 1}
+            )
+        if not account:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Account not found"
+            )
+
+    start_date = bill.start_date
+    if start_date.tzinfo is not None:
+        # Stored times are naive UTC
+        start_date = start_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    definition = await scheduler.create_definition({
+        "user_id": current_user["id"],
+        "bill_type": bill.bill_type.value,
+        "provider_name": bill.provider_name,
+        "amount": bill.amount,
+        "account_number": bill.account_number,
+        "frequency": bill.frequency.value,
+        "day_of_month": (
+            bill.day_of_month or start_date.day if bill.frequency == RecurrenceFrequency.MONTHLY else None
+        ),
+        "autopay_account_id": bill.autopay_account_id,
+        "start_date": start_date,
+        "created_at": datetime.utcnow()
+    })
+    return _recurring_bill_response(definition)
+
+
+@router.get("/recurring", response_model=list[RecurringBillResponse])
+async def get_recurring_bills(current_user: dict = Depends(get_current_user)):
+    """Get all recurring bills for current user"""
+    cursor = recurring_bills_collection.find({"user_id": current_user["id"]}).sort("next_run_at", 1)
+    return [_recurring_bill_response(definition) async for definition in cursor]
+
+
+@router.delete("/recurring/{recurring_bill_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_recurring_bill(recurring_bill_id: str, current_user: dict = Depends(get_current_user)):
+    """Stop a recurring bill; bills it already created are kept"""
+    result = await recurring_bills_collection.delete_one({
+        "_id": ObjectId(recurring_bill_id),
         "user_id": current_user["id"]
     })
-    
-    if not account:
+
+    if result.deleted_count == 0:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
-            detail="Account not found"
-        )
-    
-    if account["balance"] < bill["amount"]:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Insufficient funds"
+            detail="Recurring bill not found"
         )
-    
-    # Deduct from account
-    new_balance = account["balance"] - bill["amount"]
-    await accounts_collection.update_one(
-        {"_id": account["_id"]},
-        {"$set": {"balance": new_balance}}
-    )
-    
-    # Create transaction record
-    transaction_doc = {
-        "account_id": payment.from_account_id,
-        "amount": bill["amount"],
-        "transaction_type": TransactionType.BILL_PAYMENT.value,
-        "description": f"Bill payment - {bill['provider_name']} ({bill['bill_type']})",
-        "balance_after": new_balance,
-        "recipient_account": bill["account_number"],
-        "created_at": datetime.utcnow()
-    }
-    await transactions_collection.insert_one(transaction_doc)
-    
-    # Update bill status
-    paid_at = datetime.utcnow()
-    await bills_collection.update_one(
-        {"_id": bill["_id"]},
-        {"$set": {"status": BillStatus.PAID.value, "paid_at": paid_at}}
-    )
-    
-    return BillResponse(
-        id=str(bill["_id"]),
-        user_id=bill["user_id"],
-        bill_type=bill["bill_type"],
-        provider_name=bill["provider_name"],
-        amount=bill["amount"],
-        due_date=bill["due_date"],
-        account_number=bill["account_number"],
-        status=BillStatus.PAID,
-        paid_at=paid_at,
-        created_at=bill["created_at"]
-    )
 
 
 @router.delete("/{bill_id}", status_code=status.HTTP_204_NO_CONTENT)
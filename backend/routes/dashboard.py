@@ -0,0 +1,123 @@
+from fastapi import APIRouter, Depends, Query
+from datetime import datetime
+from bson import ObjectId
+
+from database import dashboard_users_collection, dashboard_transactions_collection
+from models import (
+    DashboardResponse, DashboardAccount, BillStatusSummary, BillResponse,
+    BillStatus, TransactionResponse
+)
+from auth import get_current_user
+from serializers import BILL_PROJECTION, bill_to_dict
+
+router = APIRouter(prefix="/api/dashboard", tags=["Dashboard"])
+
+
+def _summary_pipeline(user_id: str, now: datetime, bills: int) -> list[dict]:
+    """Accounts plus bill stats for one user, as a single document.
+
+    The accounts and bill stats lookups project only fields of their
+    user_id compound indexes, so both are answered from the index alone.
+    Upcoming bills fetch at most `bills` documents.
+    """
+    effective_status = {"$cond": [
+        {"$and": [
+            {"$eq": ["$status", BillStatus.PENDING.value]},
+            {"$lt": ["$due_date", now]}
+        ]},
+        BillStatus.OVERDUE.value,
+        "$status"
+    ]}
+    return [
+        {"$match": {"_id": ObjectId(user_id)}},
+        {"$project": {"_id": 1}},
+        {"$lookup": {
+            "from": "accounts",
+            "pipeline": [
+                {"$match": {"user_id": user_id}},
+                {"$project": {"_id": 1, "account_number": 1, "account_name": 1, "balance": 1}}
+            ],
+            "as": "accounts"
+        }},
+        {"$lookup": {
+            "from": "bills",
+            "pipeline": [
+                {"$match": {"user_id": user_id}},
+                {"$project": {"_id": 0, "status": 1, "due_date": 1, "amount": 1}},
+                {"$group": {"_id": effective_status, "count": {"$sum": 1}, "total": {"$sum": "$amount"}}}
+            ],
+            "as": "by_status"
+        }},
+        {"$lookup": {
+            "from": "bills",
+            "pipeline": [
+                {"$match": {
+                    "user_id": user_id,
+                    "status": {"$in": [BillStatus.PENDING.value, BillStatus.OVERDUE.value]}
+                }},
+                {"$sort": {"due_date": 1}},
+                {"$limit": bills},
+                {"$project": BILL_PROJECTION}
+            ],
+            "as": "upcoming"
+        }},
+        {"$addFields": {"total_balance": {"$sum": "$accounts.balance"}}}
+    ]
+
+
+@router.get("", response_model=DashboardResponse)
+async def get_dashboard(
+    bills: int = Query(3, ge=0, le=50),
+    transactions: int = Query(5, ge=0, le=50),
+    current_user: dict = Depends(get_current_user)
+):
+    """Everything the dashboard page shows, in one request"""
+    now = datetime.utcnow()
+    summary = {}
+    async for doc in dashboard_users_collection.aggregate(_summary_pipeline(current_user["id"], now, bills)):
+        summary = doc
+
+    accounts = [
+        DashboardAccount(
+            id=str(account["_id"]),
+            account_number=account["account_number"],
+            account_name=account["account_name"],
+            balance=account["balance"]
+        )
+        for account in summary.get("accounts", [])
+    ]
+
+    bills_by_status = {status: BillStatusSummary() for status in BillStatus}
+    for group in summary.get("by_status", []):
+        bills_by_status[BillStatus(group["_id"])] = BillStatusSummary(
+            count=group["count"], total=group["total"]
+        )
+
+    # Same shape as /api/bills, overdue status included
+    upcoming_bills = [BillResponse(**bill_to_dict(bill, now)) for bill in summary.get("upcoming", [])]
+
+    # Second round trip: newest rows across all accounts via the account/created_at index
+    recent_transactions = []
+    if accounts and transactions:
+        cursor = dashboard_transactions_collection.find(
+            {"account_id": {"$in": [account.id for account in accounts]}}
+        ).sort([("created_at", -1), ("_id", -1)]).limit(transactions)
+        async for transaction in cursor:
+            recent_transactions.append(TransactionResponse(
+                id=str(transaction["_id"]),
+                account_id=transaction["account_id"],
+                amount=transaction["amount"],
+                transaction_type=transaction["transaction_type"],
+                description=transaction["description"],
+                balance_after=transaction["balance_after"],
+                recipient_account=transaction.get("recipient_account"),
+                created_at=transaction["created_at"]
+            ))
+
+    return DashboardResponse(
+        total_balance=summary.get("total_balance", 0.0),
+        accounts=accounts,
+        bills_by_status=bills_by_status,
+        upcoming_bills=upcoming_bills,
+        recent_transactions=recent_transactions
+    )
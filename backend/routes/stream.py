@@ -0,0 +1,70 @@
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import StreamingResponse
+
+from auth import get_current_user, decode_token, oauth2_scheme, optional_oauth2_scheme
+from models import StreamTicket
+from stream import (
+    change_feed, format_event, issue_ticket, redeem_ticket, still_valid,
+    STREAM_HEARTBEAT_SECONDS, STREAM_RETRY_SECONDS, STREAM_TICKET_SECONDS
+)
+
+router = APIRouter(prefix="/api/stream", tags=["Stream"])
+
+
+async def get_stream_grant(
+    ticket: Optional[str] = Query(None),
+    bearer: Optional[str] = Depends(optional_oauth2_scheme)
+) -> dict:
+    """EventSource can't set headers, so browsers open the stream with ?ticket="""
+    if bearer:
+        current_user = await get_current_user(bearer)
+        payload = decode_token(bearer)
+        return {"user_id": current_user["id"], "sid": payload.get("sid"), "exp": payload.get("exp")}
+
+    grant = await redeem_ticket(ticket) if ticket else None
+    if grant is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired stream ticket",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return grant
+
+
+@router.post("/ticket", response_model=StreamTicket)
+async def create_ticket(
+    token: str = Depends(oauth2_scheme),
+    current_user: dict = Depends(get_current_user)
+):
+    """A short-lived, single-use ticket for opening the stream"""
+    ticket = await issue_ticket(current_user["id"], decode_token(token))
+    return StreamTicket(ticket=ticket, expires_in=STREAM_TICKET_SECONDS)
+
+
+@router.get("")
+async def stream_events(grant: dict = Depends(get_stream_grant)):
+    """Server-sent events for the user's balances, accounts and transactions"""
+    async def events():
+        # Subscribed here so the finally below always runs for it
+        subscription = await change_feed.subscribe(grant["user_id"])
+        try:
+            yield f"retry: {int(STREAM_RETRY_SECONDS * 1000)}\n\n".encode()
+            while True:
+                batch = await subscription.next_batch(STREAM_HEARTBEAT_SECONDS)
+                if not still_valid(grant):
+                    # Token expired or session revoked; the client reconnects with a new ticket
+                    return
+                if not batch:
+                    # Keeps proxies from closing an idle connection
+                    yield b": ping\n\n"
+                    continue
+                yield b"".join(format_event(name, data) for name, data in batch)
+        finally:
+            change_feed.unsubscribe(subscription)
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
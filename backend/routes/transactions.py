@@ -1,23 +1,140 @@
-from fastapi import APIRouter, HTTPException, status, Depends
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, status, Depends, Header, Query, Response
+from fastapi.responses import StreamingResponse
+from datetime import datetime, timezone
 from bson import ObjectId
 from typing import Optional
+import csv
+import io
+import json
+import hashlib
 
 from database import accounts_collection, transactions_collection
-from models import TransactionCreate, TransactionResponse, TransactionType
+from models import (
+    TransactionCreate, TransactionResponse, TransactionType,
+    TransactionBatch, TransactionBatchResponse, TransactionBatchResult
+)
 from auth import get_current_user
+import ledger
+from idempotency import run_idempotent
+from pagination import encode_cursor, decode_cursor, keyset_filter
+import archive
+from serializers import (
+    FAST_LIST_RESPONSES, TRANSACTION_PROJECTION, FastJSONResponse, transaction_to_dict
+)
 
 router = APIRouter(prefix="/api/transactions", tags=["Transactions"])
 
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FIELDS = [
+    "id", "created_at", "transaction_type", "amount",
+    "balance_after", "description", "recipient_account"
+]
+
+
+def _to_response(transaction: dict) -> TransactionResponse:
+    return TransactionResponse(**transaction_to_dict(transaction))
+
+
+# Declared before /{account_id} so "batch" isn't taken for an account id
+@router.post("/batch", response_model=TransactionBatchResponse)
+async def create_transactions_batch(
+    batch: TransactionBatch,
+    current_user: dict = Depends(get_current_user)
+):
+    """Apply many deposits, withdrawals and transfers across the caller's accounts"""
+    outcomes = await ledger.apply_batch(current_user["id"], batch.transactions, batch.ordered)
+
+    results = []
+    counts = {"applied": 0, "failed": 0, "skipped": 0}
+    for index, outcome in enumerate(outcomes):
+        counts[outcome["status"]] += 1
+        transaction = outcome.get("transaction")
+        results.append(TransactionBatchResult(
+            index=index,
+            status=outcome["status"],
+            transaction=_to_response(transaction) if transaction else None,
+            error=outcome.get("error")
+        ))
+
+    return TransactionBatchResponse(results=results, **counts)
+
+
+async def _apply_transaction(account_id: str, transaction: TransactionCreate, user_id: str) -> dict:
+    description = transaction.description or f"{transaction.transaction_type.value.title()}"
+
+    # Balance checks happen atomically in the ledger's guarded updates
+    if transaction.transaction_type == TransactionType.DEPOSIT:
+        return await ledger.deposit(account_id, user_id, transaction.amount, description)
+    
+    if transaction.transaction_type == TransactionType.WITHDRAWAL:
+        return await ledger.withdraw(account_id, user_id, transaction.amount, description)
+    
+    if transaction.transaction_type == TransactionType.TRANSFER:
+        if not transaction.recipient_account:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Recipient account number required for transfers"
+            )
+        return await ledger.transfer(
+            account_id,
+            user_id,
+            transaction.amount,
+            transaction.recipient_account,
+            description
+        )
+
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Unsupported transaction type"
+    )
+
 
 @router.post("/{account_id}", response_model=TransactionResponse, status_code=status.HTTP_201_CREATED)
 async def create_transaction(
     account_id: str,
     transaction: TransactionCreate,
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key", max_length=255),
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a new transaction (deposit, withdrawal, or transfer).
+
+    Send an Idempotency-Key header to make retries safe: a repeated key
+    replays the original response instead of moving money twice.
+    """
+    async def execute():
+        return _to_response(await _apply_transaction(account_id, transaction, current_user["id"]))
+
+    return await run_idempotent(
+        idempotency_key,
+        current_user["id"],
+        "create_transaction",
+        {"account_id": account_id, **transaction.model_dump()},
+        execute,
+        status_code=status.HTTP_201_CREATED
+    )
+
+
+@router.get("/{account_id}", response_model=list[TransactionResponse])
+async def get_transactions(
+    account_id: str,
+    response: Response,
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[str] = None,
+    before: Optional[str] = None,
     current_user: dict = Depends(get_current_user)
 ):
-    """Create a new transaction (deposit, withdrawal, or transfer)"""
-    # Get the source account
+    """Get transactions for an account, newest first.
+
+    Pass the X-Next-Cursor header value as `after` to page to older
+    transactions, or X-Prev-Cursor as `before` to page back to newer ones.
+    """
+    if after and before:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Use either after or before, not both"
+        )
+
+    # Verify account ownership
     account = await accounts_collection.find_one({
         "_id": ObjectId(account_id),
         "user_id": current_user["id"]
@@ -29,135 +146,242 @@ async def create_transaction(
             detail="Account not found"
         )
     
-    new_balance = account["balance"]
-    
-    # Handle different transaction types
-    if transaction.transaction_type == TransactionType.DEPOSIT:
-        new_balance += transaction.amount
-    
-    elif transaction.transaction_type == TransactionType.WITHDRAWAL:
-        if account["balance"] < transaction.amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Insufficient funds"
-            )
-        new_balance -= transaction.amount
-    
-    elif transaction.transaction_type == TransactionType.TRANSFER:
-        if not transaction.recipient_account:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Recipient account number required for transfers"
-            )
-        
-        if account["balance"] < transaction.amount:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Insufficient funds"
-            )
-        
-        # Find recipient account
-        recipient = await accounts_collection.find_one({
-            "account_number": transaction.recipient_account
-        })
-        
-        if not recipient:
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Recipient account not found"
-            )
-        
-        if recipient["account_number"] == account["account_number"]:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail="Cannot transfer to the same account"
-            )
-        
-        # Update recipient balance
-        await accounts_collection.update_one(
-            {"_id": recipient["_id"]},
-            {"$inc": {"balance": transaction.amount}}
+    # Range scans on the (account_id, created_at, _id) index, never a skip,
+    # continuing into archived buckets once the hot tier runs out
+    cursor = after or before
+    docs = [transaction async for transaction in archive.iter_history(
+        account_id,
+        older=not before,
+        position=decode_cursor(cursor) if cursor else None,
+        projection=TRANSACTION_PROJECTION,
+        limit=limit + 1
+    )]
+
+    has_more = len(docs) > limit
+    docs = docs[:limit]
+    if before:
+        docs.reverse()
+
+    # A cursor we paged from always has rows on its far side
+    headers = {}
+    has_older = bool(before) or has_more
+    has_newer = bool(after) or (bool(before) and has_more)
+    if docs and has_older:
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+    if docs and has_newer:
+        headers["X-Prev-Cursor"] = encode_cursor(docs[0]["created_at"], docs[0]["_id"])
+
+    if FAST_LIST_RESPONSES:
+        return FastJSONResponse(
+            [transaction_to_dict(transaction) for transaction in docs], headers=headers
         )
-        
-        # Create transaction record for recipient
-        recipient_transaction = {
-            "account_id": str(recipient["_id"]),
-            "amount": transaction.amount,
-            "transaction_type": TransactionType.DEPOSIT.value,
-            "description": f"Transfer from {account['account_number']}",
-            "balance_after": recipient["balance"] + transaction.amount,
-            "recipient_account": None,
-            "created_at": datetime.utcnow()
+    response.headers.update(headers)
+    return [_to_response(transaction) for transaction in docs]
+
+
+async def _export_lines(account_id: str, created_at: Optional[dict], export_format: str):
+    """Yield statement lines straight off the cursor, then a checksum footer"""
+    digest = hashlib.sha256()
+    rows = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    def csv_line(values: list) -> str:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow(values)
+        return buffer.getvalue()
+
+    if export_format == "csv":
+        line = csv_line(EXPORT_FIELDS)
+        digest.update(line.encode("utf-8"))
+        yield line
+
+    projection = {field: 1 for field in EXPORT_FIELDS if field != "id"}
+    # Archived months first, then the hot tier, all oldest first
+    async for transaction in archive.iter_history(
+        account_id, older=False, created_at=created_at, projection=projection,
+        batch_size=EXPORT_BATCH_SIZE
+    ):
+        row = {
+            "id": str(transaction["_id"]),
+            "created_at": transaction["created_at"].isoformat(),
+            "transaction_type": transaction["transaction_type"],
+            "amount": transaction["amount"],
+            "balance_after": transaction["balance_after"],
+            "description": transaction.get("description", ""),
+            "recipient_account": transaction.get("recipient_account"),
         }
-        await transactions_collection.insert_one(recipient_transaction)
-        
-        new_balance -= transaction.amount
-    
-    # Update source account balance
-    await accounts_collection.update_one(
-        {"_id": ObjectId(account_id)},
-        {"$set": {"balance": new_balance}}
+        if export_format == "csv":
+            line = csv_line([row[field] if row[field] is not None else "" for field in EXPORT_FIELDS])
+        else:
+            line = json.dumps(row, separators=(",", ":")) + "\n"
+        digest.update(line.encode("utf-8"))
+        rows += 1
+        yield line
+
+    # The checksum covers every byte before the footer
+    if export_format == "csv":
+        yield f"# rows={rows} sha256={digest.hexdigest()}\n"
+    else:
+        yield json.dumps({"footer": {"rows": rows, "sha256": digest.hexdigest()}}, separators=(",", ":")) + "\n"
+
+
+@router.get("/{account_id}/export")
+async def export_transactions(
+    account_id: str,
+    format: str = Query("csv", pattern="^(csv|ndjson)$"),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    current_user: dict = Depends(get_current_user)
+):
+    """Stream an account statement as CSV or NDJSON, oldest first"""
+    # Verify account ownership before the stream starts
+    account = await accounts_collection.find_one({
+        "_id": ObjectId(account_id),
+        "user_id": current_user["id"]
+    }, {"account_number": 1})
+
+    if not account:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Account not found"
+        )
+
+    # Stored times are naive UTC, and archived ones are compared in Python
+    if from_date and from_date.tzinfo is not None:
+        from_date = from_date.astimezone(timezone.utc).replace(tzinfo=None)
+    if to_date and to_date.tzinfo is not None:
+        to_date = to_date.astimezone(timezone.utc).replace(tzinfo=None)
+
+    created_at = {}
+    if from_date:
+        created_at["$gte"] = from_date
+    if to_date:
+        created_at["$lt"] = to_date
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"statement-{account['account_number']}.{format}"
+    return StreamingResponse(
+        _export_lines(account_id, created_at or None, format),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
-    
-    # Create transaction record
-    transaction_doc = {
-        "account_id": account_id,
-        "amount": transaction.amount,
-        "transaction_type": transaction.transaction_type.value,
-        "description": transaction.description or f"{transaction.transaction_type.value.title()}",
-        "balance_after": new_balance,
-        "recipient_account": transaction.recipient_account,
-        "created_at": datetime.utcnow()
+
+
+def _plan_summary(explained: dict) -> dict:
+    """Boil an explain() result down to the stages and indexes the winning plan used"""
+    planner = explained.get("queryPlanner", {})
+    plan = planner.get("winningPlan", {})
+    plan = plan.get("queryPlan", plan)  # Slot-based engine nests the classic plan
+    stages, indexes = [], []
+
+    def walk(node: dict):
+        stages.append(node.get("stage"))
+        if node.get("indexName"):
+            indexes.append(node["indexName"])
+        for child in node.get("inputStages", [node["inputStage"]] if "inputStage" in node else []):
+            walk(child)
+
+    walk(plan)
+    execution = explained.get("executionStats", {})
+    return {
+        "collscan": "COLLSCAN" in stages,
+        "stages": stages,
+        "indexes": indexes,
+        "keys_examined": execution.get("totalKeysExamined"),
+        "docs_examined": execution.get("totalDocsExamined"),
+        "returned": execution.get("nReturned"),
+        "execution_time_ms": execution.get("executionTimeMillis"),
     }
-    
-    result = await transactions_collection.insert_one(transaction_doc)
-    
-    return TransactionResponse(
-        id=str(result.inserted_id),
-        account_id=account_id,
-        amount=transaction.amount,
-        transaction_type=transaction.transaction_type,
-        description=transaction_doc["description"],
-        balance_after=new_balance,
-        recipient_account=transaction.recipient_account,
-        created_at=transaction_doc["created_at"]
-    )
 
 
-@router.get("/{account_id}", response_model=list[TransactionResponse])
-async def get_transactions(
+@router.get("/{account_id}/search", response_model=list[TransactionResponse])
+async def search_transactions(
     account_id: str,
-    limit: int = 50,
+    response: Response,
+    transaction_type: Optional[list[TransactionType]] = Query(None, alias="type"),
+    from_date: Optional[datetime] = Query(None, alias="from"),
+    to_date: Optional[datetime] = Query(None, alias="to"),
+    min_amount: Optional[float] = Query(None, ge=0),
+    max_amount: Optional[float] = Query(None, ge=0),
+    q: Optional[str] = Query(None, min_length=1, max_length=200),
+    limit: int = Query(50, ge=1, le=500),
+    after: Optional[str] = None,
+    explain: bool = False,
     current_user: dict = Depends(get_current_user)
 ):
-    """Get all transactions for an account"""
+    """Search an account's transactions, newest first.
+
+    Filters combine: type (repeatable), from/to dates, min_amount/max_amount
+    and q, a word search on the description. Page with `after` like the
+    list endpoint. With explain=true, returns the query plan instead of rows.
+    Only the hot tier is searched; archived months are available through
+    the list and export endpoints.
+    """
+    if from_date and to_date and from_date >= to_date:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="from must be before to"
+        )
+    if min_amount is not None and max_amount is not None and min_amount > max_amount:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="min_amount must not exceed max_amount"
+        )
+
     # Verify account ownership
     account = await accounts_collection.find_one({
         "_id": ObjectId(account_id),
         "user_id": current_user["id"]
-    })
-    
+    }, {"_id": 1})
+
     if not account:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Account not found"
         )
-    
-    transactions = []
-    cursor = transactions_collection.find(
-        {"account_id": account_id}
-    ).sort("created_at", -1).limit(limit)
-    
-    async for transaction in cursor:
-        transactions.append(TransactionResponse(
-            id=str(transaction["_id"]),
-            account_id=transaction["account_id"],
-            amount=transaction["amount"],
-            transaction_type=transaction["transaction_type"],
-            description=transaction["description"],
-            balance_after=transaction["balance_after"],
-            recipient_account=transaction.get("recipient_account"),
-            created_at=transaction["created_at"]
-        ))
-    
-    return transactions
+
+    # Equality fields first, then the created_at sort, then ranges, so each
+    # combination is served by (account_id[, transaction_type], created_at, _id);
+    # q goes through the (account_id, description) text index instead
+    query = {"account_id": account_id}
+    if transaction_type:
+        types = [t.value for t in dict.fromkeys(transaction_type)]
+        query["transaction_type"] = types[0] if len(types) == 1 else {"$in": types}
+    if from_date or to_date:
+        query["created_at"] = {}
+        if from_date:
+            query["created_at"]["$gte"] = from_date
+        if to_date:
+            query["created_at"]["$lt"] = to_date
+    if min_amount is not None or max_amount is not None:
+        query["amount"] = {}
+        if min_amount is not None:
+            query["amount"]["$gte"] = min_amount
+        if max_amount is not None:
+            query["amount"]["$lte"] = max_amount
+    if q:
+        query["$text"] = {"$search": q}
+    if after:
+        query.update(keyset_filter(after, older=True))
+
+    cursor = transactions_collection.find(query, TRANSACTION_PROJECTION).sort(
+        [("created_at", -1), ("_id", -1)]
+    ).limit(limit + 1)
+
+    if explain:
+        return FastJSONResponse(_plan_summary(await cursor.explain()))
+
+    docs = await cursor.to_list(length=limit + 1)
+    headers = {}
+    if len(docs) > limit:
+        docs = docs[:limit]
+        headers["X-Next-Cursor"] = encode_cursor(docs[-1]["created_at"], docs[-1]["_id"])
+
+    if FAST_LIST_RESPONSES:
+        return FastJSONResponse(
+            [transaction_to_dict(transaction) for transaction in docs], headers=headers
+        )
+    response.headers.update(headers)
+    return [_to_response(transaction) for transaction in docs]
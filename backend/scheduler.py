@@ -0,0 +1,311 @@
+"""Recurring bills: turns each due definition into a bill, autopaying it if asked.
+
+Every worker runs a Scheduler. It keeps a min-heap of the run times due
+within the next SCHEDULER_POLL_SECONDS, reloaded from recurring_bills on
+that interval, and sleeps until the earliest one. Definitions created in
+this worker are pushed onto the heap directly; those created elsewhere
+are picked up by the next reload.
+
+A definition runs SCHEDULER_BILL_LEAD_DAYS before each due date (due_at),
+so the bill is waiting for the user before it falls due. Autopay
+definitions run on the due date itself and pay the bill then.
+
+When woken it walks every due definition in _id order, SCHEDULER_BATCH_SIZE
+at a time. A batch is claimed by inserting one lease document per
+occurrence; leases another worker holds fail on the duplicate key and are
+left to it, and leases of a worker that died expire after
+SCHEDULER_LEASE_SECONDS. A claimed batch then costs a handful of writes
+whatever its size: one insert of the bills, one autopay transaction across
+all their accounts (ledger.autopay) and one bulk_write advancing the
+definitions.
+
+Re-running an occurrence is harmless: bills are unique per (definition,
+due date), autopay skips bills already paid, and a definition only
+advances from the run time it was claimed at.
+"""
+import os
+import asyncio
+import calendar
+import heapq
+import logging
+import socket
+import time
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from dotenv import load_dotenv
+
+from database import bills_collection, recurring_bills_collection, schedule_leases_collection
+from models import BillStatus, RecurrenceFrequency
+from metrics import counter, gauge
+import ledger
+
+load_dotenv()
+
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() in ("1", "true", "yes")
+SCHEDULER_POLL_SECONDS = float(os.getenv("SCHEDULER_POLL_SECONDS", 60))
+SCHEDULER_BATCH_SIZE = int(os.getenv("SCHEDULER_BATCH_SIZE", 500))
+SCHEDULER_LEASE_SECONDS = float(os.getenv("SCHEDULER_LEASE_SECONDS", 120))
+SCHEDULER_BILL_LEAD_DAYS = float(os.getenv("SCHEDULER_BILL_LEAD_DAYS", 7))
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+DUPLICATE_KEY = 11000
+
+logger = logging.getLogger(__name__)
+
+
+def _month_day(year: int, month: int, day: int, time_of: datetime) -> datetime:
+    # Day 31 becomes the last day of shorter months
+    day = min(day, calendar.monthrange(year, month)[1])
+    return time_of.replace(year=year, month=month, day=day)
+
+
+def next_occurrence(definition: dict, after: datetime) -> datetime:
+    """The run following the one at after"""
+    if definition["frequency"] == RecurrenceFrequency.WEEKLY.value:
+        return after + timedelta(weeks=1)
+    year, month = (after.year + 1, 1) if after.month == 12 else (after.year, after.month + 1)
+    return _month_day(year, month, definition["day_of_month"], after)
+
+
+def first_occurrence(definition: dict, start: datetime) -> datetime:
+    """The first run at or after start"""
+    if definition["frequency"] == RecurrenceFrequency.WEEKLY.value:
+        return start
+    run_at = _month_day(start.year, start.month, definition["day_of_month"], start)
+    return run_at if run_at >= start else next_occurrence(definition, run_at)
+
+
+def _lead(definition: dict) -> timedelta:
+    """How long before its due date a definition's bill is created"""
+    if definition.get("autopay_account_id"):
+        return timedelta(0)
+    return timedelta(days=SCHEDULER_BILL_LEAD_DAYS)
+
+
+def _due_at(definition: dict) -> datetime:
+    # Definitions stored before due_at existed ran on their due date
+    return definition.get("due_at", definition["next_run_at"])
+
+
+def _lease_id(definition: dict) -> str:
+    return f"{definition['_id']}:{definition['next_run_at'].isoformat()}"
+
+
+def _bill_doc(definition: dict, now: datetime) -> dict:
+    bill = {
+        "user_id": definition["user_id"],
+        "bill_type": definition["bill_type"],
+        "provider_name": definition["provider_name"],
+        "amount": definition["amount"],
+        "due_date": _due_at(definition),
+        "account_number": definition["account_number"],
+        "status": BillStatus.PENDING.value,
+        "paid_at": None,
+        "created_at": now,
+        "recurring_bill_id": str(definition["_id"]),
+    }
+    if definition.get("autopay_account_id"):
+        bill["autopay_account_id"] = definition["autopay_account_id"]
+    return bill
+
+
+def _failed_indexes(error: BulkWriteError) -> set[int]:
+    """Positions that failed on a duplicate key; anything else is re-raised"""
+    write_errors = error.details.get("writeErrors", [])
+    if any(e["code"] != DUPLICATE_KEY for e in write_errors):
+        raise error
+    return {e["index"] for e in write_errors}
+
+
+class Scheduler:
+    """Wakes on the earliest upcoming run time and executes due recurring bills"""
+
+    def __init__(self):
+        self._heap: list[tuple[datetime, str]] = []
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        self.runs = 0
+        self.bills_created = 0
+        self.autopaid = 0
+        self.autopay_failed = 0
+        self.last_run_seconds = 0.0
+
+    def start(self):
+        if SCHEDULER_ENABLED and self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def notify(self, run_at: datetime, definition_id: str):
+        """A definition in this worker now runs at run_at"""
+        if run_at <= datetime.utcnow() + timedelta(seconds=SCHEDULER_POLL_SECONDS):
+            heapq.heappush(self._heap, (run_at, definition_id))
+            self._wake.set()
+
+    async def _reload(self):
+        horizon = datetime.utcnow() + timedelta(seconds=SCHEDULER_POLL_SECONDS)
+        cursor = recurring_bills_collection.find({"next_run_at": {"$lte": horizon}}, {"next_run_at": 1})
+        self._heap = [(d["next_run_at"], str(d["_id"])) async for d in cursor]
+        heapq.heapify(self._heap)
+
+    async def _loop(self):
+        next_reload = 0.0
+        while True:
+            try:
+                if time.monotonic() >= next_reload:
+                    await self._reload()
+                    next_reload = time.monotonic() + SCHEDULER_POLL_SECONDS
+
+                now = datetime.utcnow()
+                if self._heap and self._heap[0][0] <= now:
+                    while self._heap and self._heap[0][0] <= now:
+                        heapq.heappop(self._heap)
+                    await self.run_due(now)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Scheduler run failed")
+
+            wait = next_reload - time.monotonic()
+            if self._heap:
+                wait = min(wait, (self._heap[0][0] - datetime.utcnow()).total_seconds())
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), max(wait, 0.0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def run_due(self, now: Optional[datetime] = None) -> dict:
+        """Execute every occurrence due at now that no other worker holds"""
+        now = now or datetime.utcnow()
+        started = time.perf_counter()
+        totals = {"claimed": 0, "bills": 0, "autopaid": 0, "autopay_failed": 0}
+        after = None
+        while True:
+            query = {"next_run_at": {"$lte": now}}
+            if after is not None:
+                query["_id"] = {"$gt": after}
+            due = await recurring_bills_collection.find(query).sort("_id", 1).limit(
+                SCHEDULER_BATCH_SIZE
+            ).to_list(length=None)
+            if not due:
+                break
+            after = due[-1]["_id"]
+
+            claimed = await self._claim(due)
+            if not claimed:
+                continue
+            try:
+                counts = await self._execute(claimed)
+            except Exception:
+                # Give the batch back so the next wake-up can retry it
+                await schedule_leases_collection.delete_many(
+                    {"_id": {"$in": [_lease_id(d) for d in claimed]}, "owner": WORKER_ID}
+                )
+                raise
+            for key, value in counts.items():
+                totals[key] += value
+            totals["claimed"] += len(claimed)
+
+        self.runs += 1
+        self.last_run_seconds = time.perf_counter() - started
+        return {**totals, "seconds": self.last_run_seconds}
+
+    async def _claim(self, due: list[dict]) -> list[dict]:
+        now = datetime.utcnow()
+        lease_ids = [_lease_id(definition) for definition in due]
+        # Leases left behind by a worker that died mid-run
+        await schedule_leases_collection.delete_many({"_id": {"$in": lease_ids}, "expires_at": {"$lt": now}})
+
+        expires_at = now + timedelta(seconds=SCHEDULER_LEASE_SECONDS)
+        try:
+            await schedule_leases_collection.insert_many(
+                [{"_id": lease_id, "owner": WORKER_ID, "expires_at": expires_at} for lease_id in lease_ids],
+                ordered=False
+            )
+            held_elsewhere = set()
+        except BulkWriteError as error:
+            held_elsewhere = _failed_indexes(error)
+        return [definition for i, definition in enumerate(due) if i not in held_elsewhere]
+
+    async def _execute(self, definitions: list[dict]) -> dict:
+        now = datetime.utcnow()
+        bills = [_bill_doc(definition, now) for definition in definitions]
+        try:
+            await bills_collection.insert_many(bills, ordered=False)
+            created = len(bills)
+        except BulkWriteError as error:
+            # Already created by an earlier, interrupted run
+            created = len(bills) - len(_failed_indexes(error))
+
+        paid, unpaid = [], {}
+        if any("autopay_account_id" in bill for bill in bills):
+            pending = await bills_collection.find({
+                "$or": [
+                    {"recurring_bill_id": bill["recurring_bill_id"], "due_date": bill["due_date"]}
+                    for bill in bills if "autopay_account_id" in bill
+                ],
+                "status": {"$ne": BillStatus.PAID.value},
+            }).to_list(length=None)
+            if pending:
+                paid, unpaid = await ledger.autopay(pending)
+            for reason in set(unpaid.values()):
+                await bills_collection.update_many(
+                    {"_id": {"$in": [b for b, r in unpaid.items() if r == reason]}},
+                    {"$set": {"autopay_error": reason}}
+                )
+
+        updates = []
+        for definition in definitions:
+            due_at = next_occurrence(definition, _due_at(definition))
+            run_at = due_at - _lead(definition)
+            updates.append(UpdateOne(
+                {"_id": definition["_id"], "next_run_at": definition["next_run_at"]},
+                {"$set": {"due_at": due_at, "next_run_at": run_at, "last_run_at": now}}
+            ))
+            self.notify(run_at, str(definition["_id"]))
+        await recurring_bills_collection.bulk_write(updates, ordered=False)
+
+        self.bills_created += created
+        self.autopaid += len(paid)
+        self.autopay_failed += len(unpaid)
+        return {"bills": created, "autopaid": len(paid), "autopay_failed": len(unpaid)}
+
+    def stats(self) -> dict:
+        return {
+            "scheduler_runs_total": counter("Scheduler wake-ups that ran due bills", self.runs),
+            "scheduler_bills_created_total": counter("Bills created from recurring bills", self.bills_created),
+            "scheduler_autopaid_total": counter("Recurring bills paid automatically", self.autopaid),
+            "scheduler_autopay_failed_total": counter("Automatic payments that failed", self.autopay_failed),
+            "scheduler_last_run_seconds": gauge("Duration of the last scheduler run", self.last_run_seconds),
+            "scheduler_heap_size": gauge("Run times queued for the next poll interval", len(self._heap)),
+        }
+
+
+scheduler = Scheduler()
+
+
+async def create_definition(definition: dict) -> dict:
+    """Store a recurring bill definition and schedule its first run.
+
+    start_date is the first due date. One in the past moves forward to the
+    first occurrence from now; missed occurrences are never billed.
+    """
+    due_at = first_occurrence(definition, definition.pop("start_date"))
+    now = datetime.utcnow()
+    while due_at < now:
+        due_at = next_occurrence(definition, due_at)
+    definition["due_at"] = due_at
+    # Within the lead time already, so the first bill is created right away
+    definition["next_run_at"] = max(due_at - _lead(definition), now)
+    definition["last_run_at"] = None
+    result = await recurring_bills_collection.insert_one(definition)
+    definition["_id"] = result.inserted_id
+    scheduler.notify(definition["next_run_at"], str(result.inserted_id))
+    return definition
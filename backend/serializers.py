@@ -0,0 +1,83 @@
+import os
+from datetime import datetime
+from typing import Any
+import orjson
+from fastapi import Response
+from dotenv import load_dotenv
+
+from models import BillStatus
+
+load_dotenv()
+
+# Opt-in: list endpoints skip per-row Pydantic models and response_model
+# re-validation, emitting the same JSON shape straight from the documents
+FAST_LIST_RESPONSES = os.getenv("FAST_LIST_RESPONSES", "false").lower() == "true"
+
+# Only the fields the response models need
+ACCOUNT_PROJECTION = {
+    "user_id": 1, "account_number": 1, "account_name": 1, "balance": 1, "created_at": 1
+}
+BILL_PROJECTION = {
+    "user_id": 1, "bill_type": 1, "provider_name": 1, "amount": 1, "due_date": 1,
+    "account_number": 1, "status": 1, "paid_at": 1, "created_at": 1,
+    "recurring_bill_id": 1, "autopay_error": 1
+}
+TRANSACTION_PROJECTION = {
+    "account_id": 1, "amount": 1, "transaction_type": 1, "description": 1,
+    "balance_after": 1, "recipient_account": 1, "created_at": 1
+}
+
+
+class FastJSONResponse(Response):
+    """JSON response rendered with orjson (datetimes become ISO strings natively)"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        return orjson.dumps(content)
+
+
+def account_to_dict(account: dict) -> dict:
+    """Mongo account document -> AccountResponse-shaped dict"""
+    return {
+        "id": str(account["_id"]),
+        "user_id": account["user_id"],
+        "account_number": account["account_number"],
+        "account_name": account["account_name"],
+        "balance": float(account["balance"]),
+        "created_at": account["created_at"],
+    }
+
+
+def bill_to_dict(bill: dict, now: datetime) -> dict:
+    """Mongo bill document -> BillResponse-shaped dict, reporting overdue bills"""
+    status = bill["status"]
+    if status == BillStatus.PENDING.value and bill["due_date"] < now:
+        status = BillStatus.OVERDUE.value
+    return {
+        "id": str(bill["_id"]),
+        "user_id": bill["user_id"],
+        "bill_type": bill["bill_type"],
+        "provider_name": bill["provider_name"],
+        "amount": float(bill["amount"]),
+        "due_date": bill["due_date"],
+        "account_number": bill["account_number"],
+        "status": status,
+        "paid_at": bill.get("paid_at"),
+        "created_at": bill["created_at"],
+        "recurring_bill_id": bill.get("recurring_bill_id"),
+        "autopay_error": bill.get("autopay_error"),
+    }
+
+
+def transaction_to_dict(transaction: dict) -> dict:
+    """Mongo transaction document -> TransactionResponse-shaped dict"""
+    return {
+        "id": str(transaction["_id"]),
+        "account_id": transaction["account_id"],
+        "amount": float(transaction["amount"]),
+        "transaction_type": transaction["transaction_type"],
+        "description": transaction["description"],
+        "balance_after": float(transaction["balance_after"]),
+        "recipient_account": transaction.get("recipient_account"),
+        "created_at": transaction["created_at"],
+    }
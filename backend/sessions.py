@@ -0,0 +1,175 @@
+"""Refresh-token sessions, so bcrypt only runs when a user actually signs in.
+
+Login starts a session and returns a short-lived access token (a JWT
+carrying the session id as "sid") plus an opaque refresh token. Only the
+SHA-256 of the refresh token is stored; /api/auth/refresh finds the
+session by that hash and rotates it in one find_one_and_update, so a
+refresh costs one indexed write and no password check. Sessions expire
+REFRESH_TOKEN_EXPIRE_DAYS after their last use via a TTL index.
+
+Presenting a refresh token that has already been rotated away means it
+was copied, so the session is revoked, unless it comes within
+REFRESH_REUSE_GRACE_SECONDS of the rotation. That is two tabs refreshing
+at once; the loser gets a 409 and picks up the tokens the winner stored.
+
+Revoking a session deletes it and lists its id in revoked_sessions until
+its last access token has expired. Every worker reloads that list each
+REVOCATION_SYNC_SECONDS and refuses access tokens carrying a listed sid,
+so a revoked session stops working everywhere within that interval.
+"""
+import os
+import time
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException, Request, status
+from pymongo import ReturnDocument
+from dotenv import load_dotenv
+
+from database import sessions_collection, revoked_sessions_collection
+from models import Token
+from auth import create_access_token, revoked_sessions, ACCESS_TOKEN_EXPIRE_MINUTES
+from rate_limit import client_ip
+from metrics import counter, gauge
+
+load_dotenv()
+
+REFRESH_TOKEN_EXPIRE_DAYS = float(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", 30))
+REFRESH_REUSE_GRACE_SECONDS = float(os.getenv("REFRESH_REUSE_GRACE_SECONDS", 10))
+REVOCATION_SYNC_SECONDS = float(os.getenv("REVOCATION_SYNC_SECONDS", 5))
+
+refreshes = 0
+reuse_detected = 0
+
+
+def _hash(refresh_token: str) -> str:
+    return hashlib.sha256(refresh_token.encode()).hexdigest()
+
+
+def _invalid_refresh_token(detail: str = "Invalid or expired refresh token") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def _tokens(session: dict, refresh_token: str) -> Token:
+    access_token = create_access_token(
+        data={"sub": session["user_id"], "sid": str(session["_id"])},
+        expires_delta=timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return Token(access_token=access_token, refresh_token=refresh_token, token_type="bearer")
+
+
+async def start_session(user_id: str, request: Request) -> Token:
+    """Open a session for a user who has just proved their password"""
+    refresh_token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    session = {
+        "user_id": user_id,
+        "token_hash": _hash(refresh_token),
+        "created_at": now,
+        "last_used_at": now,
+        "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+        "user_agent": (request.headers.get("user-agent") or "")[:256],
+        "ip": client_ip(request),
+    }
+    result = await sessions_collection.insert_one(session)
+    session["_id"] = result.inserted_id
+    return _tokens(session, refresh_token)
+
+
+async def refresh(refresh_token: str, request: Request) -> Token:
+    """Swap a refresh token for a new access token and a new refresh token"""
+    global refreshes, reuse_detected
+    token_hash = _hash(refresh_token)
+    replacement = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+
+    session = await sessions_collection.find_one_and_update(
+        {"token_hash": token_hash, "expires_at": {"$gt": now}},
+        {"$set": {
+            "token_hash": _hash(replacement),
+            "previous_hash": token_hash,
+            "rotated_at": now,
+            "last_used_at": now,
+            "expires_at": now + timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS),
+            "ip": client_ip(request),
+        }},
+        return_document=ReturnDocument.AFTER
+    )
+    if session is not None:
+        refreshes += 1
+        return _tokens(session, replacement)
+
+    rotated = await sessions_collection.find_one({"previous_hash": token_hash})
+    if rotated is None:
+        raise _invalid_refresh_token()
+    if now - rotated["rotated_at"] <= timedelta(seconds=REFRESH_REUSE_GRACE_SECONDS):
+        # Not a 401: the session is fine, and the client must not sign out over it
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Refresh token already used")
+    reuse_detected += 1
+    await revoke(rotated)
+    raise _invalid_refresh_token()
+
+
+async def revoke(session: dict):
+    """End a session and refuse the access tokens it has already handed out"""
+    session_id = str(session["_id"])
+    expires_at = datetime.utcnow() + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    await revoked_sessions_collection.update_one(
+        {"_id": session_id},
+        {"$set": {"user_id": session["user_id"], "expires_at": expires_at}},
+        upsert=True
+    )
+    await sessions_collection.delete_one({"_id": session["_id"]})
+    # This worker stops accepting them right away; the others at their next sync
+    revoked_sessions[session_id] = time.time() + ACCESS_TOKEN_EXPIRE_MINUTES * 60
+
+
+async def end_session(refresh_token: str):
+    """Log out: revoke the session behind a refresh token, if it's still live"""
+    session = await sessions_collection.find_one({"token_hash": _hash(refresh_token)})
+    if session is not None:
+        await revoke(session)
+
+
+async def find_session(session_id: str, user_id: str) -> dict:
+    """One of the user's sessions; 404 if it isn't theirs or doesn't exist"""
+    try:
+        session = await sessions_collection.find_one({"_id": ObjectId(session_id), "user_id": user_id})
+    except InvalidId:
+        session = None
+    if session is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
+    return session
+
+
+async def list_sessions(user_id: str) -> list[dict]:
+    """The user's live sessions, most recently used first"""
+    cursor = sessions_collection.find(
+        {"user_id": user_id, "expires_at": {"$gt": datetime.utcnow()}},
+        {"token_hash": 0, "previous_hash": 0}
+    ).sort("last_used_at", -1)
+    return await cursor.to_list(length=None)
+
+
+async def sync_revocations():
+    """Reload the revocation list; entries drop out once their tokens have expired"""
+    now = datetime.utcnow()
+    entries = {}
+    async for entry in revoked_sessions_collection.find({"expires_at": {"$gt": now}}, {"expires_at": 1}):
+        entries[entry["_id"]] = time.time() + (entry["expires_at"] - now).total_seconds()
+    revoked_sessions.clear()
+    revoked_sessions.update(entries)
+
+
+def stats() -> dict:
+    return {
+        "session_refreshes_total": counter("Refresh tokens exchanged", refreshes),
+        "session_refresh_reuse_total": counter("Rotated refresh tokens replayed, revoking their session", reuse_detected),
+        "session_revocations_listed": gauge("Revoked sessions whose access tokens are refused", len(revoked_sessions)),
+    }
@@ -0,0 +1,269 @@
+"""Fan-out of account and transaction changes to connected clients.
+
+Each worker runs one change stream on the database, filtered server-side to
+balance updates, new and deleted accounts and new transactions, and routes
+every change to the subscriptions of the user who owns the account. Idle
+subscribers cost a queue and nothing else: the change stream's awaitData
+getMore is the only query, however many clients are connected.
+
+Each subscription buffers a bounded number of events. When a slow client
+falls behind, the oldest events are dropped and it is sent a "resync" event
+so it can refetch instead of showing a partial history.
+
+A connection is opened with a ticket from POST /api/stream/ticket rather
+than the access token, so the token never appears in a URL. Tickets are
+single-use and live STREAM_TICKET_SECONDS; the stream they open ends when
+the access token behind it expires or its session is revoked, checked
+between batches and at every heartbeat.
+
+Change streams need a replica set; a single-node one is enough locally:
+
+    mongod --replSet rs0 && mongosh --eval "rs.initiate()"
+"""
+import os
+import asyncio
+import hashlib
+import logging
+import secrets
+import time
+from datetime import datetime, timedelta
+from collections import deque
+from typing import Optional
+import orjson
+from pymongo.errors import ConnectionFailure, PyMongoError
+from dotenv import load_dotenv
+
+from database import get_database, accounts_collection, stream_tickets_collection
+from auth import is_revoked
+from metrics import counter, gauge
+from serializers import account_to_dict, transaction_to_dict
+
+load_dotenv()
+
+STREAM_QUEUE_SIZE = int(os.getenv("STREAM_QUEUE_SIZE", 100))
+STREAM_HEARTBEAT_SECONDS = float(os.getenv("STREAM_HEARTBEAT_SECONDS", 15))
+STREAM_RETRY_SECONDS = float(os.getenv("STREAM_RETRY_SECONDS", 5))
+STREAM_TICKET_SECONDS = int(os.getenv("STREAM_TICKET_SECONDS", 30))
+
+logger = logging.getLogger(__name__)
+
+WATCH_PIPELINE = [
+    {"$match": {"$or": [
+        {"ns.coll": "transactions", "operationType": "insert"},
+        {"ns.coll": "accounts", "operationType": {"$in": ["insert", "delete"]}},
+        {
+            "ns.coll": "accounts",
+            "operationType": "update",
+            "updateDescription.updatedFields.balance": {"$exists": True}
+        },
+    ]}},
+    {"$project": {
+        "ns.coll": 1,
+        "operationType": 1,
+        "documentKey": 1,
+        "fullDocument": 1,
+        "updateDescription.updatedFields.balance": 1,
+    }},
+]
+
+
+def format_event(name: str, data: dict) -> bytes:
+    return b"event: " + name.encode() + b"\ndata: " + orjson.dumps(data) + b"\n\n"
+
+
+def _hash(ticket: str) -> str:
+    return hashlib.sha256(ticket.encode()).hexdigest()
+
+
+async def issue_ticket(user_id: str, payload: dict) -> str:
+    """A ticket standing in for the access token whose payload is given"""
+    ticket = secrets.token_urlsafe(32)
+    await stream_tickets_collection.insert_one({
+        "_id": _hash(ticket),
+        "user_id": user_id,
+        "sid": payload.get("sid"),
+        "exp": payload.get("exp"),
+        "expires_at": datetime.utcnow() + timedelta(seconds=STREAM_TICKET_SECONDS),
+    })
+    return ticket
+
+
+async def redeem_ticket(ticket: str) -> Optional[dict]:
+    """The ticket's grant (user_id, sid, exp), deleting it; None if unknown or expired"""
+    grant = await stream_tickets_collection.find_one_and_delete(
+        {"_id": _hash(ticket), "expires_at": {"$gt": datetime.utcnow()}}
+    )
+    if grant is None or not still_valid(grant):
+        return None
+    return grant
+
+
+def still_valid(grant: dict) -> bool:
+    """Whether the access token a stream was opened with would still be accepted"""
+    exp = grant.get("exp")
+    if exp is not None and exp <= time.time():
+        return False
+    return not is_revoked(grant.get("sid"))
+
+
+class Subscription:
+    """One client's bounded event buffer; the oldest events go first when full"""
+
+    def __init__(self, user_id: str, max_size: int = STREAM_QUEUE_SIZE):
+        self.user_id = user_id
+        self._events: deque = deque(maxlen=max_size)
+        self._ready = asyncio.Event()
+        self._overflowed = False
+        self.dropped = 0
+
+    def push(self, name: str, data: dict):
+        if len(self._events) == self._events.maxlen:
+            self.dropped += 1
+            self._overflowed = True
+        self._events.append((name, data))
+        self._ready.set()
+
+    async def next_batch(self, timeout: float) -> list[tuple[str, dict]]:
+        """Everything buffered, waiting up to timeout; [] means nothing arrived"""
+        if not self._events:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return []
+
+        events = list(self._events)
+        self._events.clear()
+        if self._overflowed:
+            self._overflowed = False
+            events.insert(0, ("resync", {"dropped": self.dropped}))
+        return events
+
+
+class ChangeFeed:
+    """The worker's change stream and the subscriptions it feeds"""
+
+    def __init__(self):
+        self._subscriptions: dict[str, set[Subscription]] = {}
+        self._accounts: dict[str, set[str]] = {}  # user id -> account ids
+        self._owners: dict[str, str] = {}  # account id -> user id
+        self._task: Optional[asyncio.Task] = None
+        self._resume_token = None
+        self.events_dispatched = 0
+        self.dropped = 0
+
+    async def subscribe(self, user_id: str) -> Subscription:
+        subscription = Subscription(user_id)
+        first = user_id not in self._subscriptions
+        # Registered before the lookup so a concurrent unsubscribe for the
+        # same user can't empty the set and drop the accounts mid-load
+        self._subscriptions.setdefault(user_id, set()).add(subscription)
+        if first:
+            self._accounts[user_id] = set()
+            try:
+                async for account in accounts_collection.find({"user_id": user_id}, {"_id": 1}):
+                    self._own(user_id, str(account["_id"]))
+            except BaseException:
+                # Including cancellation when the client goes away mid-lookup
+                self.unsubscribe(subscription)
+                raise
+
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._watch())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        self.dropped += subscription.dropped
+        subscriptions = self._subscriptions.get(subscription.user_id)
+        if subscriptions is None:
+            return
+        subscriptions.discard(subscription)
+        if not subscriptions:
+            self._subscriptions.pop(subscription.user_id, None)
+            for account_id in self._accounts.pop(subscription.user_id, ()):
+                self._owners.pop(account_id, None)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def _own(self, user_id: str, account_id: str):
+        self._accounts[user_id].add(account_id)
+        self._owners[account_id] = user_id
+
+    def _publish(self, user_id: str, name: str, data: dict):
+        for subscription in self._subscriptions.get(user_id, ()):
+            subscription.push(name, data)
+        self.events_dispatched += 1
+
+    def _publish_all(self, name: str, data: dict):
+        for user_id in self._subscriptions:
+            self._publish(user_id, name, data)
+
+    def dispatch(self, change: dict):
+        collection = change["ns"]["coll"]
+        operation = change["operationType"]
+
+        if collection == "transactions":
+            transaction = change["fullDocument"]
+            user_id = self._owners.get(transaction["account_id"])
+            if user_id:
+                self._publish(user_id, "transaction", transaction_to_dict(transaction))
+            return
+
+        if operation == "insert":
+            account = change["fullDocument"]
+            if account["user_id"] in self._subscriptions:
+                self._own(account["user_id"], str(account["_id"]))
+                self._publish(account["user_id"], "account", account_to_dict(account))
+            return
+
+        account_id = str(change["documentKey"]["_id"])
+        user_id = self._owners.get(account_id)
+        if not user_id:
+            return
+        if operation == "delete":
+            self._owners.pop(account_id, None)
+            self._accounts[user_id].discard(account_id)
+            self._publish(user_id, "account_deleted", {"id": account_id})
+        else:
+            balance = change["updateDescription"]["updatedFields"]["balance"]
+            self._publish(user_id, "balance", {"account_id": account_id, "balance": float(balance)})
+
+    async def _watch(self):
+        while True:
+            try:
+                async with get_database().watch(
+                    WATCH_PIPELINE, resume_after=self._resume_token
+                ) as changes:
+                    async for change in changes:
+                        self._resume_token = changes.resume_token
+                        self.dispatch(change)
+            except asyncio.CancelledError:
+                raise
+            except ConnectionFailure:
+                # The resume token still covers everything since the last event
+                logger.warning("Change stream lost its connection, resuming")
+            except PyMongoError:
+                # e.g. the token fell off the oplog; start fresh and have clients refetch
+                logger.exception("Change stream failed, restarting")
+                self._resume_token = None
+                self._publish_all("resync", {"dropped": 0})
+            await asyncio.sleep(STREAM_RETRY_SECONDS)
+
+    def stats(self) -> dict:
+        subscriptions = [s for group in self._subscriptions.values() for s in group]
+        return {
+            "stream_subscribers": gauge("Open event streams", len(subscriptions)),
+            "stream_users": gauge("Users with an open event stream", len(self._subscriptions)),
+            "stream_events_dispatched_total": counter("Change events routed to users", self.events_dispatched),
+            "stream_events_dropped_total": counter(
+                "Events dropped from full subscriber buffers",
+                self.dropped + sum(s.dropped for s in subscriptions)
+            ),
+        }
+
+
+change_feed = ChangeFeed()
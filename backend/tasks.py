@@ -0,0 +1,100 @@
+"""Periodic background jobs run by every worker.
+
+Jobs that work on shared data (the overdue sweep, checkpoints, archiving
+and accrual) run under a lease in schedule_leases, the collection the
+recurring bill scheduler uses: the worker that takes a job's lease runs it
+and holds the lease for the job's interval, and the others skip it until
+the lease ends. So each runs once per interval however many workers there
+are. Per-worker jobs (index sync, the revocation list) run everywhere.
+"""
+import os
+import asyncio
+import logging
+from datetime import datetime, timedelta
+from typing import Optional
+from pymongo.errors import DuplicateKeyError
+from dotenv import load_dotenv
+
+from database import bills_collection, schedule_leases_collection
+from models import BillStatus
+from checkpoints import run_checkpoints, CHECKPOINT_INTERVAL_SECONDS
+from archive import run_archive, ARCHIVE_INTERVAL_SECONDS
+from indexes import sync_in_background, INDEX_SYNC_ON_STARTUP
+from sessions import sync_revocations, REVOCATION_SYNC_SECONDS
+from accrual import run_accruals, ACCRUAL_INTERVAL_SECONDS
+from scheduler import WORKER_ID
+
+load_dotenv()
+
+OVERDUE_SWEEP_INTERVAL_SECONDS = float(os.getenv("OVERDUE_SWEEP_INTERVAL_SECONDS", 300))
+
+logger = logging.getLogger(__name__)
+
+
+async def sweep_overdue_bills() -> int:
+    """Flip every pending bill past its due date to overdue in one update"""
+    result = await bills_collection.update_many(
+        {"status": BillStatus.PENDING.value, "due_date": {"$lt": datetime.utcnow()}},
+        {"$set": {"status": BillStatus.OVERDUE.value}}
+    )
+    return result.modified_count
+
+
+async def claim_lease(name: str, seconds: float) -> float:
+    """Take a job's lease for seconds; returns 0 if taken, else seconds until the holder's ends"""
+    now = datetime.utcnow()
+    lease_id = f"job:{name}"
+    try:
+        await schedule_leases_collection.update_one(
+            {"_id": lease_id, "expires_at": {"$lte": now}},
+            {"$set": {"owner": WORKER_ID, "expires_at": now + timedelta(seconds=seconds)}},
+            upsert=True
+        )
+        return 0.0
+    except DuplicateKeyError:
+        # Held by a worker whose lease hasn't run out
+        lease = await schedule_leases_collection.find_one({"_id": lease_id}, {"expires_at": 1})
+        if lease is None:
+            return 1.0
+        return max((lease["expires_at"] - now).total_seconds(), 1.0)
+
+
+async def run_periodically(job, interval: float, lease: bool = False):
+    """Run job() every interval seconds until cancelled, surviving failures.
+
+    With lease, only the worker holding the job's lease runs it each interval.
+    """
+    while True:
+        wait: Optional[float] = None
+        try:
+            held = await claim_lease(job.__name__, interval) if lease else 0.0
+            if held:
+                wait = held
+            else:
+                await job()
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            logger.exception("Background job %s failed", job.__name__)
+        await asyncio.sleep(interval if wait is None else wait)
+
+
+def start_background_tasks() -> list[asyncio.Task]:
+    """Start the periodic jobs; called from the app lifespan"""
+    tasks = []
+    if INDEX_SYNC_ON_STARTUP == "background":
+        tasks.append(asyncio.create_task(sync_in_background()))
+    return tasks + [
+        asyncio.create_task(run_periodically(sweep_overdue_bills, OVERDUE_SWEEP_INTERVAL_SECONDS, lease=True)),
+        asyncio.create_task(run_periodically(run_checkpoints, CHECKPOINT_INTERVAL_SECONDS, lease=True)),
+        asyncio.create_task(run_periodically(run_archive, ARCHIVE_INTERVAL_SECONDS, lease=True)),
+        asyncio.create_task(run_periodically(sync_revocations, REVOCATION_SYNC_SECONDS)),
+        asyncio.create_task(run_periodically(run_accruals, ACCRUAL_INTERVAL_SECONDS, lease=True)),
+    ]
+
+
+async def stop_background_tasks(tasks: list[asyncio.Task]):
+    """Cancel the periodic jobs and wait for them to finish"""
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,85 @@
+"""Fixtures running the API against the in-memory stand-in (benchmarks.inmemory).
+
+From the backend directory:
+
+    pip install -r tests/requirements.txt
+    python -m pytest tests
+
+The stand-in undoes the writes of a ledger operation that fails, but it
+only imitates a transaction. To run the same tests on real session
+transactions, point TEST_MONGODB_URI at a replica set; each test starts
+from an empty copy of the database it names:
+
+    TEST_MONGODB_URI=mongodb://localhost:27017/banking_test?replicaSet=rs0 python -m pytest tests
+"""
+import os
+
+os.environ.setdefault("SECRET_KEY", "test-secret")
+os.environ.setdefault("BCRYPT_ROUNDS", "4")
+os.environ.setdefault("RATE_LIMIT_ENABLED", "false")
+os.environ.setdefault("SCHEDULER_ENABLED", "false")
+
+TEST_MONGODB_URI = os.getenv("TEST_MONGODB_URI")
+
+import httpx
+import pytest
+
+from benchmarks import inmemory
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def client():
+    """An API client on a fresh database"""
+    import database
+    import main
+    import indexes
+
+    if TEST_MONGODB_URI:
+        database.close()
+        database.MONGODB_URI = TEST_MONGODB_URI
+        await database.get_client().drop_database(database.get_database().name)
+    else:
+        inmemory.install(transactions=True)
+
+    await indexes.ensure_indexes()
+    transport = httpx.ASGITransport(app=main.app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            yield client
+    finally:
+        # A Motor client belongs to the event loop of the test that created it
+        database.close()
+
+
+@pytest.fixture
+async def headers(client):
+    """Authorization headers for a newly registered user"""
+    user = {"email": "owner@example.com", "password": "password123", "full_name": "Account Owner"}
+    await client.post("/api/auth/register", json=user)
+    response = await client.post("/api/auth/login/json", json={"email": user["email"], "password": user["password"]})
+    return {"Authorization": f"Bearer {response.json()['access_token']}"}
+
+
+@pytest.fixture
+def open_account(client, headers):
+    """Opens an account for the user, optionally funded with a deposit"""
+    async def open_account(name: str = "Checking", deposit: float = 0) -> dict:
+        account = (await client.post("/api/accounts/", json={"account_name": name}, headers=headers)).json()
+        if deposit:
+            await client.post(
+                f"/api/transactions/{account['id']}",
+                json={"amount": deposit, "transaction_type": "deposit"},
+                headers=headers
+            )
+        return account
+
+    return open_account
+
+
+async def balance(client, headers, account_id: str) -> float:
+    return (await client.get(f"/api/accounts/{account_id}", headers=headers)).json()["balance"]
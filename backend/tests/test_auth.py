@@ -0,0 +1,26 @@
+import pytest
+from bson import ObjectId
+
+import auth
+from database import users_collection
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_changed_user_is_reloaded_after_invalidation(client, headers):
+    me = (await client.get("/api/me", headers=headers)).json()
+    await users_collection.update_one({"_id": ObjectId(me["id"])}, {"$set": {"full_name": "Renamed Owner"}})
+
+    # Served from the cache until the change is announced
+    assert (await client.get("/api/me", headers=headers)).json()["full_name"] == "Account Owner"
+    auth.invalidate_user(me["id"])
+
+    assert (await client.get("/api/me", headers=headers)).json()["full_name"] == "Renamed Owner"
+
+
+async def test_deleted_user_is_refused_after_invalidation(client, headers):
+    me = (await client.get("/api/me", headers=headers)).json()
+    await users_collection.delete_one({"_id": ObjectId(me["id"])})
+    auth.invalidate_user(me["id"])
+
+    assert (await client.get("/api/me", headers=headers)).status_code == 401
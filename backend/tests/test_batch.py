@@ -0,0 +1,65 @@
+import pytest
+
+from tests.conftest import balance
+
+pytestmark = pytest.mark.anyio
+
+
+def _items(account_id: str) -> list[dict]:
+    return [
+        {"account_id": account_id, "amount": 10, "transaction_type": "deposit"},
+        {"account_id": account_id, "amount": 1000, "transaction_type": "withdrawal"},
+        {"account_id": account_id, "amount": 5, "transaction_type": "deposit"},
+    ]
+
+
+async def test_ordered_batch_skips_items_after_a_failure(client, headers, open_account):
+    account = await open_account(deposit=50)
+
+    response = await client.post(
+        "/api/transactions/batch", json={"transactions": _items(account["id"])}, headers=headers
+    )
+
+    body = response.json()
+    assert response.status_code == 200
+    assert [r["status"] for r in body["results"]] == ["applied", "failed", "skipped"]
+    assert body["results"][1]["error"] == "Insufficient funds"
+    assert (body["applied"], body["failed"], body["skipped"]) == (1, 1, 1)
+    assert body["results"][0]["transaction"]["balance_after"] == 60
+    assert await balance(client, headers, account["id"]) == 60
+
+
+async def test_unordered_batch_applies_everything_that_passes(client, headers, open_account):
+    account = await open_account(deposit=50)
+
+    response = await client.post(
+        "/api/transactions/batch",
+        json={"transactions": _items(account["id"]), "ordered": False},
+        headers=headers
+    )
+
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["applied", "failed", "applied"]
+    assert [r["transaction"]["balance_after"] for r in body["results"] if r["transaction"]] == [60, 65]
+    assert await balance(client, headers, account["id"]) == 65
+
+
+async def test_batch_transfer_credits_the_recipient(client, headers, open_account):
+    sender = await open_account("Checking", deposit=100)
+    recipient = await open_account("Savings")
+
+    response = await client.post(
+        "/api/transactions/batch",
+        json={"transactions": [{
+            "account_id": sender["id"],
+            "amount": 40,
+            "transaction_type": "transfer",
+            "recipient_account": recipient["account_number"],
+        }]},
+        headers=headers
+    )
+
+    assert response.json()["results"][0]["transaction"]["balance_after"] == 60
+    received = (await client.get(f"/api/transactions/{recipient['id']}", headers=headers)).json()[0]
+    assert received["balance_after"] == 40
+    assert await balance(client, headers, recipient["id"]) == 40
@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+import idempotency
+from tests.conftest import balance
+
+pytestmark = pytest.mark.anyio
+
+WITHDRAWAL = {"amount": 25, "transaction_type": "withdrawal", "description": "Rent"}
+
+
+async def _history(client, headers, account_id: str) -> list[dict]:
+    return (await client.get(f"/api/transactions/{account_id}", headers=headers)).json()
+
+
+@pytest.mark.parametrize("from_database", [False, True])
+async def test_retry_replays_the_original_response(client, headers, open_account, from_database):
+    account = await open_account(deposit=100)
+    keyed = {**headers, "Idempotency-Key": "withdraw-1"}
+
+    first = await client.post(f"/api/transactions/{account['id']}", json=WITHDRAWAL, headers=keyed)
+    if from_database:
+        # As if the retry reached another worker
+        idempotency._recent.clear()
+    retry = await client.post(f"/api/transactions/{account['id']}", json=WITHDRAWAL, headers=keyed)
+
+    assert first.status_code == retry.status_code == 201
+    assert retry.json() == first.json()
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert await balance(client, headers, account["id"]) == 75
+    assert len(await _history(client, headers, account["id"])) == 2
+
+
+async def test_concurrent_duplicates_execute_once(client, headers, open_account):
+    account = await open_account(deposit=100)
+    keyed = {**headers, "Idempotency-Key": "withdraw-2"}
+
+    responses = await asyncio.gather(*(
+        client.post(f"/api/transactions/{account['id']}", json=WITHDRAWAL, headers=keyed) for _ in range(5)
+    ))
+
+    assert {r.status_code for r in responses} == {201}
+    assert len({r.json()["id"] for r in responses}) == 1
+    assert await balance(client, headers, account["id"]) == 75
+
+
+async def test_key_reused_for_a_different_request_is_rejected(client, headers, open_account):
+    account = await open_account(deposit=100)
+    keyed = {**headers, "Idempotency-Key": "withdraw-3"}
+
+    await client.post(f"/api/transactions/{account['id']}", json=WITHDRAWAL, headers=keyed)
+    reused = await client.post(
+        f"/api/transactions/{account['id']}", json={**WITHDRAWAL, "amount": 50}, headers=keyed
+    )
+
+    assert reused.status_code == 422
+    assert reused.json()["detail"] == "Idempotency-Key was already used for a different request"
+    assert await balance(client, headers, account["id"]) == 75
+
+
+async def test_failed_request_frees_its_key(client, headers, open_account):
+    account = await open_account(deposit=10)
+    keyed = {**headers, "Idempotency-Key": "withdraw-4"}
+
+    rejected = await client.post(f"/api/transactions/{account['id']}", json=WITHDRAWAL, headers=keyed)
+    await client.post(
+        f"/api/transactions/{account['id']}", json={"amount": 50, "transaction_type": "deposit"}, headers=headers
+    )
+    retry = await client.post(f"/api/transactions/{account['id']}", json=WITHDRAWAL, headers=keyed)
+
+    assert rejected.status_code == 400
+    assert retry.status_code == 201
+    assert await balance(client, headers, account["id"]) == 35
+
+
+async def test_bill_payment_retry_pays_once(client, headers, open_account):
+    account = await open_account(deposit=100)
+    bill = (await client.post("/api/bills/", json={
+        "bill_type": "electricity",
+        "provider_name": "Power Co",
+        "amount": 40,
+        "due_date": "2026-11-01T00:00:00",
+        "account_number": "PC-1",
+    }, headers=headers)).json()
+    keyed = {**headers, "Idempotency-Key": "bill-1"}
+    payment = {"bill_id": bill["id"], "from_account_id": account["id"]}
+
+    first = await client.post("/api/bills/pay", json=payment, headers=keyed)
+    retry = await client.post("/api/bills/pay", json=payment, headers=keyed)
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert await balance(client, headers, account["id"]) == 60
@@ -0,0 +1,97 @@
+import pytest
+
+from tests.conftest import balance
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_overdraw_is_rejected_without_writing(client, headers, open_account):
+    account = await open_account(deposit=50)
+
+    response = await client.post(
+        f"/api/transactions/{account['id']}",
+        json={"amount": 80, "transaction_type": "withdrawal"},
+        headers=headers
+    )
+
+    assert response.status_code == 400
+    assert await balance(client, headers, account["id"]) == 50
+    history = (await client.get(f"/api/transactions/{account['id']}", headers=headers)).json()
+    assert [t["transaction_type"] for t in history] == ["deposit"]
+
+
+async def test_transfer_records_balance_after_on_both_legs(client, headers, open_account):
+    sender = await open_account("Checking", deposit=100)
+    recipient = await open_account("Savings", deposit=20)
+
+    response = await client.post(
+        f"/api/transactions/{sender['id']}",
+        json={"amount": 30, "transaction_type": "transfer", "recipient_account": recipient["account_number"]},
+        headers=headers
+    )
+
+    assert response.status_code == 201
+    assert response.json()["balance_after"] == 70
+    received = (await client.get(f"/api/transactions/{recipient['id']}", headers=headers)).json()[0]
+    assert received["amount"] == 30
+    assert received["balance_after"] == 50
+    assert await balance(client, headers, sender["id"]) == 70
+    assert await balance(client, headers, recipient["id"]) == 50
+
+
+async def test_transfer_to_unknown_account_rolls_back_the_debit(client, headers, open_account):
+    sender = await open_account(deposit=100)
+
+    response = await client.post(
+        f"/api/transactions/{sender['id']}",
+        json={"amount": 30, "transaction_type": "transfer", "recipient_account": "0000000000"},
+        headers=headers
+    )
+
+    assert response.status_code == 404
+    assert await balance(client, headers, sender["id"]) == 100
+    assert len((await client.get(f"/api/transactions/{sender['id']}", headers=headers)).json()) == 1
+
+
+async def test_failed_bill_debit_leaves_the_bill_unpaid(client, headers, open_account):
+    account = await open_account(deposit=10)
+    bill = (await client.post("/api/bills/", json={
+        "bill_type": "internet",
+        "provider_name": "Net Co",
+        "amount": 40,
+        "due_date": "2026-11-01T00:00:00",
+        "account_number": "NC-1",
+    }, headers=headers)).json()
+
+    # The bill is claimed as paid before the debit turns out to be short
+    response = await client.post(
+        "/api/bills/pay", json={"bill_id": bill["id"], "from_account_id": account["id"]}, headers=headers
+    )
+
+    assert response.status_code == 400
+    bills = (await client.get("/api/bills/", headers=headers)).json()
+    assert [(b["status"], b["paid_at"]) for b in bills] == [("pending", None)]
+    assert await balance(client, headers, account["id"]) == 10
+
+
+async def test_failed_batch_payment_pays_none_of_the_bills(client, headers, open_account):
+    account = await open_account(deposit=50)
+    ids = []
+    for amount, due_date in ((30, "2026-11-01T00:00:00"), (40, "2026-12-01T00:00:00")):
+        bill = (await client.post("/api/bills/", json={
+            "bill_type": "water",
+            "provider_name": "Water Co",
+            "amount": amount,
+            "due_date": due_date,
+            "account_number": "WC-1",
+        }, headers=headers)).json()
+        ids.append(bill["id"])
+
+    response = await client.post(
+        "/api/bills/pay/batch", json={"bill_ids": ids, "from_account_id": account["id"]}, headers=headers
+    )
+
+    assert response.status_code == 400
+    bills = (await client.get("/api/bills/", headers=headers)).json()
+    assert {b["status"] for b in bills} == {"pending"}
+    assert await balance(client, headers, account["id"]) == 50
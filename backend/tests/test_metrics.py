@@ -0,0 +1,26 @@
+import pytest
+
+import metrics
+
+pytestmark = pytest.mark.anyio
+
+
+def test_label_values_are_escaped():
+    failures = metrics.Counter("checkout_failures_total", "Failed checkouts", ("reason",))
+    failures.inc('pool "main"\\closed\nnow')
+
+    assert failures.render()[-1] == 'checkout_failures_total{reason="pool \\"main\\"\\\\closed\\nnow"} 1'
+
+
+async def test_collectors_export_help_and_type(client):
+    body = (await client.get("/metrics")).text
+
+    assert "# HELP scheduler_runs_total Scheduler wake-ups that ran due bills\n# TYPE scheduler_runs_total counter\n" in body
+    assert "# TYPE stream_subscribers gauge\n" in body
+    assert "# TYPE auth_login_rate_limited_total counter\n" in body
+    # Every sample is preceded by its metric's HELP and TYPE
+    described = {line.split()[2] for line in body.splitlines() if line.startswith("# TYPE")}
+    for line in body.splitlines():
+        if line and not line.startswith("#"):
+            name = line.split("{")[0].split()[0]
+            assert any(name == d or name.startswith(d + "_") for d in described), name
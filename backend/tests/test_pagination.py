@@ -0,0 +1,26 @@
+import pytest
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cursors_page_through_history_both_ways(client, headers, open_account):
+    account = await open_account()
+    for amount in range(1, 6):
+        await client.post(
+            f"/api/transactions/{account['id']}",
+            json={"amount": amount, "transaction_type": "deposit"},
+            headers=headers
+        )
+    url = f"/api/transactions/{account['id']}"
+
+    first = await client.get(url, params={"limit": 2}, headers=headers)
+    second = await client.get(url, params={"limit": 2, "after": first.headers["X-Next-Cursor"]}, headers=headers)
+    last = await client.get(url, params={"limit": 2, "after": second.headers["X-Next-Cursor"]}, headers=headers)
+    back = await client.get(url, params={"limit": 2, "before": second.headers["X-Prev-Cursor"]}, headers=headers)
+
+    assert [t["amount"] for t in first.json()] == [5, 4]
+    assert "X-Prev-Cursor" not in first.headers
+    assert [t["amount"] for t in second.json()] == [3, 2]
+    assert [t["amount"] for t in last.json()] == [1]
+    assert "X-Next-Cursor" not in last.headers
+    assert back.json() == first.json()
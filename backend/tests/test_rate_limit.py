@@ -0,0 +1,42 @@
+import pytest
+from fastapi import HTTPException
+from starlette.requests import Request
+
+import rate_limit
+from rate_limit import RoutePolicy
+
+
+def _request(ip: str) -> Request:
+    return Request({"type": "http", "headers": [], "client": (ip, 1234)})
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(rate_limit, "RATE_LIMIT_ENABLED", True)
+
+
+def test_throttled_email_does_not_spend_ip_tokens():
+    policy = RoutePolicy("login", "3/60", "1/60", 1)
+    request = _request("10.0.0.1")
+
+    policy.check(request, "victim@example.com")
+    for _ in range(5):
+        with pytest.raises(HTTPException) as raised:
+            policy.check(request, "victim@example.com")
+        assert raised.value.status_code == 429
+
+    # The IP still has the two tokens the rejected attempts didn't keep
+    policy.check(request, "first@example.com")
+    policy.check(request, "second@example.com")
+    with pytest.raises(HTTPException):
+        policy.check(request, "third@example.com")
+
+
+def test_throttled_ip_does_not_spend_email_tokens():
+    policy = RoutePolicy("login", "1/60", "2/60", 1)
+
+    policy.check(_request("10.0.0.1"), "user@example.com")
+    with pytest.raises(HTTPException):
+        policy.check(_request("10.0.0.1"), "user@example.com")
+
+    policy.check(_request("10.0.0.2"), "user@example.com")
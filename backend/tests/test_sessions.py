@@ -0,0 +1,43 @@
+import pytest
+
+import auth
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_logout_signs_out_and_drops_the_cached_token(client, headers):
+    login = await client.post("/api/auth/login/json", json={"email": "owner@example.com", "password": "password123"})
+    token, refresh_token = login.json()["access_token"], login.json()["refresh_token"]
+    signed_in = {"Authorization": f"Bearer {token}"}
+    assert (await client.get("/api/me", headers=signed_in)).status_code == 200
+    assert auth.token_cache.get(token) is not None
+
+    response = await client.post("/api/auth/logout", json={"refresh_token": refresh_token}, headers=signed_in)
+
+    assert response.status_code == 204
+    assert auth.token_cache.get(token) is None
+    assert (await client.get("/api/me", headers=signed_in)).status_code == 401
+
+
+async def test_revoking_the_current_session_drops_the_cached_token(client, headers):
+    token = headers["Authorization"].removeprefix("Bearer ")
+    current = [s for s in (await client.get("/api/auth/sessions", headers=headers)).json() if s["current"]][0]
+
+    response = await client.delete(f"/api/auth/sessions/{current['id']}", headers=headers)
+
+    assert response.status_code == 204
+    assert auth.token_cache.get(token) is None
+    assert (await client.get("/api/me", headers=headers)).status_code == 401
+
+
+async def test_reused_refresh_token_in_grace_window_conflicts(client, headers):
+    login = await client.post("/api/auth/login/json", json={"email": "owner@example.com", "password": "password123"})
+    refresh_token = login.json()["refresh_token"]
+
+    first = await client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+    second = await client.post("/api/auth/refresh", json={"refresh_token": refresh_token})
+
+    assert first.status_code == 200
+    assert second.status_code == 409
+    rotated = {"Authorization": f"Bearer {first.json()['access_token']}"}
+    assert (await client.get("/api/me", headers=rotated)).status_code == 200
@@ -0,0 +1,43 @@
+import pytest
+from pymongo.errors import PyMongoError
+
+import stream
+from stream import ChangeFeed
+
+pytestmark = pytest.mark.anyio
+
+
+class FailingAccounts:
+    def find(self, *args, **kwargs):
+        raise PyMongoError("lookup failed")
+
+
+async def test_failed_account_lookup_leaves_no_subscription(client, monkeypatch):
+    feed = ChangeFeed()
+    monkeypatch.setattr(stream, "accounts_collection", FailingAccounts())
+
+    with pytest.raises(PyMongoError):
+        await feed.subscribe("user-1")
+
+    assert feed._subscriptions == {}
+    assert feed._accounts == {}
+
+
+async def test_unsubscribe_twice_is_harmless(client, headers, open_account):
+    feed = ChangeFeed()
+    account = await open_account()
+    user_id = account["user_id"]
+    try:
+        first = await feed.subscribe(user_id)
+        second = await feed.subscribe(user_id)
+        assert feed._owners == {account["id"]: user_id}
+
+        feed.unsubscribe(first)
+        feed.unsubscribe(first)
+        assert feed._subscriptions[user_id] == {second}
+
+        feed.unsubscribe(second)
+        feed.unsubscribe(second)
+        assert feed._subscriptions == {} and feed._owners == {}
+    finally:
+        await feed.stop()
@@ -0,0 +1,40 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+import tasks
+from database import schedule_leases_collection
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_one_worker_holds_a_job_lease_per_interval(client):
+    claims = await asyncio.gather(*(tasks.claim_lease("sweep", 60) for _ in range(3)))
+
+    assert sorted(claims)[0] == 0
+    assert all(55 < held <= 60 for held in sorted(claims)[1:])
+
+
+async def test_expired_job_lease_can_be_taken_again(client):
+    assert await tasks.claim_lease("sweep", 60) == 0
+    await schedule_leases_collection.update_one(
+        {"_id": "job:sweep"}, {"$set": {"expires_at": datetime.utcnow() - timedelta(seconds=1)}}
+    )
+
+    assert await tasks.claim_lease("sweep", 60) == 0
+
+
+async def test_leased_job_runs_once_across_workers(client):
+    runs = []
+
+    async def job():
+        runs.append(1)
+
+    workers = [asyncio.create_task(tasks.run_periodically(job, 60, lease=True)) for _ in range(3)]
+    await asyncio.sleep(0.1)
+    for worker in workers:
+        worker.cancel()
+    await asyncio.gather(*workers, return_exceptions=True)
+
+    assert len(runs) == 1
@@ -24,6 +24,7 @@ export const AuthProvider = ({ children }) => {
           setUser(response.data)
         } catch (error) {
           localStorage.removeItem('token')
+          localStorage.removeItem('refreshToken')
           setToken(null)
         }
       }
@@ -34,8 +35,9 @@ export const AuthProvider = ({ children }) => {
 
   const login = async (email, password) => {
     const response = await api.post('/api/auth/login/json', { email, password })
-    const { access_token } = response.data
+    const { access_token, refresh_token } = response.data
     localStorage.setItem('token', access_token)
+    localStorage.setItem('refreshToken', refresh_token)
     setToken(access_token)
     
     const userResponse = await api.get('/api/me', {
@@ -55,7 +57,12 @@ export const AuthProvider = ({ children }) => {
   }
 
   const logout = () => {
+    const refreshToken = localStorage.getItem('refreshToken')
+    if (refreshToken) {
+      api.post('/api/auth/logout', { refresh_token: refreshToken }).catch(() => {})
+    }
     localStorage.removeItem('token')
+    localStorage.removeItem('refreshToken')
     setToken(null)
     setUser(null)
   }
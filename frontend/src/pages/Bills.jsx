@@ -18,7 +18,9 @@ const Bills = () => {
     provider_name: '',
     amount: '',
     due_date: '',
-    account_number: ''
+    account_number: '',
+    frequency: '',
+    autopay_account_id: ''
   })
 
   const fetchData = async () => {
@@ -46,18 +48,32 @@ const Bills = () => {
     setSubmitting(true)
 
     try {
-      await api.post('/api/bills', {
-        ...billForm,
-        amount: parseFloat(billForm.amount),
-        due_date: new Date(billForm.due_date).toISOString()
-      })
+      const { frequency, autopay_account_id, due_date, ...bill } = billForm
+      if (frequency) {
+        // The first bill falls due on the chosen date, then repeats
+        await api.post('/api/bills/recurring', {
+          ...bill,
+          amount: parseFloat(bill.amount),
+          frequency,
+          start_date: new Date(due_date).toISOString(),
+          autopay_account_id: autopay_account_id || null
+        })
+      } else {
+        await api.post('/api/bills', {
+          ...bill,
+          amount: parseFloat(bill.amount),
+          due_date: new Date(due_date).toISOString()
+        })
+      }
       setShowCreateModal(false)
       setBillForm({
         bill_type: 'electricity',
         provider_name: '',
         amount: '',
         due_date: '',
-        account_number: ''
+        account_number: '',
+        frequency: '',
+        autopay_account_id: ''
       })
       fetchData()
     } catch (err) {
@@ -194,6 +210,9 @@ const Bills = () => {
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap">
                       {getStatusBadge(bill.status)}
+                      {bill.autopay_error && bill.status !== 'paid' && (
+                        <div className="text-xs text-red-600 mt-1">Autopay failed: {bill.autopay_error}</div>
+                      )}
                     </td>
                     <td className="px-6 py-4 whitespace-nowrap text-right space-x-2">
                       {bill.status !== 'paid' && (
@@ -306,6 +325,41 @@ const Bills = () => {
                 />
               </div>
 
+              <div>
+                <label className="block text-sm font-medium text-gray-700 mb-2">
+                  Repeat
+                </label>
+                <select
+                  value={billForm.frequency}
+                  onChange={(e) => setBillForm({ ...billForm, frequency: e.target.value })}
+                  className="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary-500 focus:border-transparent outline-none"
+                >
+                  <option value="">Does not repeat</option>
+                  <option value="weekly">Weekly</option>
+                  <option value="monthly">Monthly</option>
+                </select>
+              </div>
+
+              {billForm.frequency && (
+                <div>
+                  <label className="block text-sm font-medium text-gray-700 mb-2">
+                    Autopay From
+                  </label>
+                  <select
+                    value={billForm.autopay_account_id}
+                    onChange={(e) => setBillForm({ ...billForm, autopay_account_id: e.target.value })}
+                    className="w-full px-4 py-3 border border-gray-300 rounded-lg focus:ring-2 focus:ring-primary-500 focus:border-transparent outline-none"
+                  >
+                    <option value="">Don't pay automatically</option>
+                    {accounts.map((account) => (
+                      <option key={account.id} value={account.id}>
+                        {account.account_name} - ${account.balance.toFixed(2)}
+                      </option>
+                    ))}
+                  </select>
+                </div>
+              )}
+
               <div className="flex gap-3 pt-2">
                 <button
                   type="button"
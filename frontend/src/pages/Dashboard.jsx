@@ -1,6 +1,7 @@
 import { useState, useEffect } from 'react'
 import { Link } from 'react-router-dom'
 import api from '../services/api'
+import { subscribe } from '../services/stream'
 import { useAuth } from '../context/AuthContext'
 
 const Dashboard = () => {
@@ -12,12 +13,9 @@ const Dashboard = () => {
   useEffect(() => {
     const fetchData = async () => {
       try {
-        const [accountsRes, billsRes] = await Promise.all([
-          api.get('/api/accounts'),
-          api.get('/api/bills')
-        ])
-        setAccounts(accountsRes.data)
-        setBills(billsRes.data.filter(b => b.status !== 'paid').slice(0, 3))
+        const { data } = await api.get('/api/dashboard', { params: { bills: 3 } })
+        setAccounts(data.accounts)
+        setBills(data.upcoming_bills)
       } catch (error) {
         console.error('Error fetching data:', error)
       } finally {
@@ -25,9 +23,19 @@ const Dashboard = () => {
       }
     }
     fetchData()
+
+    // Live balances; refetch if the stream says we missed events
+    return subscribe({
+      balance: ({ account_id, balance }) =>
+        setAccounts((prev) => prev.map((a) => (a.id === account_id ? { ...a, balance } : a))),
+      account: (account) => setAccounts((prev) => [...prev, account]),
+      account_deleted: ({ id }) => setAccounts((prev) => prev.filter((a) => a.id !== id)),
+      resync: fetchData,
+    })
   }, [])
 
-  const totalBalance = accounts.reduce((sum, acc) => sum + acc.balance, 0)
+  const totalBalance = accounts.reduce((sum, account) => sum + account.balance, 0)
+
   const pendingBills = bills.reduce((sum, bill) => sum + bill.amount, 0)
 
   if (loading) {
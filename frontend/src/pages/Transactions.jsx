@@ -1,12 +1,16 @@
 import { useState, useEffect } from 'react'
 import { useParams, Link } from 'react-router-dom'
 import api from '../services/api'
+import { subscribe } from '../services/stream'
 
 const Transactions = () => {
   const { accountId } = useParams()
   const [account, setAccount] = useState(null)
   const [transactions, setTransactions] = useState([])
+  // Older pages are fetched by passing X-Next-Cursor back as `after`
+  const [nextCursor, setNextCursor] = useState(null)
   const [loading, setLoading] = useState(true)
+  const [loadingMore, setLoadingMore] = useState(false)
 
   useEffect(() => {
     const fetchData = async () => {
@@ -17,6 +21,7 @@ const Transactions = () => {
         ])
         setAccount(accountRes.data)
         setTransactions(transactionsRes.data)
+        setNextCursor(transactionsRes.headers['x-next-cursor'] || null)
       } catch (error) {
         console.error('Error fetching data:', error)
       } finally {
@@ -24,8 +29,40 @@ const Transactions = () => {
       }
     }
     fetchData()
+
+    // New activity on this account shows up without a reload
+    return subscribe({
+      transaction: (transaction) => {
+        if (transaction.account_id === accountId) {
+          setTransactions((prev) => [transaction, ...prev])
+        }
+      },
+      balance: ({ account_id, balance }) => {
+        if (account_id === accountId) {
+          setAccount((prev) => (prev ? { ...prev, balance } : prev))
+        }
+      },
+      resync: fetchData,
+    })
   }, [accountId])
 
+  const loadOlder = async () => {
+    setLoadingMore(true)
+    try {
+      const response = await api.get(`/api/transactions/${accountId}`, {
+        params: { after: nextCursor },
+      })
+      setTransactions((prev) => [...prev, ...response.data])
+      setNextCursor(response.headers['x-next-cursor'] || null)
+    } catch (error) {
+      console.error('Error fetching older transactions:', error)
+    } finally {
+      setLoadingMore(false)
+    }
+  }
+
+  const isCredit = (type) => type === 'deposit' || type === 'interest'
+
   const getTransactionIcon = (type) => {
     switch (type) {
       case 'deposit':
@@ -36,6 +73,10 @@ const Transactions = () => {
         return '↔'
       case 'bill_payment':
         return '📄'
+      case 'interest':
+        return '%'
+      case 'fee':
+        return '−'
       default:
         return '•'
     }
@@ -44,9 +85,11 @@ const Transactions = () => {
   const getTransactionColor = (type) => {
     switch (type) {
       case 'deposit':
+      case 'interest':
         return 'text-green-600'
       case 'withdrawal':
       case 'bill_payment':
+      case 'fee':
         return 'text-red-600'
       case 'transfer':
         return 'text-blue-600'
@@ -138,11 +181,11 @@ const Transactions = () => {
                   </div>
                   <div className="text-right">
                     <p className={`font-semibold ${
-                      transaction.transaction_type === 'deposit' 
+                      isCredit(transaction.transaction_type)
                         ? 'text-green-600' 
                         : 'text-red-600'
                     }`}>
-                      {transaction.transaction_type === 'deposit' ? '+' : '-'}
+                      {isCredit(transaction.transaction_type) ? '+' : '-'}
                       ${transaction.amount.toLocaleString('en-US', { minimumFractionDigits: 2 })}
                     </p>
                     <p className="text-sm text-gray-500">
@@ -152,6 +195,17 @@ const Transactions = () => {
                 </div>
               </div>
             ))}
+            {nextCursor && (
+              <div className="p-4 text-center">
+                <button
+                  onClick={loadOlder}
+                  disabled={loadingMore}
+                  className="text-primary-600 hover:underline disabled:opacity-50"
+                >
+                  {loadingMore ? 'Loading...' : 'Load older transactions'}
+                </button>
+              </div>
+            )}
           </div>
         )}
       </div>
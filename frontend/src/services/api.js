@@ -18,12 +18,63 @@ api.interceptors.request.use((config) => {
   return config
 })
 
-// Handle auth errors
+// One refresh at a time, shared by every request that hit a 401 meanwhile
+let refreshing = null
+
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms))
+
+// Another tab may have rotated the refresh token first; the server answers
+// 409 then, and that tab stores the new tokens once its own refresh returns
+const tokenFromOtherTab = async (usedRefreshToken, error) => {
+  const attempts = error.response?.status === 409 ? 10 : 1
+  for (let i = 0; i < attempts; i++) {
+    const refreshToken = localStorage.getItem('refreshToken')
+    if (refreshToken && refreshToken !== usedRefreshToken) {
+      return localStorage.getItem('token')
+    }
+    if (i < attempts - 1) await sleep(200)
+  }
+  throw error
+}
+
+const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refreshToken')
+    refreshing = (refreshToken
+      ? axios.post(`${API_URL}/api/auth/refresh`, { refresh_token: refreshToken })
+      : Promise.reject(new Error('No refresh token'))
+    )
+      .then((response) => {
+        localStorage.setItem('token', response.data.access_token)
+        localStorage.setItem('refreshToken', response.data.refresh_token)
+        return response.data.access_token
+      })
+      .catch((error) => tokenFromOtherTab(refreshToken, error))
+      .finally(() => {
+        refreshing = null
+      })
+  }
+  return refreshing
+}
+
+// Handle auth errors: refresh the access token once, then give up
 api.interceptors.response.use(
   (response) => response,
-  (error) => {
-    if (error.response?.status === 401) {
+  async (error) => {
+    const original = error.config
+    if (error.response?.status === 401 && original && !original._retried && !original.url?.startsWith('/api/auth/')) {
+      original._retried = true
+      try {
+        const token = await refreshAccessToken()
+        original.headers.Authorization = `Bearer ${token}`
+        return api(original)
+      } catch (refreshError) {
+        // Fall through to signing out
+      }
+    }
+    if (error.response?.status === 401 && !original?.url?.startsWith('/api/auth/')) {
       localStorage.removeItem('token')
+      localStorage.removeItem('refreshToken')
       window.location.href = '/login'
     }
     return Promise.reject(error)
@@ -0,0 +1,68 @@
+import api from './api'
+
+const API_URL = import.meta.env.VITE_API_URL || ''
+const RECONNECT_MS = 5000
+
+// Subscribe to /api/stream; handlers maps event names (balance, transaction,
+// account, account_deleted, resync) to callbacks. Returns an unsubscribe function.
+//
+// The stream is opened with a single-use ticket, so the browser's own
+// reconnect can't reuse the URL: on any error the source is closed and
+// reopened with a new ticket, which refreshes the access token if needed.
+// Events missed in between are covered by calling the resync handler.
+export const subscribe = (handlers) => {
+  if (typeof EventSource === 'undefined') {
+    return () => {}
+  }
+
+  let source = null
+  let timer = null
+  let closed = false
+  let opened = false
+
+  const reconnect = () => {
+    if (!closed) {
+      timer = setTimeout(open, RECONNECT_MS)
+    }
+  }
+
+  const open = async () => {
+    if (!localStorage.getItem('token')) {
+      return
+    }
+    let ticket
+    try {
+      ticket = (await api.post('/api/stream/ticket')).data.ticket
+    } catch (error) {
+      reconnect()
+      return
+    }
+    if (closed) {
+      return
+    }
+
+    source = new EventSource(`${API_URL}/api/stream?ticket=${encodeURIComponent(ticket)}`)
+    Object.entries(handlers).forEach(([name, handler]) => {
+      source.addEventListener(name, (event) => handler(JSON.parse(event.data)))
+    })
+    source.onopen = () => {
+      if (opened && handlers.resync) {
+        handlers.resync({})
+      }
+      opened = true
+    }
+    source.onerror = () => {
+      source.close()
+      reconnect()
+    }
+  }
+
+  open()
+  return () => {
+    closed = true
+    clearTimeout(timer)
+    if (source) {
+      source.close()
+    }
+  }
+}